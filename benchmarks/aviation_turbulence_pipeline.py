@@ -0,0 +1,313 @@
+"""
+Aviation Turbulence Pipeline Benchmark
+
+Times the stages of the aviation turbulence pipeline on synthetic PIREPs and
+MERRA-2 files at several scales, without network access or the MERRA-2
+archive:
+
+- download: ``get_pirep_data`` from a local server holding the synthetic archive
+- preprocess: ``preprocess_turb_eda``
+- grid: ``grid_pireps`` of the three flight-level files
+- training: ``create_training_data``
+
+Each stage runs in a fresh process, and its wall time, rows per second, peak
+resident memory and bytes read (Linux only) are reported. Results can be saved
+as JSON and compared against a previous run to catch performance regressions.
+
+Usage
+-----
+python benchmarks/aviation_turbulence_pipeline.py --reports 10000 1000000 --days 30 \\
+    --output results.json
+python benchmarks/aviation_turbulence_pipeline.py --reports 10000 1000000 --days 30 \\
+    --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import netCDF4 as nc
+import pandas as pd
+
+import wxcbench.aviation_turbulence as wab
+from wxcbench.aviation_turbulence.config import FLIGHT_LEVELS
+
+
+STAGES = ["download", "preprocess", "grid", "training"]
+START_DATE = "2022-01-01"
+
+
+def _read_io() -> dict:
+    """Bytes read by this process so far, from /proc/self/io (Linux only)."""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+    except OSError:
+        return {}
+    return {'rchar': int(counters['rchar']), 'read_bytes': int(counters['read_bytes'])}
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    # VmHWM is reset by exec, unlike ru_maxrss which keeps the parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _stage(name: str, scale_dir: Path, merra2_dir: Path, args: dict):
+    """Run one pipeline stage and return its number of input rows, if known."""
+    year = pd.Timestamp(START_DATE).year
+    if name == 'download':
+        # Only the months the reports span, without the politeness delay the
+        # local server does not need
+        first = pd.Timestamp(START_DATE)
+        last = first + pd.Timedelta(days=args['n_days'] - 1)
+        df = wab.get_pirep_data(
+            start_year=first.year,
+            end_year=last.year,
+            output_dir=str(scale_dir / 'pirep_downloads'),
+            base_url=args['base_url'],
+            overwrite=True,
+            start_month=first.month,
+            end_month=last.month,
+            min_interval=0
+        )
+        return len(df)
+    if name == 'preprocess':
+        wab.preprocess_turb_eda(str(scale_dir / 'all_pireps.csv'), output_dir=str(scale_dir))
+        return None
+    if name == 'grid':
+        wab.grid_pireps(
+            [str(scale_dir / 'updated_CSVs' / f'{level}_fl.csv') for level in FLIGHT_LEVELS],
+            output_dir=str(scale_dir / 'gridded_data'),
+            years=[year],
+            n_workers=args['workers'],
+            layout=args['layout']
+        )
+        return None
+    if name == 'training':
+        wab.create_training_data(
+            turbulence_dir=str(scale_dir / 'gridded_data'),
+            merra2_dir=str(merra2_dir),
+            years=[year],
+            output_dir=str(scale_dir / 'training_data'),
+            n_workers=args['workers']
+        )
+        return None
+    raise ValueError(f"Unknown stage {name!r}")
+
+
+def _measure(name, scale_dir, merra2_dir, args, results):
+    """Run a stage in this (fresh) process and report its resource use."""
+    io_before = _read_io()
+    start = time.perf_counter()
+    rows = _stage(name, scale_dir, merra2_dir, args)
+    seconds = time.perf_counter() - start
+    io_after = _read_io()
+    results.put({
+        'seconds': seconds,
+        'rows': rows,
+        'peak_rss': _peak_rss(),
+        'bytes_read': {key: io_after[key] - io_before[key] for key in io_after},
+    })
+
+
+def _serve_archive(months_dir: Path) -> ThreadingHTTPServer:
+    """Serve monthly synthetic PIREP files like the PIREP archive service."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            month = f"{int(query['year1'][0]):04d}{int(query['month1'][0]):02d}"
+            fname = months_dir / f'{month}.csv'
+            body = fname.read_bytes() if fname.exists() else (months_dir / 'header.csv').read_bytes()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _split_months(archive: Path, months_dir: Path) -> None:
+    """Split a synthetic archive into the monthly files served for download."""
+    months_dir.mkdir(parents=True, exist_ok=True)
+    header = archive.open().readline()
+    (months_dir / 'header.csv').write_text(header)
+    written = set()
+    for chunk in pd.read_csv(archive, dtype=str, chunksize=1_000_000, keep_default_na=False):
+        for month, df in chunk.groupby(chunk['VALID'].str[:6]):
+            fname = months_dir / f'{month}.csv'
+            df.to_csv(fname, mode='a' if month in written else 'w', header=month not in written, index=False)
+            written.add(month)
+
+
+def _count_samples(training_dir: Path) -> int:
+    """Number of samples in the training files of a run."""
+    total = 0
+    for level in FLIGHT_LEVELS:
+        with nc.Dataset(str(training_dir / f'training_data_{level}_fl.nc')) as f:
+            total += len(f.dimensions['samples'])
+    return total
+
+
+def _count_rows(fnames) -> int:
+    """Number of data rows in CSV files."""
+    return sum(sum(1 for _ in open(fname)) - 1 for fname in fnames)
+
+
+def run_scale(n_reports: int, n_days: int, workdir: Path, stages: list, args: dict) -> list:
+    """Generate the inputs of one scale and time the requested stages."""
+    scale_dir = workdir / f'reports{n_reports}_days{n_days}'
+    scale_dir.mkdir(parents=True, exist_ok=True)
+    archive = scale_dir / 'all_pireps.csv'
+    if not archive.exists():
+        wab.make_synthetic_pireps(str(archive), n_reports, start_date=START_DATE, n_days=n_days)
+    
+    # MERRA-2 files depend only on the number of days, so scales share them
+    merra2_dir = workdir / f'merra2_days{n_days}'
+    if 'training' in stages and len(wab.index_merra2_files(str(merra2_dir))) < n_days:
+        wab.make_synthetic_merra2(
+            str(merra2_dir), start_date=START_DATE, n_days=n_days, unique_days=args['unique_days']
+        )
+    
+    server = None
+    if 'download' in stages:
+        _split_months(archive, scale_dir / 'archive_months')
+        server = _serve_archive(scale_dir / 'archive_months')
+        args = {
+            **args,
+            'base_url': f'http://127.0.0.1:{server.server_address[1]}/pireps.py',
+            'n_days': n_days,
+        }
+    
+    # Input rows of each stage
+    rows = {'download': n_reports, 'preprocess': n_reports}
+    
+    context = multiprocessing.get_context('spawn')
+    records = []
+    try:
+        for name in stages:
+            if name == 'grid':
+                rows['grid'] = _count_rows(
+                    scale_dir / 'updated_CSVs' / f'{level}_fl.csv' for level in FLIGHT_LEVELS
+                )
+            results = context.Queue()
+            process = context.Process(
+                target=_measure, args=(name, scale_dir, merra2_dir, args, results)
+            )
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"Stage {name} failed with exit code {process.exitcode}")
+            record = results.get()
+            if name == 'training':
+                record['rows'] = _count_samples(scale_dir / 'training_data')
+            elif record['rows'] is None:
+                record['rows'] = rows[name]
+            record.update({
+                'stage': name,
+                'reports': n_reports,
+                'days': n_days,
+                'rows_per_s': record['rows'] / record['seconds'],
+            })
+            records.append(record)
+    finally:
+        if server is not None:
+            server.shutdown()
+    return records
+
+
+def compare(records: list, baseline: list, tolerance: float) -> list:
+    """List the stages that are slower or use more memory than the baseline."""
+    previous = {(r['stage'], r['reports'], r['days']): r for r in baseline}
+    regressions = []
+    for record in records:
+        old = previous.get((record['stage'], record['reports'], record['days']))
+        if old is None:
+            continue
+        if record['rows_per_s'] < old['rows_per_s'] * (1 - tolerance):
+            regressions.append(
+                f"{record['stage']} ({record['reports']} reports, {record['days']} days): "
+                f"{record['rows_per_s']:,.0f} rows/s, baseline {old['rows_per_s']:,.0f}"
+            )
+        if record['peak_rss'] > old['peak_rss'] * (1 + tolerance):
+            regressions.append(
+                f"{record['stage']} ({record['reports']} reports, {record['days']} days): "
+                f"peak RSS {record['peak_rss'] / 2**20:,.0f} MiB, "
+                f"baseline {old['peak_rss'] / 2**20:,.0f} MiB"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--reports', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000],
+                        help='Numbers of synthetic reports to benchmark')
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365],
+                        help='Numbers of days covered by the reports')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='Stages to time, in pipeline order')
+    parser.add_argument('--workdir', default='./benchmark_data',
+                        help='Directory for the synthetic inputs and stage outputs')
+    parser.add_argument('--unique-days', type=int, default=4,
+                        help='Distinct synthetic MERRA-2 days; the other days link to them')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='n_workers passed to grid_pireps and create_training_data')
+    parser.add_argument('--layout', default='standard', help='Gridded file layout')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed fractional slowdown or memory growth against the baseline')
+    options = parser.parse_args(argv)
+    
+    stages = [name for name in STAGES if name in options.stages]
+    args = {'workers': options.workers, 'layout': options.layout, 'unique_days': options.unique_days}
+    workdir = Path(options.workdir)
+    
+    records = []
+    for n_days in options.days:
+        for n_reports in options.reports:
+            records += run_scale(n_reports, n_days, workdir, stages, args)
+    
+    print()
+    print(f"{'stage':<11}{'reports':>11}{'days':>6}{'seconds':>10}{'rows/s':>13}"
+          f"{'peak RSS MiB':>14}{'MiB read':>10}")
+    for r in records:
+        read = r['bytes_read'].get('rchar')
+        print(f"{r['stage']:<11}{r['reports']:>11}{r['days']:>6}{r['seconds']:>10.2f}"
+              f"{r['rows_per_s']:>13,.0f}{r['peak_rss'] / 2**20:>14,.0f}"
+              f"{'n/a' if read is None else format(read / 2**20, ',.0f'):>10}")
+    
+    if options.output:
+        Path(options.output).write_text(json.dumps(records, indent=1))
+    
+    if options.baseline:
+        regressions = compare(records, json.loads(Path(options.baseline).read_text()), options.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Tests for merging monthly PIREP files into the consolidated archive."""
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from wxcbench.aviation_turbulence import pirep_downloads
+from wxcbench.aviation_turbulence.pirep_downloads import _update_combined
+
+
+def _month_file(directory: Path, month: int, rows: int) -> str:
+    """Write a monthly file named like the downloaded ones."""
+    fname = directory / f"year1=2022&month1={month}&day1=1&fmt=csv.csv"
+    lines = [f"2022{month:02d}01{i // 60:02d}{i % 60:02d},UA /OV ABQ /FL{300 + i % 50}\n" for i in range(rows)]
+    fname.write_text("VALID,REPORT\n" + "".join(lines))
+    return str(fname)
+
+
+def _read_archive(combined: Path) -> pd.DataFrame:
+    assert b"\0" not in combined.read_bytes()
+    return pd.read_csv(combined, dtype=str)
+
+
+def test_back_fill_keeps_month_order(tmp_path):
+    combined, record = tmp_path / "all.csv", tmp_path / "record.json"
+    files = [_month_file(tmp_path, m, 50) for m in (3, 4)]
+    _update_combined(combined, files, record)
+    files += [_month_file(tmp_path, m, 50) for m in (1, 2, 5)]
+    _update_combined(combined, files, record)
+    
+    df = _read_archive(combined)
+    assert len(df) == 250
+    assert df['VALID'].is_monotonic_increasing
+
+
+def test_truncated_archive_is_rebuilt(tmp_path):
+    combined, record = tmp_path / "all.csv", tmp_path / "record.json"
+    files = [_month_file(tmp_path, m, 200) for m in (1, 2)]
+    _update_combined(combined, files, record)
+    
+    with open(combined, "r+b") as f:
+        f.truncate(1000)
+    _update_combined(combined, files, record)
+    
+    df = _read_archive(combined)
+    assert len(df) == 400
+    assert not df.duplicated().any()
+
+
+@pytest.mark.parametrize("failing_copy", [1, 2, 3, 4, 5])
+def test_interrupted_back_fill_is_redone(tmp_path, monkeypatch, failing_copy):
+    combined, record = tmp_path / "all.csv", tmp_path / "record.json"
+    files = [_month_file(tmp_path, m, 200) for m in (2, 3, 4)]
+    _update_combined(combined, files, record)
+    files.append(_month_file(tmp_path, 1, 300))
+    
+    copy_bytes = pirep_downloads._copy_bytes
+    calls = []
+    
+    def interrupted(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == failing_copy:
+            raise KeyboardInterrupt
+        return copy_bytes(*args, **kwargs)
+    
+    monkeypatch.setattr(pirep_downloads, "_copy_bytes", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        _update_combined(combined, files, record)
+    monkeypatch.setattr(pirep_downloads, "_copy_bytes", copy_bytes)
+    _update_combined(combined, files, record)
+    
+    df = _read_archive(combined)
+    assert len(df) == 900
+    assert not df.duplicated().any()
+    assert df['VALID'].is_monotonic_increasing
+    assert not list(tmp_path.glob(".*.tmp"))
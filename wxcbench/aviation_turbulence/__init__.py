@@ -6,18 +6,58 @@ and preparing turbulence data for machine learning applications.
 """
 
 from wxcbench.aviation_turbulence.pirep_downloads import get_pirep_data
-from wxcbench.aviation_turbulence.grid_pireps import grid_pireps
-from wxcbench.aviation_turbulence.make_training_data import create_training_data
+from wxcbench.aviation_turbulence.pirep_store import read_pireps, write_pirep_store
+from wxcbench.aviation_turbulence.pirep_dedup import deduplicate_pireps
+from wxcbench.aviation_turbulence.pirep_index import build_pirep_index, query_pireps
+from wxcbench.aviation_turbulence.grid_pireps import (
+    grid_pireps,
+    read_gridded_day,
+    read_gridded_cells,
+    read_gridded_voxels
+)
+from wxcbench.aviation_turbulence.grid_voxels import grid_pireps_3d
+from wxcbench.aviation_turbulence.make_training_data import (
+    create_training_data,
+    index_merra2_files
+)
+from wxcbench.aviation_turbulence.turbulence_diagnostics import compute_turbulence_diagnostics
+from wxcbench.aviation_turbulence.sample_store import (
+    export_sample_store,
+    open_sample_store,
+    iterate_batches
+)
+from wxcbench.aviation_turbulence.synthetic_data import (
+    make_synthetic_pireps,
+    make_synthetic_merra2
+)
 from wxcbench.aviation_turbulence.turb_eda_preprocessing import preprocess_turb_eda
 from wxcbench.aviation_turbulence.modg_preprocess import preprocess_modg
+from wxcbench.aviation_turbulence.pirep_preprocessing import preprocess_pireps
 from wxcbench.aviation_turbulence.convert2risk_map import convert_to_risk_map
 
 __all__ = [
     "get_pirep_data",
+    "read_pireps",
+    "write_pirep_store",
+    "deduplicate_pireps",
+    "build_pirep_index",
+    "query_pireps",
     "grid_pireps",
+    "read_gridded_day",
+    "read_gridded_cells",
+    "read_gridded_voxels",
+    "grid_pireps_3d",
     "create_training_data",
+    "index_merra2_files",
+    "compute_turbulence_diagnostics",
+    "export_sample_store",
+    "open_sample_store",
+    "iterate_batches",
+    "make_synthetic_pireps",
+    "make_synthetic_merra2",
     "preprocess_turb_eda",
     "preprocess_modg",
+    "preprocess_pireps",
     "convert_to_risk_map",
 ]
 
@@ -12,6 +12,22 @@ MERRA2_GRID = {
     "y_start": -90,
 }
 
+# Gridded turbulence file layouts: "standard" (uncompressed, 2-D coordinates),
+# "compact" (1-D coordinates, compressed daily chunks), "packed" (compact
+# with four 2-bit cells per byte) and "sparse" (observed cells only, as
+# date, y, x, label and report count)
+GRIDDED_LAYOUTS = ["standard", "compact", "packed", "sparse"]
+GRIDDED_COMPLEVEL = 4  # zlib compression level of the compact layouts
+GRIDDED_WRITE_SLAB = 64  # Time bins classified and written at a time by the dense layouts
+
+# Sub-daily time binning
+TIME_BIN_HOURS = [1, 3, 6]  # Supported time bin widths in hours
+MERRA2_TIME_STEP = 3  # Hours between MERRA-2 inst3 analysis times
+
+# Voxel gridding onto MERRA-2 model levels
+VOXEL_VERTICAL_COORDINATES = ["PL", "H"]  # MERRA-2 field used to find each report's model level
+FEET_TO_METERS = 0.3048
+
 # Turbulence classification thresholds
 TURBULENCE_THRESHOLD = 0.25  # Fraction of reports that must be MOG before cell is classified as turbulence
 NO_DATA_VALUE = 2  # No data value
@@ -19,11 +35,76 @@ NO_DATA_VALUE = 2  # No data value
 # Flight level categories
 FLIGHT_LEVELS = ["low", "med", "high"]
 
+# Flight level band edges in hundreds of feet: low < FL100 <= med < FL250 <= high
+FLIGHT_LEVEL_BOUNDS = [100, 250]
+
+# Turbulence intensity scale parsed from PIREP text, highest first. A report
+# naming a range (e.g. LGT-MOD) takes the highest intensity it mentions.
+TURBULENCE_INTENSITY_PATTERNS = [
+    (4, r"\bEXTRM|\bEXTREME"),
+    (3, r"\bSEV"),
+    (2, r"\bMOD"),
+    (1, r"\bLGT|\bLIGHT"),
+    (0, r"\bNEG|\bSMTH|\bSMOOTH|\bNIL"),
+]
+MOG_INTENSITY = 2  # Lowest intensity counted as moderate or greater (MOG)
+
+# Meteorological seasons used to split risk maps, by month
+SEASONS = {
+    "DJF": [12, 1, 2],
+    "MAM": [3, 4, 5],
+    "JJA": [6, 7, 8],
+    "SON": [9, 10, 11],
+}
+
 # PIREP download settings
 PIREP_DOWNLOAD_BASE_URL = "https://mesonet.agron.iastate.edu/cgi-bin/request/gis/pireps.py"
+PIREP_DOWNLOAD_MAX_WORKERS = 4  # Concurrent monthly downloads
+PIREP_DOWNLOAD_RETRIES = 5  # Retries per month on connection errors and 429/5xx responses
+PIREP_DOWNLOAD_BACKOFF = 2.0  # Exponential backoff factor between retries (seconds)
+PIREP_DOWNLOAD_MIN_INTERVAL = 1.0  # Minimum delay between request starts (seconds)
+PIREP_DOWNLOAD_TIMEOUT = 300  # Per-request timeout (seconds)
+PIREP_MANIFEST_FILE = "manifest.json"  # Record of completed monthly downloads
+PIREP_COMBINED_FILE = "all_pireps.csv"  # Consolidated archive of all monthly files
+PIREP_COMBINED_MANIFEST_FILE = "all_pireps_manifest.json"  # Months merged into the consolidated archive
+PIREP_COPY_BLOCK_SIZE = 1 << 20  # Bytes copied at a time while merging the consolidated archive
+PIREP_VALID_FORMAT = "%Y%m%d%H%M"  # Format of the PIREP 'VALID' timestamp
+
+# De-duplication of repeated reports of the same encounter
+DEDUP_TIME_WINDOW = 15  # Minutes within which a matching later report is a duplicate
+DEDUP_RADIUS_KM = 20.0  # Distance within which a matching later report is a duplicate
+DEDUP_FL_WINDOW = 10  # Flight level difference (hundreds of feet) within which reports match
+DEDUP_BLOCK_SIZE = 250_000  # Reports compared at a time, bounding memory use
+EARTH_RADIUS_KM = 6371.0
+
+# Spatio-temporal query index over the PIREP archive
+PIREP_INDEX_METADATA = "index.json"  # Layout record of a built PIREP index
+PIREP_INDEX_CHUNKSIZE = 1_000_000  # Reports read at a time while building the index
+
+# Training data settings
+MERRA2_LEVELS = 34  # Vertical levels in the MERRA-2 profiles
+MERRA2_TREES = ["U_V_T_RH_OMEGA", "H_PL_PHIS"]  # MERRA-2 subdirectories read for each sample
+# MERRA-2 file name, capturing the stream version (e.g. 400, 401) and the date
+MERRA2_FILE_PATTERN = r"^MERRA2_(\d{3})\.inst3_3d_asm_Nv\.(\d{8})\..*nc4?$"
+TRAINING_CHUNK_SAMPLES = 4096  # Samples per chunk of the training data variables
+TRAINING_COMPLEVEL = 4  # zlib compression level of the training data variables
+SAMPLE_STORE_METADATA = "store.json"  # Layout record of an exported sample store
+SAMPLE_STORE_PREFETCH = 4  # Batches gathered ahead of the consumer by the batch loader
+
+# Derived turbulence diagnostics
+GRAVITATIONAL_ACCELERATION = 9.80665  # m/s^2
+GAS_CONSTANT = 287.04  # Dry air gas constant (J/(kg*K))
+SPECIFIC_HEAT = 1004.64  # Dry air specific heat at constant pressure (J/(kg*K))
+REFERENCE_PRESSURE = 100000.0  # Reference pressure of potential temperature (Pa)
+MIN_SHEAR_SQUARED = 1e-8  # Floor on the squared vertical shear in the Richardson number (s^-2)
+
+# Synthetic PIREP and MERRA-2 data for benchmarks
+SYNTHETIC_PIREP_REGION = (24.0, 50.0, -125.0, -66.0)  # South, north, west, east of the report region (degrees)
+SYNTHETIC_MERRA2_TIMES = 8  # Analysis times per synthetic MERRA-2 file (inst3: every 3 hours)
 
 # Default paths
 DEFAULT_PIREP_OUTPUT_DIR = "./pirep_downloads"
+DEFAULT_PIREP_INDEX_DIR = "./pirep_index"
 DEFAULT_GRIDDED_DATA_DIR = "./gridded_data"
 DEFAULT_TRAINING_DATA_DIR = "./training_data"
 
@@ -1,65 +1,282 @@
 """
 Convert to Risk Map Module
 
-Visualizes PIREP spatial distribution by converting to risk maps.
+Bins PIREPs onto a regular grid and converts them to turbulence risk maps:
+the fraction of reports in each grid cell that are moderate or greater.
 """
 
+import numpy as np
 import pandas as pd
+import netCDF4 as nc
 from pathlib import Path
 from typing import Optional
 import matplotlib.pyplot as plt
 
+from wxcbench.aviation_turbulence.config import (
+    MERRA2_GRID,
+    MOG_INTENSITY,
+    FLIGHT_LEVELS,
+    SEASONS
+)
+from wxcbench.aviation_turbulence.pirep_store import parse_valid_times
+from wxcbench.aviation_turbulence.grid_pireps import assign_grid_cells, merra2_axes
+from wxcbench.aviation_turbulence.pirep_parsing import flight_level_band
+from wxcbench.aviation_turbulence.turb_eda_preprocessing import read_parsed_reports
+
+
+def _bin_reports(
+    df: pd.DataFrame,
+    grid: dict,
+    by_level: bool,
+    by_season: bool
+) -> tuple:
+    """
+    Count all and MOG reports per (flight level, season, grid cell).
+    
+    Returns
+    -------
+    tuple
+        (count, mog) integer arrays of shape (levels, seasons, ny * nx)
+    """
+    n_levels = len(FLIGHT_LEVELS) if by_level else 1
+    n_seasons = len(SEASONS) if by_season else 1
+    n_cells = grid["ny"] * grid["nx"]
+    
+    lat = pd.to_numeric(df['LAT'], errors='coerce').to_numpy(dtype=np.float64)
+    lon = pd.to_numeric(df['LON'], errors='coerce').to_numpy(dtype=np.float64)
+    intensity = pd.to_numeric(df['Intensity'], errors='coerce').to_numpy(
+        dtype=np.float64, na_value=np.nan
+    )
+    
+    # Wrap longitudes onto a global grid, then drop reports outside the grid
+    west = grid["x_start"] - grid["dx"] / 2
+    south = grid["y_start"] - grid["dy"] / 2
+    if grid["nx"] * grid["dx"] >= 360:
+        lon = (lon - west) % 360 + west
+    keep = (
+        (lon >= west) & (lon < west + grid["nx"] * grid["dx"])
+        & (lat >= south) & (lat < south + grid["ny"] * grid["dy"])
+        & np.isfinite(intensity)
+    )
+    
+    group = np.zeros(len(df), dtype=np.int64)
+    if by_level:
+        band = df['FLIGHT_LEVEL'] if 'FLIGHT_LEVEL' in df.columns else flight_level_band(df['FL'])
+        level = pd.Categorical(band.astype(str), categories=FLIGHT_LEVELS).codes
+        keep &= level >= 0
+        group += level * n_seasons
+    if by_season:
+        month = parse_valid_times(df['VALID']).dt.month.to_numpy(dtype=np.float64, na_value=np.nan)
+        season = np.full(len(df), -1, dtype=np.int64)
+        for i, months in enumerate(SEASONS.values()):
+            season[np.isin(month, months)] = i
+        keep &= season >= 0
+        group += season
+    
+    yind, xind = assign_grid_cells(lat[keep], lon[keep], grid)
+    index = group[keep] * n_cells + yind * grid["nx"] + xind
+    size = n_levels * n_seasons * n_cells
+    
+    count = np.bincount(index, minlength=size)
+    mog = np.bincount(index, weights=intensity[keep] >= MOG_INTENSITY, minlength=size)
+    shape = (n_levels, n_seasons, n_cells)
+    return count.reshape(shape), mog.astype(np.int64).reshape(shape)
+
+
+def _write_risk_map(
+    fname: str,
+    grid: dict,
+    levels: list,
+    seasons: list,
+    count: np.ndarray,
+    mog: np.ndarray,
+    risk: np.ndarray
+) -> None:
+    """Write the risk map and its report counts to a NetCDF file."""
+    x, y = merra2_axes(grid)
+    
+    out = nc.Dataset(fname, 'w')
+    out.description = (
+        'PIREP turbulence risk map: fraction of reports in each grid cell '
+        'that are moderate or greater (MOG).'
+    )
+    
+    out.createDimension('level', len(levels))
+    out.createDimension('season', len(seasons))
+    out.createDimension('Y', grid["ny"])
+    out.createDimension('X', grid["nx"])
+    
+    lon_var = out.createVariable('Lons', 'f8', ('X',))
+    lon_var.units = 'degrees_east'
+    lon_var[:] = x
+    lat_var = out.createVariable('Lats', 'f8', ('Y',))
+    lat_var.units = 'degrees_north'
+    lat_var[:] = y
+    
+    level_var = out.createVariable('level', str, ('level',))
+    level_var[:] = np.array(levels, dtype=object)
+    season_var = out.createVariable('season', str, ('season',))
+    season_var[:] = np.array(seasons, dtype=object)
+    
+    dims = ('level', 'season', 'Y', 'X')
+    count_var = out.createVariable('Count', 'u4', dims, zlib=True)
+    count_var.long_name = 'Number of PIREPs'
+    count_var[:] = count
+    mog_var = out.createVariable('MOG', 'u4', dims, zlib=True)
+    mog_var.long_name = 'Number of moderate or greater PIREPs'
+    mog_var[:] = mog
+    risk_var = out.createVariable('Risk', 'f4', dims, zlib=True, fill_value=np.nan)
+    risk_var.long_name = 'Fraction of PIREPs that are moderate or greater'
+    risk_var.units = '1'
+    risk_var[:] = risk
+    
+    out.close()
+
+
+def _plot_risk_map(
+    fname: str,
+    grid: dict,
+    levels: list,
+    seasons: list,
+    risk: np.ndarray,
+    **kwargs
+) -> None:
+    """Render each (level, season) risk map as a raster panel."""
+    extent = [
+        grid["x_start"] - grid["dx"] / 2,
+        grid["x_start"] + grid["dx"] * (grid["nx"] - 0.5),
+        grid["y_start"] - grid["dy"] / 2,
+        grid["y_start"] + grid["dy"] * (grid["ny"] - 0.5),
+    ]
+    kwargs = {'cmap': 'inferno_r', 'vmin': 0, 'vmax': 1, **kwargs}
+    
+    fig, axes = plt.subplots(
+        len(levels), len(seasons),
+        figsize=(10 * len(seasons), 6 * len(levels)),
+        squeeze=False
+    )
+    for i, level in enumerate(levels):
+        for j, season in enumerate(seasons):
+            ax = axes[i, j]
+            image = ax.imshow(
+                np.ma.masked_invalid(risk[i, j]),
+                origin='lower', extent=extent, interpolation='nearest', **kwargs
+            )
+            ax.set_xlabel('Longitude')
+            ax.set_ylabel('Latitude')
+            ax.set_title(f'PIREP MOG Turbulence Risk ({level}, {season})')
+    fig.colorbar(image, ax=axes, label='MOG fraction of reports', shrink=0.8)
+    
+    plt.savefig(fname, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
 
 def convert_to_risk_map(
     input_file: str,
     output_file: Optional[str] = None,
+    netcdf_file: Optional[str] = None,
+    grid: Optional[dict] = None,
+    by_level: bool = False,
+    by_season: bool = False,
+    min_reports: int = 1,
+    chunksize: Optional[int] = None,
     **kwargs
-) -> None:
+) -> np.ndarray:
     """
-    Convert PIREP data to a risk map visualization.
+    Convert PIREP data to a turbulence risk map.
     
-    This function visualizes the spatial distribution of PIREPs by creating
-    a risk map showing turbulence occurrence patterns.
+    Reports are binned onto a regular grid (the MERRA-2 grid by default) with
+    a vectorized histogram, and the risk of each grid cell is the fraction of
+    its reports that are moderate or greater (Intensity >= MOG_INTENSITY).
+    Risk maps can be split by flight level and by season. The counts and risk
+    are saved as a NetCDF product and the risk is rendered as a raster, so
+    the cost of plotting does not depend on the number of reports.
     
     Parameters
     ----------
     input_file : str
-        Path to input CSV file containing PIREP data
+        Path to input CSV file or PIREP store directory containing PIREP data,
+        either preprocessed (with an 'Intensity' column) or raw
     output_file : str, optional
         Path to save the visualization. If None, saves to current directory
         with default name (default: None)
+    netcdf_file : str, optional
+        Path to save the risk map product. If None, uses output_file with a
+        '.nc' suffix (default: None)
+    grid : dict, optional
+        Regular grid with the keys of ``MERRA2_GRID`` (dx, dy, nx, ny,
+        x_start, y_start). Reports outside the grid are ignored. If None,
+        uses the MERRA-2 grid (default: None)
+    by_level : bool, optional
+        If True, computes a separate risk map for each flight level
+        (default: False)
+    by_season : bool, optional
+        If True, computes a separate risk map for each season in ``SEASONS``
+        (default: False)
+    min_reports : int, optional
+        Minimum number of reports for a grid cell to be assigned a risk;
+        cells with fewer reports are left empty (default: 1)
+    chunksize : int, optional
+        Number of reports to bin at a time. If None, reads the whole input at
+        once (default: None)
     **kwargs
-        Additional keyword arguments for customization
+        Additional keyword arguments passed to ``matplotlib.pyplot.imshow``
+        (e.g., cmap, vmax)
+        
+    Returns
+    -------
+    np.ndarray
+        Risk of shape (levels, seasons, ny, nx), NaN where a cell has fewer
+        than min_reports reports. Without by_level or by_season the matching
+        axis has length 1
         
     Examples
     --------
     >>> import wxcbench.aviation_turbulence as wab
     >>> wab.convert_to_risk_map('updated_CSVs/csv_fl_rem.csv')
+    >>> risk = wab.convert_to_risk_map(
+    ...     'updated_CSVs/csv_fl_rem.csv',
+    ...     output_file='seasonal_risk_map.png',
+    ...     by_level=True,
+    ...     by_season=True,
+    ...     min_reports=5
+    ... )
     """
-    # Read the input file
-    df = pd.read_csv(input_file)
-    
-    # TODO: Add actual risk map conversion logic from the notebook
-    # This should include:
-    # - Creating spatial distribution visualization
-    # - Converting to risk map format
-    # - Saving visualization
-    
     if output_file is None:
         output_file = "pirep_risk_map.png"
+    if netcdf_file is None:
+        netcdf_file = str(Path(output_file).with_suffix('.nc'))
+    if grid is None:
+        grid = MERRA2_GRID
     
-    # Placeholder: Create a simple visualization
-    fig, ax = plt.subplots(figsize=(10, 6))
+    levels = FLIGHT_LEVELS if by_level else ['all']
+    seasons = list(SEASONS) if by_season else ['all']
     
-    # Plot latitude vs longitude if available
-    if 'LAT' in df.columns and 'LON' in df.columns:
-        ax.scatter(df['LON'], df['LAT'], alpha=0.1, s=1)
-        ax.set_xlabel('Longitude')
-        ax.set_ylabel('Latitude')
-        ax.set_title('PIREP Spatial Distribution')
+    # Read only the columns needed for the requested splits
+    columns = ['LAT', 'LON', 'Intensity']
+    if by_level:
+        columns += ['FLIGHT_LEVEL', 'FL']
+    if by_season:
+        columns += ['VALID']
     
-    plt.savefig(output_file, dpi=150, bbox_inches='tight')
-    plt.close()
+    # Accumulate report counts chunk by chunk
+    shape = (len(levels), len(seasons), grid["ny"] * grid["nx"])
+    count = np.zeros(shape, dtype=np.int64)
+    mog = np.zeros(shape, dtype=np.int64)
+    for chunk in read_parsed_reports(input_file, columns, chunksize):
+        chunk_count, chunk_mog = _bin_reports(chunk, grid, by_level, by_season)
+        count += chunk_count
+        mog += chunk_mog
     
-    print(f"Risk map saved to {output_file}")
-
+    shape = (len(levels), len(seasons), grid["ny"], grid["nx"])
+    count = count.reshape(shape)
+    mog = mog.reshape(shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        risk = np.where(count >= max(min_reports, 1), mog / count, np.nan).astype(np.float32)
+    
+    _write_risk_map(netcdf_file, grid, levels, seasons, count, mog, risk)
+    _plot_risk_map(output_file, grid, levels, seasons, risk, **kwargs)
+    
+    print(f"Binned {int(count.sum())} reports onto a {grid['ny']}x{grid['nx']} grid")
+    print(f"Risk map saved to {output_file} and {netcdf_file}")
+    return risk
@@ -6,18 +6,26 @@ Converts data to binary classification indicating whether moderate or greater (M
 turbulence is present.
 """
 
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import netCDF4 as nc
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from wxcbench.aviation_turbulence.config import (
     MERRA2_GRID,
     TURBULENCE_THRESHOLD,
     NO_DATA_VALUE,
+    MOG_INTENSITY,
+    GRIDDED_LAYOUTS,
+    GRIDDED_COMPLEVEL,
+    GRIDDED_WRITE_SLAB,
+    TIME_BIN_HOURS,
     DEFAULT_GRIDDED_DATA_DIR
 )
+from wxcbench.aviation_turbulence.pirep_store import read_pireps, parse_valid_times
 
 
 def find_min_idx(x: np.ndarray) -> tuple:
@@ -41,23 +49,732 @@ def find_min_idx(x: np.ndarray) -> tuple:
     return int(k // ncol), int(k % ncol)
 
 
+def merra2_axes(grid: Optional[dict] = None) -> tuple:
+    """
+    Build the 1-D longitude and latitude axes of the MERRA-2 grid.
+    
+    Parameters
+    ----------
+    grid : dict, optional
+        Regular grid with the keys of ``MERRA2_GRID``. If None, uses the
+        MERRA-2 grid (default: None)
+        
+    Returns
+    -------
+    tuple
+        (x, y) arrays of grid longitudes and latitudes in degrees
+    """
+    if grid is None:
+        grid = MERRA2_GRID
+    dx = grid["dx"]
+    dy = grid["dy"]
+    nx = grid["nx"]
+    ny = grid["ny"]
+    
+    x = grid["x_start"] + dx * np.arange(nx)
+    y = grid["y_start"] + dy * np.arange(ny)
+    return x, y
+
+
+def assign_grid_cells(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    grid: Optional[dict] = None
+) -> tuple:
+    """
+    Assign points to their nearest MERRA-2 grid cell.
+    
+    Indices are computed arithmetically from the regular grid spacing, which
+    gives the same cell as a nearest-neighbour search over the full meshgrid
+    (``find_min_idx`` on the squared distance) without touching the grid.
+    Ties go to the lower index and points outside the grid are clamped to
+    the edge, exactly like the meshgrid search.
+    
+    Parameters
+    ----------
+    lat : np.ndarray
+        Latitudes in degrees
+    lon : np.ndarray
+        Longitudes in degrees
+    grid : dict, optional
+        Regular grid with the keys of ``MERRA2_GRID``. If None, uses the
+        MERRA-2 grid (default: None)
+        
+    Returns
+    -------
+    tuple
+        (yind, xind) integer arrays of row and column indices
+    """
+    if grid is None:
+        grid = MERRA2_GRID
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    
+    fx = (lon - grid["x_start"]) / grid["dx"]
+    fy = (lat - grid["y_start"]) / grid["dy"]
+    
+    # ceil(f - 0.5) rounds to nearest with ties going to the lower index
+    xind = np.clip(np.ceil(fx - 0.5), 0, grid["nx"] - 1).astype(np.int64)
+    yind = np.clip(np.ceil(fy - 0.5), 0, grid["ny"] - 1).astype(np.int64)
+    return yind, xind
+
+
+def _time_keys(valid: pd.Series, hours: Optional[int] = None) -> np.ndarray:
+    """
+    Compute the time bin of each report as an integer key.
+    
+    Parameters
+    ----------
+    valid : pd.Series
+        Report times, as YYYYMMDDHHMM values or datetime64
+    hours : int, optional
+        Bin width in hours. Reports go to the nearest bin centre, a multiple
+        of hours after 00Z, which may fall on the next day. If None, bins by
+        calendar day (default: None)
+        
+    Returns
+    -------
+    np.ndarray
+        int64 YYYYMMDD keys (daily) or YYYYMMDDHH keys (sub-daily), -1 where
+        the time cannot be parsed
+    """
+    valid = parse_valid_times(valid)
+    if hours is None:
+        stamp = valid.dt
+        day = stamp.year * 10000 + stamp.month * 100 + stamp.day
+        return day.to_numpy(dtype=np.float64, na_value=-1).astype(np.int64)
+    
+    # Round to the nearest bin in whole minutes, ties going to the later bin
+    minutes = valid.to_numpy(dtype='datetime64[m]')
+    missing = np.isnat(minutes)
+    width = np.int64(hours * 60)
+    binned = (minutes.astype(np.int64) + width // 2) // width * width
+    stamp = pd.DatetimeIndex(binned.astype('datetime64[m]'))
+    keys = ((stamp.year * 100 + stamp.month) * 100 + stamp.day) * 100 + stamp.hour
+    return np.where(missing, -1, keys.to_numpy(dtype=np.int64))
+
+
+def _key_years(keys: np.ndarray) -> np.ndarray:
+    """Year of YYYYMMDD or YYYYMMDDHH time keys."""
+    keys = np.asarray(keys, dtype=np.int64)
+    return np.where(keys >= 10**8, keys // 10**6, keys // 10**4)
+
+
+def _aggregate_reports(pdf: pd.DataFrame, hours: Optional[int] = None) -> pd.DataFrame:
+    """
+    Reduce PIREPs to MOG and total report counts per (time bin, grid cell).
+    
+    Parameters
+    ----------
+    pdf : pd.DataFrame
+        PIREPs with 'VALID' (YYYYMMDDHHMM or datetime64), 'LAT' and 'LON' columns and, optionally, an
+        'Intensity' column (reports with Intensity >= MOG_INTENSITY count as MOG)
+    hours : int, optional
+        Time bin width in hours. If None, bins by calendar day (default: None)
+        
+    Returns
+    -------
+    pd.DataFrame
+        One row per (TIME, CELL) with integer TIME key (YYYYMMDD, or
+        YYYYMMDDHH with hours), flat CELL index (y * nx + x), MOG count and
+        COUNT of reports
+    """
+    lat = pdf['LAT'].to_numpy(dtype=np.float64)
+    lon = pdf['LON'].to_numpy(dtype=np.float64)
+    time = _time_keys(pdf['VALID'], hours)
+    valid = np.isfinite(lat) & np.isfinite(lon) & (time >= 0)
+    
+    yind, xind = assign_grid_cells(lat[valid], lon[valid])
+    time = time[valid]
+    
+    if 'Intensity' in pdf.columns:
+        intensity = pdf['Intensity'].to_numpy(dtype=np.float64, na_value=np.nan)
+        mog = intensity[valid] >= MOG_INTENSITY
+    else:
+        mog = np.zeros(time.size, dtype=bool)
+    
+    cells = pd.DataFrame({
+        'TIME': time,
+        'CELL': yind * MERRA2_GRID["nx"] + xind,
+        'MOG': mog.astype(np.int64),
+        'COUNT': np.ones(time.size, dtype=np.int64),
+    })
+    return cells.groupby(['TIME', 'CELL'], as_index=False, sort=True).sum()
+
+
+def _aggregate_file(
+    fpath: str,
+    chunksize: Optional[int] = None,
+    spill_dir: Optional[Path] = None,
+    years: Optional[List[int]] = None,
+    hours: Optional[int] = None
+) -> Dict[int, list]:
+    """
+    Aggregate a PIREP CSV into per-year (time bin, grid cell) counts.
+    
+    With ``chunksize`` set, the file is streamed in chunks of that many rows
+    and each chunk's per-year counts are spilled to ``spill_dir``, so only a
+    single chunk is ever resident while reading.
+    
+    Parameters
+    ----------
+    fpath : str
+        Path to the PIREP CSV file or Parquet store directory
+    chunksize : int, optional
+        Number of rows to read at a time. If None, reads the whole file (default: None)
+    spill_dir : Path, optional
+        Directory for spill files, required when chunksize is set (default: None)
+    years : List[int], optional
+        Years to keep. If None, keeps all years (default: None)
+    hours : int, optional
+        Time bin width in hours. If None, bins by calendar day (default: None)
+        
+    Returns
+    -------
+    Dict[int, list]
+        Mapping of year to the list of partial aggregates for that year,
+        either DataFrames or paths to spilled .npy files
+    """
+    # Open the PIREPS file, keeping only the columns needed for gridding
+    reader = read_pireps(
+        fpath,
+        columns=['VALID', 'LAT', 'LON', 'Intensity'],
+        chunksize=chunksize
+    )
+    if chunksize is None:
+        reader = [reader]
+    
+    parts = {}
+    for i, pdf in enumerate(reader):
+        # Count MOG and total reports per (time bin, grid cell)
+        cells = _aggregate_reports(pdf, hours)
+        cell_years = _key_years(cells['TIME'].to_numpy())
+        if years is not None:
+            keep = np.isin(cell_years, years)
+            cells, cell_years = cells[keep], cell_years[keep]
+        
+        for year, year_cells in cells.groupby(cell_years):
+            if chunksize is None:
+                parts.setdefault(int(year), []).append(year_cells)
+            else:
+                spill = spill_dir / f"{Path(fpath).stem}_{year}_{i}.npy"
+                np.save(spill, year_cells.to_numpy(dtype=np.int64))
+                parts.setdefault(int(year), []).append(spill)
+    
+    return parts
+
+
+def _merge_parts(parts: list) -> pd.DataFrame:
+    """
+    Combine partial (time bin, grid cell) aggregates into a single table.
+    
+    Parameters
+    ----------
+    parts : list
+        Partial aggregates as returned by ``_aggregate_file``
+        
+    Returns
+    -------
+    pd.DataFrame
+        Aggregated counts with one row per (TIME, CELL)
+    """
+    frames = [
+        pd.DataFrame(np.load(part), columns=['TIME', 'CELL', 'MOG', 'COUNT'])
+        if isinstance(part, Path) else part
+        for part in parts
+    ]
+    if len(frames) == 1:
+        return frames[0]
+    
+    cells = pd.concat(frames, ignore_index=True)
+    return cells.groupby(['TIME', 'CELL'], as_index=False, sort=True).sum()
+
+
+def _classify_cells(cells: pd.DataFrame, threshold: float) -> np.ndarray:
+    """
+    Classify aggregated (time bin, grid cell) counts as turbulence (1) or not (0).
+    
+    Parameters
+    ----------
+    cells : pd.DataFrame
+        Aggregated counts as returned by ``_aggregate_reports``
+    threshold : float
+        Fraction of reports that must be MOG before cell is classified as turbulence
+        
+    Returns
+    -------
+    np.ndarray
+        uint8 label of each row of cells
+    """
+    # Same classification as the per-report loop, applied to observed cells only
+    frac = cells['MOG'].to_numpy() / cells['COUNT'].to_numpy()
+    label = np.where(frac >= threshold, 1, frac)
+    label = np.where(label < 1, 0, label)
+    return label.astype(np.uint8)
+
+
+def _classify_days(
+    cells: pd.DataFrame,
+    threshold: float,
+    nodata: int
+) -> tuple:
+    """
+    Scatter per-cell counts into daily binary turbulence grids.
+    
+    Parameters
+    ----------
+    cells : pd.DataFrame
+        Aggregated counts as returned by ``_aggregate_reports``
+    threshold : float
+        Fraction of reports that must be MOG before cell is classified as turbulence
+    nodata : int
+        No data value for cells without reports
+        
+    Returns
+    -------
+    tuple
+        (binaries, dates) where binaries is a uint8 array of shape
+        (days, ny, nx) and dates is the list of YYYYMMDD strings
+    """
+    days, day_idx = np.unique(cells['TIME'].to_numpy(), return_inverse=True)
+    
+    binaries = np.full(
+        (days.size, MERRA2_GRID["ny"] * MERRA2_GRID["nx"]), nodata, dtype=np.uint8
+    )
+    binaries[day_idx, cells['CELL'].to_numpy()] = _classify_cells(cells, threshold)
+    binaries = binaries.reshape(days.size, MERRA2_GRID["ny"], MERRA2_GRID["nx"])
+    
+    return binaries, [str(d) for d in days]
+
+
+def pack_2bit(grids: np.ndarray) -> np.ndarray:
+    """
+    Pack grids of values 0-3 into four 2-bit cells per byte along the last axis.
+    
+    Parameters
+    ----------
+    grids : np.ndarray
+        uint8 array with values 0-3
+        
+    Returns
+    -------
+    np.ndarray
+        uint8 array with the last axis reduced to ceil(nx / 4); cell x is
+        stored in bits 2 * (x % 4) of byte x // 4
+    """
+    nx = grids.shape[-1]
+    pad = (-nx) % 4
+    if pad:
+        grids = np.concatenate(
+            [grids, np.zeros(grids.shape[:-1] + (pad,), dtype=grids.dtype)], axis=-1
+        )
+    quads = grids.astype(np.uint8).reshape(grids.shape[:-1] + (-1, 4))
+    return quads[..., 0] | (quads[..., 1] << 2) | (quads[..., 2] << 4) | (quads[..., 3] << 6)
+
+
+def unpack_2bit(packed: np.ndarray, nx: int) -> np.ndarray:
+    """
+    Unpack grids packed by ``pack_2bit``.
+    
+    Parameters
+    ----------
+    packed : np.ndarray
+        Packed uint8 array
+    nx : int
+        Length of the unpacked last axis
+        
+    Returns
+    -------
+    np.ndarray
+        uint8 array with values 0-3
+    """
+    shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+    grids = (packed[..., None] >> shifts) & 3
+    return grids.reshape(packed.shape[:-1] + (-1,))[..., :nx]
+
+
+def read_gridded_cells(dataset: nc.Dataset, index: int) -> tuple:
+    """
+    Read the observed cells of one day from a gridded file of any layout.
+    
+    Sparse files are read directly, so the cost scales with the number of
+    observed cells. For dense layouts the day's grid is read and its cells
+    other than the no data value are returned.
+    
+    Parameters
+    ----------
+    dataset : nc.Dataset
+        Open gridded turbulence file written by ``grid_pireps``
+    index : int
+        Time index of the day
+        
+    Returns
+    -------
+    tuple
+        (yinds, xinds, labels) arrays of the observed cells in row-major order
+    """
+    var = dataset.variables['Turbulence']
+    if getattr(dataset, 'layout', None) == 'sparse':
+        start, stop = dataset.variables['DayStart'][index:index + 2]
+        yinds = np.ma.getdata(dataset.variables['YIndex'][start:stop]).astype(np.int64)
+        xinds = np.ma.getdata(dataset.variables['XIndex'][start:stop]).astype(np.int64)
+        return yinds, xinds, np.ma.getdata(var[start:stop])
+    
+    nodata = int(getattr(var, 'missing_data_value', NO_DATA_VALUE))
+    grid = read_gridded_day(dataset, index)
+    yinds, xinds = np.nonzero(grid != nodata)
+    return yinds, xinds, grid[yinds, xinds]
+
+
+def read_gridded_voxels(dataset: nc.Dataset, index: int) -> tuple:
+    """
+    Read the observed voxels of one day from a voxel file.
+    
+    Parameters
+    ----------
+    dataset : nc.Dataset
+        Open voxel file written by ``grid_pireps_3d``
+    index : int
+        Time index of the day
+        
+    Returns
+    -------
+    tuple
+        (levels, yinds, xinds, labels) arrays of the observed voxels, with
+        levels the MERRA-2 model level (z) index of each voxel
+    """
+    if 'LevelIndex' not in dataset.variables:
+        raise ValueError("Not a voxel file: no 'LevelIndex' variable")
+    start, stop = dataset.variables['DayStart'][index:index + 2]
+    levels = np.ma.getdata(dataset.variables['LevelIndex'][start:stop]).astype(np.int64)
+    return (levels,) + read_gridded_cells(dataset, index)
+
+
+def read_gridded_day(dataset: nc.Dataset, index: int) -> np.ndarray:
+    """
+    Read one day of turbulence from a gridded file of any layout.
+    
+    Only the requested day is read, and with the compact layouts only that
+    day's chunk is decompressed. Sparse days are scattered into a grid
+    filled with the no data value.
+    
+    Parameters
+    ----------
+    dataset : nc.Dataset
+        Open gridded turbulence file written by ``grid_pireps``
+    index : int
+        Time index of the day
+        
+    Returns
+    -------
+    np.ndarray
+        uint8 turbulence grid of shape (ny, nx)
+    """
+    var = dataset.variables['Turbulence']
+    if getattr(dataset, 'layout', None) == 'sparse':
+        nodata = int(getattr(var, 'missing_data_value', NO_DATA_VALUE))
+        grid = np.full(
+            (len(dataset.dimensions['Y']), len(dataset.dimensions['X'])), nodata, dtype=np.uint8
+        )
+        yinds, xinds, labels = read_gridded_cells(dataset, index)
+        grid[yinds, xinds] = labels
+        return grid
+    
+    grid = np.ma.getdata(var[index, :, :])
+    if getattr(var, 'packing', None) == '2bit':
+        grid = unpack_2bit(grid, len(dataset.dimensions['X']))
+    return grid
+
+
+def _write_gridded_year(
+    fname: str,
+    cells: pd.DataFrame,
+    threshold: float,
+    nodata: int,
+    layout: str = "standard",
+    hours: Optional[int] = None
+) -> List[str]:
+    """
+    Write one year of daily gridded turbulence to a NetCDF file.
+    
+    The dense grids are classified and written ``GRIDDED_WRITE_SLAB`` time
+    bins at a time, so memory stays bounded by one slab even for a year of
+    hourly bins.
+    
+    Parameters
+    ----------
+    fname : str
+        Output NetCDF path
+    cells : pd.DataFrame
+        Aggregated counts as returned by ``_merge_parts``, sorted by (TIME, CELL)
+    threshold : float
+        Fraction of reports that must be MOG before cell is classified as turbulence
+    nodata : int
+        No data value
+    layout : str, optional
+        One of ``GRIDDED_LAYOUTS`` (default: "standard")
+    hours : int, optional
+        Time bin width in hours, None for daily grids (default: None)
+        
+    Returns
+    -------
+    List[str]
+        YYYYMMDD dates (YYYYMMDDHH with hours) written
+    """
+    x, y = merra2_axes()
+    compact = layout != "standard"
+    time = cells['TIME'].to_numpy()
+    days = np.unique(time)
+    
+    out = nc.Dataset(fname, "w")
+    out.description = (
+        'Daily moderate or greater turbulence presence from PIREPS '
+        'reports gridded onto the MERRA 2 grid.'
+    )
+    if hours is not None:
+        out.time_step_hours = hours
+    
+    # Data dimensions
+    out.createDimension('Time', days.size)
+    out.createDimension('Y', y.size)
+    out.createDimension('X', x.size)
+    out.createDimension('StringLength', 8 if hours is None else 10)
+    
+    # Variables
+    if layout == "packed":
+        out.createDimension('XPacked', (x.size + 3) // 4)
+        turb_var = out.createVariable(
+            'Turbulence', 'uint8', ('Time', 'Y', 'XPacked'),
+            zlib=True, shuffle=True, complevel=GRIDDED_COMPLEVEL,
+            chunksizes=(1, y.size, (x.size + 3) // 4)
+        )
+        turb_var.packing = '2bit'
+    elif compact:
+        turb_var = out.createVariable(
+            'Turbulence', 'uint8', ('Time', 'Y', 'X'),
+            zlib=True, shuffle=True, complevel=GRIDDED_COMPLEVEL,
+            chunksizes=(1, y.size, x.size)
+        )
+    else:
+        turb_var = out.createVariable('Turbulence', 'uint8', ('Time', 'Y', 'X'))
+    turb_var.long_name = 'Turbulence Presence (1=Yes, 0=No)'
+    turb_var.missing_data_value = str(nodata)
+    
+    date_var = out.createVariable('Dates', 'S8', ('Time',))
+    date_var.long_name = 'Date of turbulence report (UTC)'
+    
+    coord_dims = (('X',), ('Y',)) if compact else (('Y', 'X'), ('Y', 'X'))
+    lon_var = out.createVariable('Lons', 'f8', coord_dims[0])
+    lon_var.long_name = 'Longitude (deg)'
+    
+    lat_var = out.createVariable('Lats', 'f8', coord_dims[1])
+    lat_var.long_name = 'Latitude (deg)'
+    
+    # Save the data one slab of time bins at a time
+    bounds = np.searchsorted(time, days)
+    bounds = np.append(bounds, len(time))
+    for start in range(0, days.size, GRIDDED_WRITE_SLAB):
+        stop = min(start + GRIDDED_WRITE_SLAB, days.size)
+        binaries, _ = _classify_days(cells.iloc[bounds[start]:bounds[stop]], threshold, nodata)
+        turb_var[start:stop] = pack_2bit(binaries) if layout == "packed" else binaries
+    dates = [str(d) for d in days]
+    date_var[:] = np.array(dates)
+    if compact:
+        lon_var[:] = x
+        lat_var[:] = y
+    else:
+        xg, yg = np.meshgrid(x, y)
+        lon_var[:] = xg
+        lat_var[:] = yg
+    
+    # Close the file
+    out.close()
+    return dates
+
+
+def _write_sparse_year(
+    fname: str,
+    cells: pd.DataFrame,
+    threshold: float,
+    nodata: int,
+    hours: Optional[int] = None
+) -> List[str]:
+    """
+    Write one year of gridded turbulence as a sparse (COO) NetCDF file.
+    
+    Only observed cells are stored, as parallel (Y, X, Turbulence, Count)
+    arrays sorted by day and grid cell. The cells of day i are the range
+    DayStart[i]:DayStart[i + 1], so a single day is read directly. If cells
+    has a 'LEVEL' column, the records are voxels and their MERRA-2 model
+    level is stored as LevelIndex.
+    
+    Parameters
+    ----------
+    fname : str
+        Output NetCDF path
+    cells : pd.DataFrame
+        Aggregated counts as returned by ``_merge_parts``, sorted by (TIME, CELL)
+        or, for voxels, (TIME, CELL, LEVEL)
+    threshold : float
+        Fraction of reports that must be MOG before cell is classified as turbulence
+    nodata : int
+        No data value of the equivalent dense grids
+    hours : int, optional
+        Time bin width in hours, None for daily grids (default: None)
+        
+    Returns
+    -------
+    List[str]
+        YYYYMMDD dates (YYYYMMDDHH with hours) written
+    """
+    x, y = merra2_axes()
+    days, day_counts = np.unique(cells['TIME'].to_numpy(), return_counts=True)
+    cell = cells['CELL'].to_numpy()
+    
+    out = nc.Dataset(fname, "w")
+    out.description = (
+        'Daily moderate or greater turbulence presence from PIREPS '
+        'reports gridded onto the MERRA 2 grid, stored for observed cells only.'
+    )
+    out.layout = 'sparse'
+    if hours is not None:
+        out.time_step_hours = hours
+    
+    # Data dimensions
+    out.createDimension('Time', days.size)
+    out.createDimension('TimeBounds', days.size + 1)
+    out.createDimension('Cells', len(cells))
+    out.createDimension('Y', y.size)
+    out.createDimension('X', x.size)
+    out.createDimension('StringLength', 8 if hours is None else 10)
+    
+    # Variables
+    date_var = out.createVariable('Dates', 'S8', ('Time',))
+    date_var.long_name = 'Date of turbulence report (UTC)'
+    
+    start_var = out.createVariable('DayStart', 'i8', ('TimeBounds',))
+    start_var.long_name = 'Index of the first cell of each day'
+    
+    yind_var = out.createVariable('YIndex', 'i2', ('Cells',), zlib=True)
+    yind_var.long_name = 'Row (latitude) index of the cell'
+    
+    xind_var = out.createVariable('XIndex', 'i2', ('Cells',), zlib=True)
+    xind_var.long_name = 'Column (longitude) index of the cell'
+    
+    turb_var = out.createVariable('Turbulence', 'uint8', ('Cells',), zlib=True)
+    turb_var.long_name = 'Turbulence Presence (1=Yes, 0=No)'
+    turb_var.missing_data_value = str(nodata)
+    
+    count_var = out.createVariable('Count', 'u4', ('Cells',), zlib=True)
+    count_var.long_name = 'Number of PIREPs in the cell'
+    
+    if 'LEVEL' in cells.columns:
+        level_var = out.createVariable('LevelIndex', 'i2', ('Cells',), zlib=True)
+        level_var.long_name = 'MERRA 2 model level index (z) of the voxel'
+        level_var[:] = cells['LEVEL'].to_numpy()
+    
+    lon_var = out.createVariable('Lons', 'f8', ('X',))
+    lon_var.long_name = 'Longitude (deg)'
+    
+    lat_var = out.createVariable('Lats', 'f8', ('Y',))
+    lat_var.long_name = 'Latitude (deg)'
+    
+    # Save the data
+    dates = [str(d) for d in days]
+    date_var[:] = np.array(dates)
+    start_var[:] = np.concatenate([[0], np.cumsum(day_counts)])
+    yind_var[:] = cell // MERRA2_GRID["nx"]
+    xind_var[:] = cell % MERRA2_GRID["nx"]
+    turb_var[:] = _classify_cells(cells, threshold)
+    count_var[:] = cells['COUNT'].to_numpy()
+    lon_var[:] = x
+    lat_var[:] = y
+    
+    # Close the file
+    out.close()
+    return dates
+
+
+def _grid_partition(
+    fpath: str,
+    year: int,
+    parts: list,
+    output_dir: Path,
+    threshold: float,
+    nodata: int,
+    layout: str = "standard",
+    hours: Optional[int] = None
+) -> List[str]:
+    """
+    Grid and write one (year, flight-level file) partition.
+    
+    Parameters
+    ----------
+    fpath : str
+        Path to the PIREP CSV file the partition came from
+    year : int
+        Year of the partition
+    parts : list
+        Partial aggregates for the year as returned by ``_aggregate_file``
+    output_dir : Path
+        Directory to save gridded data
+    threshold : float
+        Fraction of reports that must be MOG before cell is classified as turbulence
+    nodata : int
+        No data value
+    layout : str, optional
+        One of ``GRIDDED_LAYOUTS`` (default: "standard")
+    hours : int, optional
+        Time bin width in hours, None for daily grids (default: None)
+        
+    Returns
+    -------
+    List[str]
+        Dates written to the partition's NetCDF file
+    """
+    cells = _merge_parts(parts)
+    fname = f"{output_dir}/{year}_{Path(fpath).stem}.nc"
+    if layout == "sparse":
+        return _write_sparse_year(fname, cells, threshold, nodata, hours)
+    return _write_gridded_year(fname, cells, threshold, nodata, layout, hours)
+
+
 def grid_pireps(
     pirep_files: List[str],
     output_dir: Optional[str] = None,
     threshold: float = None,
-    nodata: int = None
+    nodata: int = None,
+    chunksize: Optional[int] = None,
+    years: Optional[List[int]] = None,
+    n_workers: int = 1,
+    layout: str = "standard",
+    hours: Optional[int] = None
 ) -> None:
     """
     Grid PIREP data onto MERRA-2 grid and create binary turbulence classification.
     
     This function takes downloaded PIREP files, filters them, and bins them by day
-    onto the MERRA-2 grid. The data is converted to a binary classification indicating
+    (or into sub-daily time bins with ``hours``) onto the MERRA-2 grid. The data is converted to a binary classification indicating
     whether moderate or greater (MOG) turbulence is present.
     
+    Grid cells are assigned arithmetically for the whole file at once and the
+    MOG and report counts are accumulated per (date, y, x), so the cost scales
+    with the number of reports rather than reports times grid size.
+    
+    For archives too large to hold in memory, pass ``chunksize`` to stream
+    each file in bounded chunks. Every chunk is reduced to per-day cell
+    counts and spilled to disk by year, so peak memory is one chunk plus
+    the aggregated cells of the year being written.
+    
+    Each (year, flight-level file) partition is written to its own NetCDF
+    file, so with ``n_workers`` > 1 files are aggregated and partitions are
+    gridded in separate worker processes.
+    
     Parameters
     ----------
     pirep_files : List[str]
         List of paths to PIREP CSV files (e.g., ['updated_CSVs/low_fl.csv', ...])
+        or PIREP store directories
     output_dir : str, optional
         Directory to save gridded data. If None, uses default directory (default: None)
     threshold : float, optional
@@ -65,11 +782,39 @@ def grid_pireps(
         If None, uses default from config (default: None)
     nodata : int, optional
         No data value. If None, uses default from config (default: None)
+    chunksize : int, optional
+        Number of CSV rows to read at a time. If None, reads each file
+        at once (default: None)
+    years : List[int], optional
+        Years to grid. If None, grids every year present in the files (default: None)
+    n_workers : int, optional
+        Number of worker processes. If 1, runs in the current process (default: 1)
+    layout : str, optional
+        Layout of the output files, one of ``GRIDDED_LAYOUTS``. "standard"
+        stores uncompressed grids with 2-D coordinates. "compact" stores 1-D
+        coordinates and compresses each day as its own chunk, so a single day
+        can be read without decompressing the year. "packed" additionally
+        packs four 2-bit cells per byte (requires nodata <= 3). "sparse"
+        stores only the observed cells as (date, y, x, label, count) records,
+        so file size and gridding memory scale with the number of reports.
+        Use ``read_gridded_day`` or ``read_gridded_cells`` to read any
+        layout (default: "standard")
+    hours : int, optional
+        Time bin width in hours, one of ``TIME_BIN_HOURS``. Reports are
+        binned to the nearest multiple of hours after 00Z, so 3- and 6-hourly
+        bins are centred on MERRA-2 analysis times, and dates are written as
+        YYYYMMDDHH. If None, bins by calendar day (default: None)
         
     Examples
     --------
     >>> import wxcbench.aviation_turbulence as wab
     >>> wab.grid_pireps(['updated_CSVs/low_fl.csv', 'updated_CSVs/med_fl.csv'])
+    >>> wab.grid_pireps(
+    ...     ['updated_CSVs/low_fl.csv', 'updated_CSVs/med_fl.csv'],
+    ...     years=[2021, 2022],
+    ...     n_workers=4,
+    ...     layout='compact'
+    ... )
     """
     # Use defaults if not provided
     if output_dir is None:
@@ -78,159 +823,48 @@ def grid_pireps(
         threshold = TURBULENCE_THRESHOLD
     if nodata is None:
         nodata = NO_DATA_VALUE
+    if layout not in GRIDDED_LAYOUTS:
+        raise ValueError(f"layout must be one of {GRIDDED_LAYOUTS}, got {layout!r}")
+    if layout == "packed" and not 0 <= nodata <= 3:
+        raise ValueError("The packed layout stores 2-bit values and requires nodata <= 3")
+    if hours is not None and hours not in TIME_BIN_HOURS:
+        raise ValueError(f"hours must be one of {TIME_BIN_HOURS}, got {hours!r}")
     
     # Create output directory
     sdir = Path(output_dir)
     sdir.mkdir(parents=True, exist_ok=True)
     
-    # Build the MERRA-2 grid
-    dx = MERRA2_GRID["dx"]
-    dy = MERRA2_GRID["dy"]
-    nx = MERRA2_GRID["nx"]
-    ny = MERRA2_GRID["ny"]
-    
-    x = np.arange(MERRA2_GRID["x_start"], MERRA2_GRID["x_start"] + dx * nx, dx)
-    y = np.arange(MERRA2_GRID["y_start"], MERRA2_GRID["y_start"] + dy * ny, dy)
-    xg, yg = np.meshgrid(x, y)
-    
-    # Loop over the input files
-    for fpath in pirep_files:
-        # Open the PIREPS file and sort by date
-        pdf = pd.read_csv(fpath)
-        pdf = pdf.sort_values(by='VALID')
-        
-        # Initialize arrays for counting reports and storing turbulence value
-        turbulence = np.zeros((y.size, x.size))  # MOG turbulence
-        counts = np.zeros((y.size, x.size))  # Report count
-        binaries = []  # List to hold turbulence occurrence arrays
-        dates = []  # List to hold the dates
-        
-        # Loop over each row
-        date = str(pdf.VALID.iloc[0])[:8]
-        year = date[:4]
-        
-        for index, row in pdf.iterrows():
-            # Grab the new date
-            new_date = str(row.VALID)[:8]
-            new_year = new_date[:4]
-            
-            # Skip if not 2023 (adjust as needed)
-            if new_year != '2023':
-                date = new_date
-                year = new_year
-                continue
-            
-            if new_date != date:
-                # Append old date to date list
-                dates.append(date)
-                
-                # Compute turbulence occurrence
-                dummy = turbulence / counts
-                dummy[dummy >= threshold] = 1  # yes turbulence
-                dummy[dummy < 1] = 0  # no turbulence
-                dummy[counts == 0] = nodata  # no data
-                binaries.append(dummy)
-                
-                # Reset values
-                turbulence = np.zeros((y.size, x.size))
-                counts = np.zeros((y.size, x.size))
-                date = new_date
-            
-            if new_year != year:
-                # Write out the data
-                out = nc.Dataset(
-                    f"{sdir}/{year}_{Path(fpath).stem.replace('csv', 'nc')}",
-                    "w"
-                )
-                out.description = (
-                    'Daily moderate or greater turbulence presence from PIREPS '
-                    'reports gridded onto the MERRA 2 grid.'
-                )
-                
-                # Data dimensions
-                out.createDimension('Time', len(binaries))
-                out.createDimension('Y', xg.shape[0])
-                out.createDimension('X', xg.shape[1])
-                out.createDimension('StringLength', 8)
-                
-                # Variables
-                turb_var = out.createVariable('Turbulence', 'uint8', ('Time', 'Y', 'X'))
-                turb_var.long_name = 'Turbulence Presence (1=Yes, 0=No)'
-                turb_var.missing_data_value = str(nodata)
-                
-                date_var = out.createVariable('Dates', 'S8', ('Time',))
-                date_var.long_name = 'Date of turbulence report (UTC)'
-                
-                lon_var = out.createVariable('Lons', 'f8', ('Y', 'X'))
-                lon_var.long_name = 'Longitude (deg)'
-                
-                lat_var = out.createVariable('Lats', 'f8', ('Y', 'X'))
-                lat_var.long_name = 'Latitude (deg)'
-                
-                # Save the data
-                turb_var[:] = np.array(binaries)
-                date_var[:] = np.array(dates)
-                lon_var[:] = xg
-                lat_var[:] = yg
-                
-                # Close the file
-                out.close()
-                
-                # Reset variables
-                print(year, new_year)
-                year = new_year
-                binaries = []
-                dates = []
-            
-            # Assign grid point
-            dist = (row.LON - xg) ** 2 + (row.LAT - yg) ** 2
-            yind, xind = find_min_idx(dist)
-            
-            # Determine if report is moderate or greater
-            if hasattr(row, 'Intensity') and row.Intensity >= 2:
-                turbulence[yind, xind] += 1
-            counts[yind, xind] += 1
-        
-        print(f"Processed {len(dates)} dates")
-        print(f"First 10 dates: {dates[:10]}")
-        
-        # Write out the last year
-        if binaries:
-            out = nc.Dataset(
-                f"{sdir}/{year}_{Path(fpath).stem.replace('csv', 'nc')}",
-                "w"
-            )
-            out.description = (
-                'Daily moderate or greater turbulence presence from PIREPS '
-                'reports gridded onto the MERRA 2 grid.'
-            )
-            
-            # Data dimensions
-            out.createDimension('Time', len(binaries))
-            out.createDimension('Y', xg.shape[0])
-            out.createDimension('X', xg.shape[1])
-            out.createDimension('StringLength', 8)
-            
-            # Variables
-            turb_var = out.createVariable('Turbulence', 'uint8', ('Time', 'Y', 'X'))
-            turb_var.long_name = 'Turbulence Presence (1=Yes, 0=No)'
-            turb_var.missing_data_value = str(nodata)
-            
-            date_var = out.createVariable('Dates', 'S8', ('Time',))
-            date_var.long_name = 'Date of turbulence report (UTC)'
-            
-            lon_var = out.createVariable('Lons', 'f8', ('Y', 'X'))
-            lon_var.long_name = 'Longitude (deg)'
-            
-            lat_var = out.createVariable('Lats', 'f8', ('Y', 'X'))
-            lat_var.long_name = 'Latitude (deg)'
-            
-            # Save the data
-            turb_var[:] = np.array(binaries)
-            date_var[:] = np.array(dates)
-            lon_var[:] = xg
-            lat_var[:] = yg
-            
-            # Close the file
-            out.close()
-
+    # Spill partial aggregates next to the outputs when streaming
+    spill = tempfile.TemporaryDirectory(dir=sdir) if chunksize else None
+    spill_dir = Path(spill.name) if spill else None
+    
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    
+    def run(func, tasks):
+        if executor is None:
+            return [func(*task) for task in tasks]
+        futures = [executor.submit(func, *task) for task in tasks]
+        return [future.result() for future in futures]
+    
+    try:
+        # Aggregate each file into per-year (time bin, grid cell) counts
+        aggregated = run(
+            _aggregate_file,
+            [(fpath, chunksize, spill_dir, years, hours) for fpath in pirep_files]
+        )
+        
+        # Grid and write each (year, file) partition independently
+        partitions = [
+            (fpath, year, parts[year], sdir, threshold, nodata, layout, hours)
+            for fpath, parts in zip(pirep_files, aggregated)
+            for year in sorted(parts)
+        ]
+        written = run(_grid_partition, partitions)
+        
+        for (fpath, year, *_), dates in zip(partitions, written):
+            print(f"Gridded {len(dates)} dates for {year} from {fpath}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if spill is not None:
+            spill.cleanup()
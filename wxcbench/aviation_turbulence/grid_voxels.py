@@ -0,0 +1,257 @@
+"""
+Grid PIREPs to Voxels Module
+
+Maps every PIREP to its MERRA-2 grid cell and its nearest MERRA-2 model level,
+producing a single sparse (time, level, y, x) turbulence voxel set that covers
+all flight levels at once.
+"""
+
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+from pathlib import Path
+from typing import List, Optional
+
+from wxcbench.aviation_turbulence.config import (
+    MERRA2_GRID,
+    TURBULENCE_THRESHOLD,
+    NO_DATA_VALUE,
+    MOG_INTENSITY,
+    TIME_BIN_HOURS,
+    VOXEL_VERTICAL_COORDINATES,
+    FEET_TO_METERS,
+    DEFAULT_GRIDDED_DATA_DIR
+)
+from wxcbench.aviation_turbulence.grid_pireps import (
+    assign_grid_cells,
+    _time_keys,
+    _key_years,
+    _write_sparse_year
+)
+from wxcbench.aviation_turbulence.make_training_data import (
+    index_merra2_files,
+    _analysis_time,
+    _gather_profiles,
+    _merra2_time_index
+)
+from wxcbench.aviation_turbulence.turb_eda_preprocessing import read_parsed_reports
+
+
+def flight_level_altitude(fl: np.ndarray, vertical: str = "PL") -> np.ndarray:
+    """
+    Convert flight levels to the vertical coordinate of a MERRA-2 field.
+    
+    Flight levels are pressure altitudes, so for 'PL' they are converted to
+    pressure with the ICAO standard atmosphere. For 'H' the pressure altitude
+    is used as the height directly.
+    
+    Parameters
+    ----------
+    fl : np.ndarray
+        Flight level in hundreds of feet
+    vertical : str, optional
+        'PL' for pressure (Pa) or 'H' for height (m) (default: "PL")
+        
+    Returns
+    -------
+    np.ndarray
+        Pressure in Pa or height in m
+    """
+    height = np.asarray(fl, dtype=np.float64) * 100 * FEET_TO_METERS
+    if vertical == "H":
+        return height
+    
+    # Standard atmosphere: constant lapse rate troposphere, isothermal above 11 km
+    troposphere = 101325.0 * (1 - 2.25577e-5 * np.minimum(height, 11000.0)) ** 5.25588
+    return troposphere * np.exp(-np.maximum(height - 11000.0, 0.0) / 6341.62)
+
+
+def _aggregate_voxel_reports(
+    pirep_file: str,
+    chunksize: Optional[int],
+    years: Optional[List[int]],
+    hours: Optional[int]
+) -> pd.DataFrame:
+    """
+    Count MOG and total reports per (time bin, grid cell, flight level).
+    
+    Returns
+    -------
+    pd.DataFrame
+        One row per (TIME, CELL, FL) with MOG and COUNT
+    """
+    columns = ['VALID', 'LAT', 'LON', 'FL', 'Intensity']
+    parts = []
+    for pdf in read_parsed_reports(pirep_file, columns, chunksize):
+        lat = pdf['LAT'].to_numpy(dtype=np.float64)
+        lon = pdf['LON'].to_numpy(dtype=np.float64)
+        fl = pd.to_numeric(pdf['FL'], errors='coerce').to_numpy(dtype=np.float64)
+        time = _time_keys(pdf['VALID'], hours)
+        valid = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(fl) & (time >= 0)
+        if years is not None:
+            valid &= np.isin(_key_years(time), years)
+        
+        yind, xind = assign_grid_cells(lat[valid], lon[valid])
+        intensity = pdf['Intensity'].to_numpy(dtype=np.float64, na_value=np.nan)
+        
+        cells = pd.DataFrame({
+            'TIME': time[valid],
+            'CELL': yind * MERRA2_GRID["nx"] + xind,
+            'FL': fl[valid].astype(np.int64),
+            'MOG': (intensity[valid] >= MOG_INTENSITY).astype(np.int64),
+            'COUNT': np.ones(int(valid.sum()), dtype=np.int64),
+        })
+        parts.append(cells.groupby(['TIME', 'CELL', 'FL'], as_index=False, sort=False).sum())
+    
+    # No reports at all: an empty table with the same columns
+    if not parts:
+        columns = ['TIME', 'CELL', 'FL', 'MOG', 'COUNT']
+        return pd.DataFrame({name: np.zeros(0, dtype=np.int64) for name in columns})
+    cells = pd.concat(parts, ignore_index=True)
+    return cells.groupby(['TIME', 'CELL', 'FL'], as_index=False, sort=True).sum()
+
+
+def _assign_levels(
+    cells: pd.DataFrame,
+    merra2_files: dict,
+    vertical: str
+) -> pd.DataFrame:
+    """
+    Assign each (time bin, grid cell, flight level) to its nearest model level.
+    
+    The vertical coordinate field is read once per MERRA-2 day for all of
+    that day's cells, and counts are then summed per (TIME, CELL, LEVEL).
+    Rows whose MERRA-2 day has no files are dropped.
+    """
+    keys = cells['TIME'].to_numpy()
+    analysis = {key: _analysis_time(str(key)) for key in np.unique(keys)}
+    mdays = np.array([analysis[key][0] for key in keys])
+    
+    levels = np.full(len(cells), -1, dtype=np.int64)
+    missing = []
+    for mday in np.unique(mdays):
+        rows = np.nonzero(mdays == mday)[0]
+        if mday not in merra2_files:
+            missing.append(mday)
+            continue
+        
+        with nc.Dataset(merra2_files[mday][1]) as mfn:
+            tinds = np.array([
+                _merra2_time_index(mfn, analysis[key][1]) for key in keys[rows]
+            ])
+            cell = cells['CELL'].to_numpy()[rows]
+            
+            # Read the day's field once for its unique (time, cell) columns
+            columns, inverse = np.unique(
+                tinds * MERRA2_GRID["ny"] * MERRA2_GRID["nx"] + cell, return_inverse=True
+            )
+            ucell = columns % (MERRA2_GRID["ny"] * MERRA2_GRID["nx"])
+            # Only the file of the vertical coordinate is needed
+            profiles = _gather_profiles(
+                None, mfn,
+                ucell // MERRA2_GRID["nx"], ucell % MERRA2_GRID["nx"],
+                columns // (MERRA2_GRID["ny"] * MERRA2_GRID["nx"]),
+                variables=[vertical]
+            )[vertical]
+        
+        altitude = flight_level_altitude(cells['FL'].to_numpy()[rows], vertical)
+        levels[rows] = np.abs(profiles[inverse] - altitude[:, None]).argmin(axis=1)
+    
+    if missing:
+        print(f"No MERRA-2 files for {len(missing)} dates, skipping their reports")
+    
+    cells = cells.assign(LEVEL=levels)[levels >= 0]
+    cells = cells.groupby(['TIME', 'CELL', 'LEVEL'], as_index=False, sort=True)[['MOG', 'COUNT']].sum()
+    return cells[['TIME', 'CELL', 'LEVEL', 'MOG', 'COUNT']]
+
+
+def grid_pireps_3d(
+    pirep_file: str,
+    merra2_dir: str,
+    output_dir: Optional[str] = None,
+    threshold: float = None,
+    nodata: int = None,
+    chunksize: Optional[int] = None,
+    years: Optional[List[int]] = None,
+    hours: Optional[int] = None,
+    vertical: str = "PL"
+) -> None:
+    """
+    Grid PIREPs onto MERRA-2 grid cells and model levels in a single pass.
+    
+    Instead of splitting reports into flight-level bands and gridding each
+    band separately, every report is mapped to its MERRA-2 grid cell and to
+    the model level whose pressure (or height) is nearest to the report's
+    flight level, using that day's MERRA-2 field at the cell. Voxels are
+    classified like ``grid_pireps`` and written as one sparse file per year,
+    '{year}_voxels.nc', holding (date, level, y, x, label, count) records.
+    Pass ``voxels=True`` to ``create_training_data`` to extract profiles for
+    them, reading each MERRA-2 day once for all levels.
+    
+    Parameters
+    ----------
+    pirep_file : str
+        Path to a PIREP CSV file (e.g., 'updated_CSVs/csv_fl_rem.csv') or
+        PIREP store directory, preprocessed or raw
+    merra2_dir : str
+        Directory containing MERRA-2 data files
+    output_dir : str, optional
+        Directory to save gridded data. If None, uses default directory (default: None)
+    threshold : float, optional
+        Fraction of reports that must be MOG before voxel is classified as turbulence.
+        If None, uses default from config (default: None)
+    nodata : int, optional
+        No data value. If None, uses default from config (default: None)
+    chunksize : int, optional
+        Number of reports to read at a time. If None, reads the file at once
+        (default: None)
+    years : List[int], optional
+        Years to grid. If None, grids every year present in the file (default: None)
+    hours : int, optional
+        Time bin width in hours, one of ``TIME_BIN_HOURS``. If None, bins by
+        calendar day (default: None)
+    vertical : str, optional
+        MERRA-2 field used to find each report's model level, one of
+        ``VOXEL_VERTICAL_COORDINATES``: 'PL' compares pressure with the
+        standard-atmosphere pressure of the flight level, 'H' compares
+        height with the flight level's pressure altitude (default: "PL")
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> wab.grid_pireps_3d(
+    ...     'updated_CSVs/csv_fl_rem.csv',
+    ...     merra2_dir='./MERRA2_2021-2022_1000hPa-100hPa',
+    ...     years=[2021, 2022]
+    ... )
+    >>> wab.create_training_data(merra2_dir='./MERRA2_2021-2022_1000hPa-100hPa', voxels=True)
+    """
+    # Use defaults if not provided
+    if output_dir is None:
+        output_dir = DEFAULT_GRIDDED_DATA_DIR
+    if threshold is None:
+        threshold = TURBULENCE_THRESHOLD
+    if nodata is None:
+        nodata = NO_DATA_VALUE
+    if vertical not in VOXEL_VERTICAL_COORDINATES:
+        raise ValueError(f"vertical must be one of {VOXEL_VERTICAL_COORDINATES}, got {vertical!r}")
+    if hours is not None and hours not in TIME_BIN_HOURS:
+        raise ValueError(f"hours must be one of {TIME_BIN_HOURS}, got {hours!r}")
+    
+    # Create output directory
+    sdir = Path(output_dir)
+    sdir.mkdir(parents=True, exist_ok=True)
+    
+    # Count reports per (time bin, grid cell, flight level), then per voxel
+    cells = _aggregate_voxel_reports(pirep_file, chunksize, years, hours)
+    cells = _assign_levels(cells, index_merra2_files(merra2_dir), vertical)
+    
+    for year, year_cells in cells.groupby(_key_years(cells['TIME'].to_numpy())):
+        dates = _write_sparse_year(
+            str(sdir / f"{year}_voxels.nc"),
+            year_cells,
+            threshold,
+            nodata,
+            hours
+        )
+        print(f"Gridded {len(year_cells)} voxels on {len(dates)} dates for {year}")
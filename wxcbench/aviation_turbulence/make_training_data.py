@@ -5,16 +5,635 @@ Extracts MERRA-2 profiles matching turbulence detections from PIREPs
 to create training data for deep learning models.
 """
 
+import os
+import re
+from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import netCDF4 as nc
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from wxcbench.aviation_turbulence.config import (
     FLIGHT_LEVELS,
     DEFAULT_GRIDDED_DATA_DIR,
-    DEFAULT_TRAINING_DATA_DIR
+    DEFAULT_TRAINING_DATA_DIR,
+    MERRA2_LEVELS,
+    MERRA2_TIME_STEP,
+    MERRA2_TREES,
+    MERRA2_FILE_PATTERN,
+    TRAINING_CHUNK_SAMPLES,
+    TRAINING_COMPLEVEL
 )
+from wxcbench.aviation_turbulence.grid_pireps import (
+    merra2_axes,
+    read_gridded_cells,
+    read_gridded_voxels
+)
+from wxcbench.aviation_turbulence.turbulence_diagnostics import (
+    DIAGNOSTIC_VARIABLES,
+    compute_turbulence_diagnostics
+)
+
+
+# MERRA-2 variables extracted for each sample, by source file tree
+PROFILE_VARIABLES = {
+    'U_V_T_RH_OMEGA': ['OMEGA', 'RH', 'T', 'U', 'V'],
+    'H_PL_PHIS': ['H', 'PL'],
+}
+SURFACE_VARIABLES = {
+    'H_PL_PHIS': ['PHIS'],
+}
+
+# Training file variables: (name, dimensions, long name, units)
+TRAINING_VARIABLES = [
+    ('TURBULENCE', ('samples',),
+     'Turbulence Prediction (training labels, 1=turbulence, 0=none)', None),
+    ('T', ('samples', 'z'), 'MERRA 2 Temperature Profile', 'K'),
+    ('U', ('samples', 'z'), 'MERRA 2 U Wind Profile', 'm s-1'),
+    ('V', ('samples', 'z'), 'MERRA 2 V Wind Profile', 'm s-1'),
+    ('OMEGA', ('samples', 'z'), 'MERRA 2 Vertical Velocity Profile', 'Pa s-1'),
+    ('RH', ('samples', 'z'), 'MERRA 2 Relative Humidity Profile', '1'),
+    ('H', ('samples', 'z'), 'MERRA 2 Height Levels', 'm'),
+    ('PHIS', ('samples',), 'MERRA 2 Surface Geopotential', 'm2 s-2'),
+    ('PL', ('samples', 'z'), 'MERRA 2 Pressure at mid-level', 'Pa'),
+]
+
+# Variables of the neighbourhood patches, in the order they are stacked
+PATCH_PROFILE_VARIABLES = [
+    name for name, dims, _, _ in TRAINING_VARIABLES if dims == ('samples', 'z')
+]
+PATCH_SURFACE_VARIABLES = [
+    name for name, dims, _, _ in TRAINING_VARIABLES
+    if dims == ('samples',) and name != 'TURBULENCE'
+]
+
+
+def _create_training_file(
+    fname: Path,
+    voxels: bool = False,
+    patch_size: Optional[int] = None,
+    diagnostics: bool = False
+) -> nc.Dataset:
+    """
+    Create an empty training data file with an unlimited 'samples' dimension.
+    
+    Variables are chunked along 'samples' and zlib-compressed so that batches
+    can be appended as they are extracted.
+    
+    Parameters
+    ----------
+    fname : Path
+        Output file path
+    voxels : bool, optional
+        If True, also stores the MERRA-2 model level of each sample as
+        'LEVEL' (default: False)
+    patch_size : int, optional
+        If given, also stores the patch_size x patch_size neighbourhood of
+        each sample as 'PROFILE_PATCHES' (samples, profile_variables, z,
+        patch_y, patch_x) and 'SURFACE_PATCHES' (samples, surface_variables,
+        patch_y, patch_x) (default: None)
+    diagnostics : bool, optional
+        If True, also stores the ``DIAGNOSTIC_VARIABLES`` (default: False)
+        
+    Returns
+    -------
+    nc.Dataset
+        Training data file open for writing
+    """
+    out = nc.Dataset(str(fname), 'w')
+    out.description = (
+        'Training data for the turbulence prediction benchmark model.\n'
+        'Weather data are MERRA 2 profiles at 18Z.'
+    )
+    
+    # Create the dimensions
+    out.createDimension('samples', None)
+    out.createDimension('z', MERRA2_LEVELS)
+    
+    # Create variables
+    for name, dims, long_name, units in TRAINING_VARIABLES + (DIAGNOSTIC_VARIABLES if diagnostics else []):
+        chunks = (TRAINING_CHUNK_SAMPLES,) + (MERRA2_LEVELS,) * (len(dims) - 1)
+        var = out.createVariable(
+            name, 'float32', dims,
+            zlib=True, complevel=TRAINING_COMPLEVEL, chunksizes=chunks
+        )
+        var.long_name = long_name
+        if units is not None:
+            var.units = units
+            var.fill_value = 1e+15
+    
+    if voxels:
+        var = out.createVariable(
+            'LEVEL', 'i2', ('samples',),
+            zlib=True, complevel=TRAINING_COMPLEVEL, chunksizes=(TRAINING_CHUNK_SAMPLES,)
+        )
+        var.long_name = 'MERRA 2 model level index (z) of the turbulence observation'
+    
+    if patch_size is not None:
+        out.createDimension('profile_variables', len(PATCH_PROFILE_VARIABLES))
+        out.createDimension('surface_variables', len(PATCH_SURFACE_VARIABLES))
+        out.createDimension('patch_y', patch_size)
+        out.createDimension('patch_x', patch_size)
+        
+        # Keep chunks about as large as those of the profile variables
+        n_chunk = max(TRAINING_CHUNK_SAMPLES // patch_size ** 2, 1)
+        for name, kind, variables in [
+            ('PROFILE_PATCHES', 'profile_variables', PATCH_PROFILE_VARIABLES),
+            ('SURFACE_PATCHES', 'surface_variables', PATCH_SURFACE_VARIABLES),
+        ]:
+            dims = ('samples', kind) + (('z',) if kind == 'profile_variables' else ()) + ('patch_y', 'patch_x')
+            var = out.createVariable(
+                name, 'float32', dims,
+                zlib=True, complevel=TRAINING_COMPLEVEL,
+                chunksizes=(n_chunk,) + tuple(len(out.dimensions[d]) for d in dims[1:])
+            )
+            var.long_name = f'MERRA 2 {patch_size}x{patch_size} neighbourhood centred on the sample'
+            var.variable_names = ' '.join(variables)
+    
+    return out
+
+
+def _append_samples(out: nc.Dataset, batch: dict, n_samples: int) -> int:
+    """
+    Append a batch of samples to a training data file.
+    
+    Parameters
+    ----------
+    out : nc.Dataset
+        Training data file created by ``_create_training_file``
+    batch : dict
+        Variable name to array with the batch's samples along the first axis
+    n_samples : int
+        Number of samples already in the file
+        
+    Returns
+    -------
+    int
+        Number of samples in the file after appending
+    """
+    n_new = len(batch['TURBULENCE'])
+    for name, var in out.variables.items():
+        var[n_samples:n_samples + n_new] = np.asarray(batch[name], dtype=var.dtype)
+    return n_samples + n_new
+
+
+def _gather_profiles(
+    mfn1: Optional[nc.Dataset],
+    mfn2: Optional[nc.Dataset],
+    yinds: np.ndarray,
+    xinds: np.ndarray,
+    time_index=0,
+    variables: Optional[List[str]] = None
+) -> dict:
+    """
+    Gather the MERRA-2 profiles of many grid cells with one read per variable.
+    
+    Each variable is read once per time index as the hyperslab spanning all
+    cells at that time, and the individual profiles are then picked out with
+    NumPy fancy indexing instead of issuing one small NetCDF read per cell.
+    
+    Parameters
+    ----------
+    mfn1 : nc.Dataset or None
+        Open MERRA-2 file with the 'U_V_T_RH_OMEGA' variables, or None if
+        none of them are gathered
+    mfn2 : nc.Dataset or None
+        Open MERRA-2 file with the 'H_PL_PHIS' variables, or None if none of
+        them are gathered
+    yinds : np.ndarray
+        Row indices of the cells
+    xinds : np.ndarray
+        Column indices of the cells
+    time_index : int or np.ndarray, optional
+        Time index within the MERRA-2 files, for all cells or per cell
+        (default: 0)
+    variables : List[str], optional
+        Variables to gather. If None, gathers all profile and surface
+        variables (default: None)
+        
+    Returns
+    -------
+    dict
+        Variable name to array of shape (cells, z) for profile variables or
+        (cells,) for surface variables, in the order of the cells
+    """
+    yinds = np.asarray(yinds, dtype=int)
+    xinds = np.asarray(xinds, dtype=int)
+    tinds = np.broadcast_to(np.asarray(time_index, dtype=int), yinds.shape)
+    profiles = {}
+    if yinds.size == 0:
+        return profiles
+    
+    files = {}
+    for tree, mfn in (('U_V_T_RH_OMEGA', mfn1), ('H_PL_PHIS', mfn2)):
+        wanted = PROFILE_VARIABLES.get(tree, []) + SURFACE_VARIABLES.get(tree, [])
+        if variables is not None:
+            wanted = [v for v in wanted if v in variables]
+        if not wanted:
+            continue
+        if mfn is None:
+            raise ValueError(f"The {tree} file is needed to gather {', '.join(wanted)}")
+        files[tree] = mfn
+    
+    times = np.unique(tinds)
+    for t in times:
+        sel = slice(None) if times.size == 1 else tinds == t
+        ysel, xsel = yinds[sel], xinds[sel]
+        
+        # Bounding box of the requested cells
+        y0, y1 = ysel.min(), ysel.max() + 1
+        x0, x1 = xsel.min(), xsel.max() + 1
+        yrel = ysel - y0
+        xrel = xsel - x0
+        
+        for tree, mfn in files.items():
+            for v in PROFILE_VARIABLES.get(tree, []):
+                if variables is not None and v not in variables:
+                    continue
+                block = np.ma.getdata(mfn.variables[v][t, :, y0:y1, x0:x1])
+                values = block[:, yrel, xrel].T
+                if times.size == 1:
+                    profiles[v] = values
+                    continue
+                if v not in profiles:
+                    profiles[v] = np.empty((yinds.size,) + values.shape[1:], values.dtype)
+                profiles[v][sel] = values
+            for v in SURFACE_VARIABLES.get(tree, []):
+                if variables is not None and v not in variables:
+                    continue
+                block = np.ma.getdata(mfn.variables[v][t, y0:y1, x0:x1])
+                values = block[yrel, xrel]
+                if times.size == 1:
+                    profiles[v] = values
+                    continue
+                if v not in profiles:
+                    profiles[v] = np.empty(yinds.size, values.dtype)
+                profiles[v][sel] = values
+    
+    return profiles
+
+
+def _read_padded(
+    variable: nc.Variable,
+    time_index: int,
+    rows: Tuple[int, int],
+    cols: Tuple[int, int],
+    radius: int
+) -> Tuple[np.ndarray, int]:
+    """
+    Read a block of grid cells of a MERRA-2 variable with a border of radius cells.
+    
+    The border wraps around in longitude and repeats the edge rows beyond the
+    poles. The whole rows are read if the border crosses the date line.
+    
+    Returns
+    -------
+    tuple
+        (block, x_origin) where block[..., 0, 0] is the cell at
+        (rows[0] - radius, x_origin - radius)
+    """
+    ny, nx = variable.shape[-2:]
+    y0, y1 = max(rows[0] - radius, 0), min(rows[1] + radius, ny)
+    if cols[0] - radius >= 0 and cols[1] + radius <= nx:
+        x_origin, xsel, xpad = cols[0], slice(cols[0] - radius, cols[1] + radius), (0, 0)
+    else:
+        x_origin, xsel, xpad = 0, slice(None), (radius, radius)
+    
+    lead = (time_index,) + (slice(None),) * (variable.ndim - 3)
+    block = np.ma.getdata(variable[lead + (slice(y0, y1), xsel)])
+    keep = [(0, 0)] * (block.ndim - 2)
+    block = np.pad(block, keep + [(0, 0), xpad], mode='wrap')
+    block = np.pad(block, keep + [(radius - (rows[0] - y0), radius - (y1 - rows[1])), (0, 0)], mode='edge')
+    return block, x_origin
+
+
+def _gather_patches(
+    mfn1: nc.Dataset,
+    mfn2: nc.Dataset,
+    yinds: np.ndarray,
+    xinds: np.ndarray,
+    time_index=0,
+    patch_size: int = 1
+) -> dict:
+    """
+    Gather the MERRA-2 neighbourhood patches of many grid cells.
+    
+    Each variable is read once per time index over the rows and columns
+    spanning all cells plus a border of half a patch, and the patches of all
+    cells are then picked out of a sliding-window view of that block in one
+    fancy-indexing operation, without a loop over the cells.
+    
+    Parameters
+    ----------
+    mfn1 : nc.Dataset
+        Open MERRA-2 file with the 'U_V_T_RH_OMEGA' variables
+    mfn2 : nc.Dataset
+        Open MERRA-2 file with the 'H_PL_PHIS' variables
+    yinds : np.ndarray
+        Row indices of the cells
+    xinds : np.ndarray
+        Column indices of the cells
+    time_index : int or np.ndarray, optional
+        Time index within the MERRA-2 files, for all cells or per cell
+        (default: 0)
+    patch_size : int, optional
+        Odd width of the square patches in grid cells (default: 1)
+        
+    Returns
+    -------
+    dict
+        'PROFILE_PATCHES' of shape (cells, profile variables, z, patch_size,
+        patch_size) and 'SURFACE_PATCHES' of shape (cells, surface variables,
+        patch_size, patch_size), with variables in ``PATCH_PROFILE_VARIABLES``
+        and ``PATCH_SURFACE_VARIABLES`` order
+    """
+    yinds = np.asarray(yinds, dtype=int)
+    xinds = np.asarray(xinds, dtype=int)
+    tinds = np.broadcast_to(np.asarray(time_index, dtype=int), yinds.shape)
+    radius = patch_size // 2
+    
+    variables = {
+        v: mfn.variables[v]
+        for tree, mfn in (('U_V_T_RH_OMEGA', mfn1), ('H_PL_PHIS', mfn2))
+        for v in PROFILE_VARIABLES.get(tree, []) + SURFACE_VARIABLES.get(tree, [])
+    }
+    patches = {
+        'PROFILE_PATCHES': np.empty(
+            (yinds.size, len(PATCH_PROFILE_VARIABLES), MERRA2_LEVELS, patch_size, patch_size), np.float32
+        ),
+        'SURFACE_PATCHES': np.empty(
+            (yinds.size, len(PATCH_SURFACE_VARIABLES), patch_size, patch_size), np.float32
+        ),
+    }
+    if yinds.size == 0:
+        return patches
+    
+    for t in np.unique(tinds):
+        sel = np.nonzero(tinds == t)[0]
+        ysel, xsel = yinds[sel], xinds[sel]
+        rows = (int(ysel.min()), int(ysel.max()) + 1)
+        cols = (int(xsel.min()), int(xsel.max()) + 1)
+        
+        for name, names in (('PROFILE_PATCHES', PATCH_PROFILE_VARIABLES),
+                            ('SURFACE_PATCHES', PATCH_SURFACE_VARIABLES)):
+            for j, v in enumerate(names):
+                block, x_origin = _read_padded(variables[v], int(t), rows, cols, radius)
+                windows = np.lib.stride_tricks.sliding_window_view(
+                    block, (patch_size, patch_size), axis=(-2, -1)
+                )
+                # windows[..., y, x, :, :] is the patch centred on (rows[0] + y, x_origin + x)
+                values = windows[..., ysel - rows[0], xsel - x_origin, :, :]
+                patches[name][sel, j] = np.moveaxis(values, -3, 0)
+    
+    return patches
+
+
+def _analysis_time(date: str) -> Tuple[str, Optional[int]]:
+    """
+    Find the MERRA-2 analysis time nearest to a gridded turbulence date.
+    
+    Parameters
+    ----------
+    date : str
+        YYYYMMDD for daily grids or YYYYMMDDHH for sub-daily grids
+        
+    Returns
+    -------
+    tuple
+        (YYYYMMDD, hour) of the nearest analysis time, which may fall on the
+        next day; hour is None for daily grids
+    """
+    if len(date) == 8:
+        return date, None
+    stamp = datetime.strptime(date, '%Y%m%d%H')
+    hours = round(stamp.hour / MERRA2_TIME_STEP) * MERRA2_TIME_STEP
+    stamp = stamp.replace(hour=0) + timedelta(hours=hours)
+    return stamp.strftime('%Y%m%d'), stamp.hour
+
+
+def _merra2_time_index(mfn: nc.Dataset, hour: Optional[int]) -> int:
+    """Index of the time nearest to an hour (UTC) within a daily MERRA-2 file."""
+    if hour is None:
+        return 0
+    if 'time' in mfn.variables:
+        # MERRA-2 times are minutes since 00Z of the file's day
+        minutes = np.ma.getdata(mfn.variables['time'][:]).astype(np.float64)
+        return int(np.abs(minutes - hour * 60).argmin())
+    return min(hour // MERRA2_TIME_STEP, len(mfn.dimensions['time']) - 1)
+
+
+def index_merra2_files(merra2_dir: str) -> Dict[str, Tuple[str, str]]:
+    """
+    Index the MERRA-2 files available for each date.
+    
+    Both MERRA-2 trees are listed once and every file name is parsed with
+    ``MERRA2_FILE_PATTERN``, so no file is opened. Any stream version is
+    accepted. Where a date has files from several streams (e.g. a 401
+    reprocessing of a 400 day), the highest stream number is used.
+    
+    Parameters
+    ----------
+    merra2_dir : str
+        Directory containing the 'U_V_T_RH_OMEGA' and 'H_PL_PHIS' trees
+        
+    Returns
+    -------
+    Dict[str, Tuple[str, str]]
+        Date (YYYYMMDD) to the (U_V_T_RH_OMEGA, H_PL_PHIS) file paths, for
+        the dates present in both trees
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> files = wab.index_merra2_files('./MERRA2_2021-2022_1000hPa-100hPa')
+    >>> files['20220101']
+    """
+    pattern = re.compile(MERRA2_FILE_PATTERN)
+    trees = []
+    
+    for tree in MERRA2_TREES:
+        found = {}
+        tree_dir = Path(merra2_dir) / tree
+        if tree_dir.is_dir():
+            for entry in os.scandir(tree_dir):
+                match = pattern.match(entry.name)
+                if match is None:
+                    continue
+                stream, date = match.groups()
+                if date not in found or stream > found[date][0]:
+                    found[date] = (stream, entry.path)
+        trees.append(found)
+    
+    dates = sorted(set.intersection(*(set(found) for found in trees)))
+    return {d: tuple(found[d][1] for found in trees) for d in dates}
+
+
+def _sample_negatives(
+    labels: np.ndarray,
+    negative_ratio: Optional[float],
+    max_negatives: Optional[int],
+    rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Choose the samples to keep: every positive and a random subset of negatives.
+    
+    Parameters
+    ----------
+    labels : np.ndarray
+        Labels of the candidate samples (0 for no turbulence)
+    negative_ratio : float, optional
+        Largest number of negatives kept per positive
+    max_negatives : int, optional
+        Largest number of negatives kept in total
+    rng : np.random.Generator
+        Generator choosing the negatives
+        
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the kept samples
+    """
+    negatives = np.nonzero(labels == 0)[0]
+    n_keep = negatives.size
+    if negative_ratio is not None:
+        n_keep = min(n_keep, int(negative_ratio * (labels.size - negatives.size)))
+    if max_negatives is not None:
+        n_keep = min(n_keep, max_negatives)
+    if n_keep == negatives.size:
+        return np.arange(labels.size)
+    
+    kept = np.zeros(labels.size, dtype=bool)
+    kept[labels != 0] = True
+    kept[rng.choice(negatives, size=n_keep, replace=False)] = True
+    return np.nonzero(kept)[0]
+
+
+def _extract_day(
+    turbulence_file: str,
+    bins: List[Tuple[int, Optional[int]]],
+    merra2_files: Tuple[str, str],
+    patch_size: Optional[int] = None,
+    diagnostics: bool = False,
+    sampling: Optional[dict] = None
+) -> Optional[dict]:
+    """
+    Extract the training samples of all time bins matched to one MERRA-2 day.
+    
+    Parameters
+    ----------
+    turbulence_file : str
+        Gridded turbulence file
+    bins : List[Tuple[int, Optional[int]]]
+        (time index within the turbulence file, analysis hour) of each bin,
+        with hour None for daily grids
+    merra2_files : Tuple[str, str]
+        The day's (U_V_T_RH_OMEGA, H_PL_PHIS) MERRA-2 files
+    patch_size : int, optional
+        If given, gathers the patch_size x patch_size neighbourhood of every
+        cell and takes the profiles from the patch centres (default: None)
+    diagnostics : bool, optional
+        If True, adds the turbulence diagnostics of every sample, computed
+        from the same gathered fields. At least the 3 x 3 neighbourhood of
+        every cell is gathered for the horizontal derivatives (default: False)
+    sampling : dict, optional
+        Negative subsampling policy with the keys 'negative_ratio',
+        'max_negatives' and 'seed' of ``create_training_data``, and 'day',
+        the MERRA-2 date (YYYYMMDD) mixed into the seed. Cells are dropped
+        before any MERRA-2 file is opened. If None, keeps every cell
+        (default: None)
+        
+    Returns
+    -------
+    dict or None
+        Batch of samples for ``_append_samples`` in bin order, with 'LEVEL'
+        for voxel files, the patches if patch_size is given and the
+        diagnostics if requested, or None if no cells are kept
+    """
+    # Extract points that have turbulence (and their indices)
+    with nc.Dataset(turbulence_file) as tfn:
+        voxels = 'LevelIndex' in tfn.variables
+        read = read_gridded_voxels if voxels else read_gridded_cells
+        cells = [read(tfn, index) for index, _ in bins]
+    sizes = [parts[-1].size for parts in cells]
+    bin_of_cell = np.repeat(np.arange(len(bins)), sizes)
+    cells = [np.concatenate(parts) for parts in zip(*cells)]
+    
+    # Drop negatives before reading MERRA-2; the seed is per day, so the
+    # choice does not depend on how days are spread over workers
+    if sampling is not None:
+        seed = sampling['seed']
+        rng = np.random.default_rng(None if seed is None else [seed, sampling['day']])
+        keep = _sample_negatives(cells[-1], sampling['negative_ratio'], sampling['max_negatives'], rng)
+        cells = [part[keep] for part in cells]
+        bin_of_cell = bin_of_cell[keep]
+    if cells[-1].size == 0:
+        return None
+    
+    # Gather the MERRA-2 weather profiles of all those points at once
+    with nc.Dataset(merra2_files[0]) as mfn1, nc.Dataset(merra2_files[1]) as mfn2:
+        tinds = np.array([_merra2_time_index(mfn1, hour) for _, hour in bins])[bin_of_cell]
+        # The Ellrod index needs the winds of the neighbouring cells
+        gather_size = patch_size
+        if diagnostics and (patch_size or 1) < 3:
+            gather_size = 3
+        
+        if gather_size is None:
+            batch = _gather_profiles(mfn1, mfn2, cells[-3], cells[-2], tinds)
+        else:
+            batch = _gather_patches(mfn1, mfn2, cells[-3], cells[-2], tinds, gather_size)
+            centre = gather_size // 2
+            for j, v in enumerate(PATCH_PROFILE_VARIABLES):
+                batch[v] = batch['PROFILE_PATCHES'][:, j, :, centre, centre]
+            for j, v in enumerate(PATCH_SURFACE_VARIABLES):
+                batch[v] = batch['SURFACE_PATCHES'][:, j, centre, centre]
+    
+    if diagnostics:
+        around = slice(centre - 1, centre + 2)
+        winds = [
+            batch['PROFILE_PATCHES'][:, PATCH_PROFILE_VARIABLES.index(v), :, around, around]
+            for v in ('U', 'V')
+        ]
+        lat = merra2_axes()[1][cells[-3]]
+        batch.update(compute_turbulence_diagnostics(batch, lat, *winds))
+        
+        # Keep only the patches that were asked for
+        if patch_size is None:
+            del batch['PROFILE_PATCHES'], batch['SURFACE_PATCHES']
+        elif patch_size < gather_size:
+            for name in ('PROFILE_PATCHES', 'SURFACE_PATCHES'):
+                batch[name] = batch[name][..., centre:centre + 1, centre:centre + 1]
+    batch['TURBULENCE'] = cells[-1]
+    if voxels:
+        batch['LEVEL'] = cells[0]
+    return batch
+
+
+def _ordered_map(
+    func: Callable,
+    tasks: list,
+    executor: Optional[ProcessPoolExecutor],
+    window: int
+) -> Iterator:
+    """
+    Apply func to each task, yielding results in task order.
+    
+    At most ``window`` tasks are in flight at once, so completed results
+    waiting behind a slower earlier task cannot pile up in memory.
+    """
+    if executor is None:
+        for task in tasks:
+            yield func(*task)
+        return
+    
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(func, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 
 def create_training_data(
@@ -22,7 +641,14 @@ def create_training_data(
     merra2_dir: Optional[str] = None,
     years: Optional[List[int]] = None,
     levels: Optional[List[str]] = None,
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    n_workers: int = 1,
+    voxels: bool = False,
+    patch_size: Optional[int] = None,
+    diagnostics: bool = False,
+    negative_ratio: Optional[float] = None,
+    max_negatives_per_day: Optional[int] = None,
+    seed: Optional[int] = None
 ) -> None:
     """
     Create training data by extracting MERRA-2 profiles matching turbulence detections.
@@ -30,10 +656,51 @@ def create_training_data(
     This function extracts MERRA-2 weather profiles at locations where turbulence
     was detected from PIREPs, creating training data files for deep learning models.
     
+    Gridded files binned by hour (see the ``hours`` argument of
+    ``grid_pireps``) are matched to the nearest 3-hourly MERRA-2 analysis
+    time, and each MERRA-2 day's bins are gathered together from the
+    matching time slices. Daily grids use the first time in each file.
+    
+    Each day's observed cells are read with ``read_gridded_cells``. With the
+    sparse gridded layout they are read directly, so extraction cost scales
+    with the number of observed cells rather than the grid size.
+    
+    For each day, every MERRA-2 variable is read once over the region covering
+    that day's observed cells and all profiles are gathered from it in memory.
+    Each day's samples are then appended to the output file, so memory use is
+    bounded by a single day regardless of how many years are processed.
+    
+    The MERRA-2 files of every date are resolved once with
+    ``index_merra2_files`` before extraction starts, and dates without
+    MERRA-2 files are reported and skipped.
+    
+    With ``patch_size``, the N x N neighbourhood of MERRA-2 profiles around
+    every sample is also written. Each variable is then read once per day
+    over the observed rows plus a border, wrapped around in longitude and
+    padded with the edge rows beyond the poles, and all patches are gathered
+    from a sliding-window view of that block in one operation.
+    
+    With ``diagnostics``, the turbulence diagnostics of
+    ``compute_turbulence_diagnostics`` (Brunt-Vaisala frequency, vertical wind
+    shear, Richardson number and Ellrod index) are computed for all of a
+    day's samples at once from the gathered fields and written as extra
+    variables, so no second pass over the training data is needed.
+    
+    Most observed cells are negatives (no turbulence). With
+    ``negative_ratio`` or ``max_negatives_per_day``, every positive is kept
+    and a random subset of each MERRA-2 day's negatives is chosen before any
+    MERRA-2 data are read, so extraction reads and output shrink with the
+    number of dropped cells. The choice for each day is seeded from ``seed``
+    and the date, so it is reproducible for any ``n_workers``.
+    
+    Days are independent, so with ``n_workers`` > 1 they are extracted in
+    separate worker processes. Results are still written in date order by a
+    single writer, and the output is identical to a serial run.
+    
     Parameters
     ----------
     turbulence_dir : str, optional
-        Directory containing the gridded turbulence files.
+        Directory containing the gridded turbulence files, in any layout.
         If None, uses default from config (default: None)
     merra2_dir : str, optional
         Directory containing MERRA-2 data files (default: None)
@@ -43,6 +710,34 @@ def create_training_data(
         Flight levels to process. If None, uses ['low', 'med', 'high'] (default: None)
     output_dir : str, optional
         Directory to save training data files. If None, uses default from config (default: None)
+    n_workers : int, optional
+        Number of worker processes extracting days. If 1, runs in the current
+        process (default: 1)
+    voxels : bool, optional
+        If True, reads the voxel files written by ``grid_pireps_3d``
+        ('{year}_voxels.nc') instead of the flight-level files and writes a
+        single 'training_data_voxels.nc' with the model level of each sample
+        as 'LEVEL'. Each MERRA-2 day is read once for all levels, and levels
+        is ignored (default: False)
+    patch_size : int, optional
+        Odd width N of a square neighbourhood of grid cells. If given, every
+        file also holds 'PROFILE_PATCHES' of shape (samples, vars, z, N, N)
+        and 'SURFACE_PATCHES' of shape (samples, vars, N, N) centred on each
+        sample, with the variable names in their 'variable_names' attribute
+        (default: None)
+    diagnostics : bool, optional
+        If True, also writes the 'N2', 'VWS', 'RI' and 'ELLROD' diagnostics of
+        every sample and level (default: False)
+    negative_ratio : float, optional
+        Largest number of negative samples kept per positive sample of the
+        same MERRA-2 day; days without positives keep no negatives. If None,
+        the number of negatives is not tied to the positives (default: None)
+    max_negatives_per_day : int, optional
+        Largest number of negative samples kept per MERRA-2 day. If None,
+        there is no cap (default: None)
+    seed : int, optional
+        Seed of the negative subsampling, for reproducible training files
+        (default: None)
         
     Examples
     --------
@@ -50,7 +745,8 @@ def create_training_data(
     >>> wab.create_training_data(
     ...     turbulence_dir='./gridded_data',
     ...     merra2_dir='./MERRA2_2021-2022_1000hPa-100hPa',
-    ...     years=[2021, 2022]
+    ...     years=[2021, 2022],
+    ...     n_workers=8
     ... )
     """
     # Use defaults if not provided
@@ -62,201 +758,84 @@ def create_training_data(
         years = [2021, 2022]
     if levels is None:
         levels = FLIGHT_LEVELS
+    if voxels:
+        levels = ['voxels']
     
     if merra2_dir is None:
         raise ValueError("merra2_dir must be provided")
+    if patch_size is not None and (patch_size < 1 or patch_size % 2 == 0):
+        raise ValueError(f"patch_size must be a positive odd number, got {patch_size}")
+    if negative_ratio is not None and negative_ratio < 0:
+        raise ValueError(f"negative_ratio must not be negative, got {negative_ratio}")
+    if max_negatives_per_day is not None and max_negatives_per_day < 0:
+        raise ValueError(f"max_negatives_per_day must not be negative, got {max_negatives_per_day}")
+    sampling = None
+    if negative_ratio is not None or max_negatives_per_day is not None:
+        sampling = {
+            'negative_ratio': negative_ratio,
+            'max_negatives': max_negatives_per_day,
+            'seed': seed,
+        }
     
     # Create output directory
     sdir = Path(output_dir)
     sdir.mkdir(parents=True, exist_ok=True)
     
     tdir = Path(turbulence_dir)
-    mdir = Path(merra2_dir)
-    
-    # Create indices that match the MERRA-2 grid
-    yinds = np.arange(0, 361, dtype='int')
-    xinds = np.arange(0, 576, dtype='int')
-    xg, yg = np.meshgrid(xinds, yinds)
-    
-    # Loop over the levels
-    for level in levels:
-        # Dictionary to hold the data for writing
-        data = {
-            'TURB': [],
-            'OMEGA': [],
-            'RH': [],
-            'T': [],
-            'U': [],
-            'V': [],
-            'H': [],
-            'PL': [],
-            'PHIS': []
-        }
-        
-        # Loop over the years
-        for year in years:
-            # Open the Turbulence file
-            tfn = nc.Dataset(str(tdir / f'{year}_{level}_fl.nc'))
-            dates = tfn.variables['Dates'][:]
-            turbulence = tfn.variables['Turbulence'][:]
-            tfn.close()
-            
-            # Loop over the dates
-            mdate = '00000000'
-            mfn1 = None
-            mfn2 = None
+    
+    # Find the MERRA-2 files of every date once, up front
+    merra2_files = index_merra2_files(merra2_dir)
+    
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    
+    try:
+        # Loop over the levels
+        for level in levels:
+            name = level if voxels else f'{level}_fl'
             
-            for i, d in enumerate(dates):
-                # Decode date if it's bytes
-                if isinstance(d, bytes):
-                    d = d.decode('utf-8')
+            # Samples are appended to the output file one day at a time
+            out = _create_training_file(sdir / f'training_data_{name}.nc', voxels, patch_size, diagnostics)
+            try:
+                if sampling is not None:
+                    out.negative_sampling = ', '.join(f'{k}={v}' for k, v in sampling.items())
+                n_samples = 0
                 
-                # Check if currently open MERRA-2 file is correct
-                if d != mdate:
-                    # Close previous files
-                    try:
-                        if mfn1:
-                            mfn1.close()
-                        if mfn2:
-                            mfn2.close()
-                    except:
-                        pass
-                    
-                    # Open matching MERRA-2 file
-                    try:
-                        mfn1 = nc.Dataset(
-                            str(mdir / 'U_V_T_RH_OMEGA' / 
-                                f'MERRA2_400.inst3_3d_asm_Nv.{d}.SUB.nc')
-                        )
-                        mfn2 = nc.Dataset(
-                            str(mdir / 'H_PL_PHIS' / 
-                                f'MERRA2_400.inst3_3d_asm_Nv.{d}.SUB.nc')
-                        )
-                        mdate = d
-                    except Exception as err:
-                        try:
-                            mfn1 = nc.Dataset(
-                                str(mdir / 'U_V_T_RH_OMEGA' / 
-                                    f'MERRA2_401.inst3_3d_asm_Nv.{d}.SUB.nc')
-                            )
-                            mfn2 = nc.Dataset(
-                                str(mdir / 'H_PL_PHIS' / 
-                                    f'MERRA2_401.inst3_3d_asm_Nv.{d}.SUB.nc')
-                            )
-                            mdate = d
-                        except:
-                            print(f"Error opening MERRA-2 files for date {d}: {err}")
-                            continue
+                # One task per MERRA-2 day, in year and date order
+                tasks = []
+                missing = []
+                for year in years:
+                    tfile = str(tdir / f'{year}_{name}.nc')
+                    with nc.Dataset(tfile) as tfn:
+                        dates = tfn.variables['Dates'][:]
+                    for i, d in enumerate(dates):
+                        # Decode date if it's bytes
+                        if isinstance(d, bytes):
+                            d = d.decode('utf-8')
+                        mday, hour = _analysis_time(str(d))
+                        if mday not in merra2_files:
+                            missing.append(d)
+                        elif tasks and tasks[-1][0] == tfile and tasks[-1][2] == merra2_files[mday]:
+                            tasks[-1][1].append((i, hour))
+                        else:
+                            day_sampling = None if sampling is None else dict(sampling, day=int(mday))
+                            tasks.append((tfile, [(i, hour)], merra2_files[mday], patch_size, diagnostics, day_sampling))
                 
-                # Extract points that have turbulence (and their indices)
-                mask = turbulence[i, :, :] != 2
-                turb = turbulence[i, :, :][mask]
-                xinds_mask = xg[mask]
-                yinds_mask = yg[mask]
+                if missing:
+                    shown = ', '.join(missing[:10]) + (', ...' if len(missing) > 10 else '')
+                    print(f"No MERRA-2 files for {len(missing)} {level} dates, skipping: {shown}")
                 
-                # Loop over just those points
-                for xind, yind, t in zip(xinds_mask, yinds_mask, turb):
-                    # Store the turbulence data
-                    data['TURB'].append(t)
-                    
-                    # Extract the MERRA-2 weather profile
-                    for v in ['OMEGA', 'RH', 'T', 'U', 'V']:
-                        data[v].append(
-                            np.squeeze(mfn1.variables[v][0, :, int(yind), int(xind)])
-                        )
-                    
-                    for v in ['H', 'PL']:
-                        data[v].append(
-                            np.squeeze(mfn2.variables[v][0, :, int(yind), int(xind)])
-                        )
-                    
-                    data['PHIS'].append(
-                        np.squeeze(mfn2.variables['PHIS'][0, int(yind), int(xind)])
-                    )
+                # Results arrive in task order, so the file matches a serial run
+                for batch in _ordered_map(_extract_day, tasks, executor, 2 * n_workers):
+                    if batch is not None:
+                        n_samples = _append_samples(out, batch, n_samples)
+            finally:
+                # Close the output file, also if a day failed
+                out.close()
             
-            # Close any MERRA-2 files that remain open
-            try:
-                if mfn1:
-                    mfn1.close()
-                if mfn2:
-                    mfn2.close()
-            except:
-                pass
-        
-        # Save to output file
-        out = nc.Dataset(str(sdir / f'training_data_{level}_fl.nc'), 'w')
-        out.description = (
-            'Training data for the turbulence prediction benchmark model.\n'
-            'Weather data are MERRA 2 profiles at 18Z.'
-        )
-        
-        # Create the dimensions
-        s_dim = out.createDimension('samples', len(data['TURB']))
-        z_dim = out.createDimension('z', 34)
-        
-        # Create variables
-        turb_var = out.createVariable('TURBULENCE', 'float32', ('samples',))
-        turb_var.long_name = 'Turbulence Prediction (training labels, 1=turbulence, 0=none)'
-        turb_var[:] = np.array(data['TURB'])
-        
-        # Temperature
-        t_var = out.createVariable('T', 'float32', ('samples', 'z'))
-        t_var.long_name = 'MERRA 2 Temperature Profile'
-        t_var.units = 'K'
-        t_var.fill_value = 1e+15
-        t_var[:] = np.array(data['T'], dtype=np.float32)
-        
-        # U Wind
-        u_var = out.createVariable('U', 'float32', ('samples', 'z'))
-        u_var.long_name = 'MERRA 2 U Wind Profile'
-        u_var.units = 'm s-1'
-        u_var.fill_value = 1e+15
-        u_var[:] = np.array(data['U'], dtype=np.float32)
-        
-        # V Wind
-        v_var = out.createVariable('V', 'float32', ('samples', 'z'))
-        v_var.long_name = 'MERRA 2 V Wind Profile'
-        v_var.units = 'm s-1'
-        v_var.fill_value = 1e+15
-        v_var[:] = np.array(data['V'], dtype=np.float32)
-        
-        # Vertical Velocity
-        o_var = out.createVariable('OMEGA', 'float32', ('samples', 'z'))
-        o_var.long_name = 'MERRA 2 Vertical Velocity Profile'
-        o_var.units = 'Pa s-1'
-        o_var.fill_value = 1e+15
-        o_var[:] = np.array(data['OMEGA'], dtype=np.float32)
-        
-        # Relative Humidity
-        q_var = out.createVariable('RH', 'float32', ('samples', 'z'))
-        q_var.long_name = 'MERRA 2 Relative Humidity Profile'
-        q_var.units = '1'
-        q_var.fill_value = 1e+15
-        q_var[:] = np.array(data['RH'], dtype=np.float32)
-        
-        # Height
-        h_var = out.createVariable('H', 'float32', ('samples', 'z'))
-        h_var.long_name = 'MERRA 2 Height Levels'
-        h_var.units = 'm'
-        h_var.fill_value = 1e+15
-        h_var[:] = np.array(data['H'], dtype=np.float32)
-        
-        # Surface Geopotential
-        s_var = out.createVariable('PHIS', 'float32', ('samples',))
-        s_var.long_name = 'MERRA 2 Surface Geopotential'
-        s_var.units = 'm2 s-2'
-        s_var.fill_value = 1e+15
-        s_var[:] = np.array(data['PHIS'], dtype=np.float32)
-        
-        # Pressure
-        p_var = out.createVariable('PL', 'float32', ('samples', 'z'))
-        p_var.long_name = 'MERRA 2 Pressure at mid-level'
-        p_var.units = 'Pa'
-        p_var.fill_value = 1e+15
-        p_var[:] = np.array(data['PL'], dtype=np.float32)
-        
-        # Close the output file
-        out.close()
-        
-        print(f"Created training data for {level} flight level with {len(data['TURB'])} samples")
-
+            if voxels:
+                print(f"Created voxel training data with {n_samples} samples")
+            else:
+                print(f"Created training data for {level} flight level with {n_samples} samples")
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -9,6 +9,30 @@ import pandas as pd
 from pathlib import Path
 from typing import Optional
 
+from wxcbench.aviation_turbulence.config import MOG_INTENSITY
+from wxcbench.aviation_turbulence.pirep_store import read_pireps, to_text_pireps
+from wxcbench.aviation_turbulence.turb_eda_preprocessing import (
+    parse_reports,
+    split_flight_levels
+)
+
+
+def select_modg(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Select moderate-or-greater (MODG) turbulence reports.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs with an 'Intensity' column as added by ``parse_reports``
+        
+    Returns
+    -------
+    pd.DataFrame
+        Reports with Intensity >= MOG_INTENSITY
+    """
+    return df[(df['Intensity'] >= MOG_INTENSITY).to_numpy()]
+
 
 def preprocess_modg(
     input_file: str,
@@ -17,13 +41,19 @@ def preprocess_modg(
     """
     Filter PIREP data for moderate-or-greater (MODG) turbulence reports.
     
-    This function filters for MODG turbulence reports, downloads additional
-    filtered data if needed, and creates MODG flight-level specific files.
+    This function filters for MODG turbulence reports and creates MODG
+    flight-level specific files (low_fl_modg.csv, med_fl_modg.csv,
+    high_fl_modg.csv) alongside csv_modg_all.csv.
+    
+    The input is normally the output of ``preprocess_turb_eda``. Raw PIREPs
+    are accepted too and are parsed first. To produce both sets of files from
+    raw PIREPs in a single read, use ``preprocess_pireps`` instead.
     
     Parameters
     ----------
     input_file : str
-        Path to input CSV file (e.g., 'updated_CSVs/csv_fl_rem.csv')
+        Path to input CSV file (e.g., 'updated_CSVs/csv_fl_rem.csv') or
+        PIREP store directory
     output_dir : str, optional
         Directory to save processed files. Creates 'updated_CSVs' subdirectory.
         If None, uses current directory (default: None)
@@ -44,22 +74,23 @@ def preprocess_modg(
     output_path = Path(output_dir) / "updated_CSVs"
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Read the input file
-    df = pd.read_csv(input_file)
+    # Read the input file, parsing it if it has not been preprocessed yet
+    df = read_pireps(input_file)
+    if 'Intensity' not in df.columns or 'FLIGHT_LEVEL' not in df.columns:
+        df = parse_reports(df)
     
-    # TODO: Add actual MODG filtering logic from the notebook
-    # This should include:
-    # - Filtering for moderate or greater turbulence
-    # - Creating csv_modg_all.csv
-    # - Creating MODG flight-level specific files:
-    #   - low_fl_modg.csv
-    #   - med_fl_modg.csv
-    #   - high_fl_modg.csv
+    # Filter for moderate or greater turbulence
+    df = select_modg(df)
     
-    # Placeholder: Save filtered file
+    # Times are written in the downloaded format
     output_file = output_path / "csv_modg_all.csv"
-    df.to_csv(output_file, index=False)
+    text = to_text_pireps(df)
+    text.to_csv(output_file, index=False)
+    
+    # Create MODG flight-level specific files
+    for level, level_df in split_flight_levels(text):
+        level_df.to_csv(output_path / f"{level}_fl_modg.csv", index=False)
+        print(f"{level}_fl_modg.csv: {len(level_df)} reports")
     
     print(f"MODG preprocessing complete. Output saved to {output_file}")
     return df
-
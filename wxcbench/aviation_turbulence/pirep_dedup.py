@@ -0,0 +1,332 @@
+"""
+PIREP De-duplication Module
+
+Removes repeated reports of the same turbulence encounter: reports that
+match an earlier kept report within a time window, a distance radius and a
+flight level window. Candidates are found by hashing reports into
+space-time grid cells, so no pairwise comparison of all reports is needed.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Tuple
+
+from wxcbench.aviation_turbulence.config import (
+    DEDUP_TIME_WINDOW,
+    DEDUP_RADIUS_KM,
+    DEDUP_FL_WINDOW,
+    DEDUP_BLOCK_SIZE,
+    EARTH_RADIUS_KM
+)
+from wxcbench.aviation_turbulence.pirep_store import parse_valid_times
+from wxcbench.aviation_turbulence.pirep_parsing import (
+    parse_flight_level,
+    parse_report_intensity
+)
+
+_UNDECIDED, _KEPT, _DROPPED = 0, 1, 2
+
+# Fraction of the undecided reports a vectorized round must decide
+_MIN_ROUND_PROGRESS = 1 / 16
+
+# Random odd multipliers of a linear 64-bit hash of the cell coordinates;
+# moving a report one cell along a dimension adds that dimension's multiplier
+_HASH_MULTIPLIERS = np.random.default_rng(0x5EED).integers(
+    0, np.iinfo(np.int64).max, size=8, dtype=np.int64
+).astype(np.uint64) | np.uint64(1)
+
+
+def _report_fields(df: pd.DataFrame, by: List[str]) -> Tuple[np.ndarray, ...]:
+    """
+    Extract the fields compared between reports.
+    
+    Raw PIREPs without 'FL' or 'Intensity' columns are parsed on the fly.
+    
+    Returns
+    -------
+    tuple
+        (minutes, lat, lon, fl, group) where minutes is the report time in
+        minutes (NaN if unknown) and group codes the exact-match columns
+        (-1 if any of them is missing)
+    """
+    valid = parse_valid_times(df['VALID'])
+    minutes = valid.to_numpy(dtype='datetime64[m]').astype(np.int64).astype(np.float64)
+    minutes[valid.isna().to_numpy()] = np.nan
+    
+    lat = pd.to_numeric(df['LAT'], errors='coerce').to_numpy(dtype=np.float64)
+    lon = pd.to_numeric(df['LON'], errors='coerce').to_numpy(dtype=np.float64)
+    if 'FL' in df.columns:
+        fl = pd.to_numeric(df['FL'], errors='coerce')
+    else:
+        fl = parse_flight_level(df['REPORT'])
+    fl = fl.to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    columns = {}
+    for name in by:
+        if name == 'Intensity' and name not in df.columns:
+            columns[name] = parse_report_intensity(df)
+        else:
+            columns[name] = df[name]
+    if columns:
+        columns = pd.DataFrame(columns)
+        group = columns.groupby(list(columns), sort=False, dropna=False).ngroup()
+        group = np.where(columns.isna().any(axis=1), -1, group.to_numpy(dtype=np.int64))
+    else:
+        group = np.zeros(len(df), dtype=np.int64)
+    return minutes, lat, lon, fl, group
+
+
+def _cell_hash(cells: List[np.ndarray]) -> np.ndarray:
+    """Combine integer cell coordinates into one 64-bit hash per row."""
+    key = np.zeros(len(cells[0]), dtype=np.uint64)
+    for cell, multiplier in zip(cells, _HASH_MULTIPLIERS):
+        key += cell.astype(np.int64).view(np.uint64) * multiplier
+    return key
+
+
+def _candidate_pairs(
+    coords: np.ndarray,
+    windows: np.ndarray,
+    group: np.ndarray,
+    data: slice,
+    queries: slice
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find pairs of an earlier data report and a query report in nearby cells.
+    
+    Every dimension is divided into cells four times as wide as its window,
+    so the window around a query spans at most two cells per dimension and
+    usually one. Data reports are hashed by their own cell, queries by every
+    cell their window overlaps, and pairs are found by joining equal hashes
+    after one sort. The time window only looks back, since data reports come
+    first.
+    
+    Parameters
+    ----------
+    coords : np.ndarray
+        (reports, dims) coordinates in time order: minutes, then ECEF x, y
+        and z in km, then flight level
+    windows : np.ndarray
+        Window half-width of each dimension
+    group : np.ndarray
+        Codes that must match exactly
+    data, queries : slice
+        Ranges of reports searched and searching
+        
+    Returns
+    -------
+    tuple
+        (earlier, later) report indices of the candidate pairs
+    """
+    size = np.where(windows > 0, 4 * windows, 1.0)
+    
+    # Data reports: their own cell
+    d_cells = np.floor(coords[data] / size).astype(np.int64)
+    d_key = _cell_hash([group[data]] + list(d_cells.T))
+    order = np.argsort(d_key)
+    d_key = d_key[order]
+    
+    # Query reports: the lower cell of their window in every dimension...
+    q_coords = coords[queries]
+    upper = q_coords + windows
+    upper[:, 0] = q_coords[:, 0]
+    lo_cells = np.floor((q_coords - windows) / size).astype(np.int64)
+    spill = np.floor(upper / size).astype(np.int64) > lo_cells
+    q_key = _cell_hash([group[queries]] + list(lo_cells.T))
+    q_index = np.arange(queries.start, queries.stop)
+    
+    # ...plus a copy in the upper cell of every dimension the window spills into
+    for dim in range(coords.shape[1]):
+        rows = np.nonzero(spill[:, dim])[0]
+        q_key = np.concatenate([q_key, q_key[rows] + _HASH_MULTIPLIERS[dim + 1]])
+        q_index = np.concatenate([q_index, q_index[rows]])
+        spill = np.concatenate([spill, spill[rows]])
+    
+    # Join queries to the data reports with the same hash, in hash order
+    q_order = np.argsort(q_key)
+    q_key, q_index = q_key[q_order], q_index[q_order]
+    start = np.searchsorted(d_key, q_key, side='left')
+    count = np.searchsorted(d_key, q_key, side='right') - start
+    later = np.repeat(q_index, count)
+    offsets = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    earlier = order[np.repeat(start, count) + offsets] + data.start
+    
+    keep = earlier < later
+    return earlier[keep], later[keep]
+
+
+def _sweep_duplicates(
+    undecided: np.ndarray,
+    earlier: np.ndarray,
+    later: np.ndarray,
+    status: np.ndarray
+) -> np.ndarray:
+    """Decide the remaining reports one at a time, in time order."""
+    order = np.argsort(later, kind='stable')
+    earlier = earlier[order].tolist()
+    starts = np.searchsorted(later[order], undecided, side='left').tolist()
+    stops = np.searchsorted(later[order], undecided, side='right').tolist()
+    
+    decided = status.tolist()
+    for report, start, stop in zip(undecided.tolist(), starts, stops):
+        absorbed = any(decided[earlier[i]] == _KEPT for i in range(start, stop))
+        decided[report] = _DROPPED if absorbed else _KEPT
+    return np.array(decided, dtype=status.dtype)
+
+
+def _resolve_duplicates(
+    n_reports: int,
+    earlier: np.ndarray,
+    later: np.ndarray,
+    status: np.ndarray
+) -> np.ndarray:
+    """
+    Keep each report unless a matching earlier report was kept.
+    
+    This is the result of sweeping the reports in time order, but decided
+    in vectorized rounds: a report is dropped as soon as one of its matches
+    is kept, and kept once all of its matches are dropped. Each round only
+    looks at the undecided reports and their pairs, and a handful of rounds
+    settle real data. Chains of reports that each match only the previous
+    one settle one report per round, so once a round decides fewer than
+    ``_MIN_ROUND_PROGRESS`` of the undecided reports the rest are swept one
+    at a time, keeping the cost linear in reports and pairs.
+    """
+    undecided = np.nonzero(status == _UNDECIDED)[0]
+    flagged = np.zeros(n_reports, dtype=bool)
+    while undecided.size:
+        live = status[later] == _UNDECIDED
+        earlier, later = earlier[live], later[live]
+        
+        partner = status[earlier]
+        absorbed = later[partner == _KEPT]
+        blocked = later[partner == _UNDECIDED]
+        
+        # Reports with no kept or undecided match are kept
+        flagged[absorbed] = True
+        flagged[blocked] = True
+        free = undecided[~flagged[undecided]]
+        flagged[absorbed] = False
+        flagged[blocked] = False
+        
+        status[absorbed] = _DROPPED
+        status[free] = _KEPT
+        remaining = undecided[status[undecided] == _UNDECIDED]
+        if undecided.size - remaining.size < _MIN_ROUND_PROGRESS * undecided.size:
+            return _sweep_duplicates(remaining, earlier, later, status)
+        undecided = remaining
+    return status
+
+
+def deduplicate_pireps(
+    df: pd.DataFrame,
+    time_window: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    fl_window: Optional[float] = None,
+    by: Optional[List[str]] = None,
+    anchors: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """
+    Remove repeated reports of the same turbulence encounter.
+    
+    Reports are swept in time order and a report is dropped if an earlier
+    kept report is at most ``time_window`` minutes older, within
+    ``radius_km`` and ``fl_window`` of it, and has the same ``by`` values
+    (the intensity by default). Comparing against kept reports only means a long series
+    of reports, each close to the previous one, is thinned rather than
+    collapsed to its first report.
+    
+    Candidate matches are found by hashing every report into space-time
+    cells, with positions as 3-D Earth-centered coordinates so the radius
+    holds across the date line and near the poles. Reports are processed in
+    blocks of ``DEDUP_BLOCK_SIZE`` after one sort, so the cost is O(n log n)
+    and memory is bounded on tens of millions of reports. Reports without a
+    valid time, position, flight level or ``by`` value (e.g. icing-only
+    reports without an intensity) are always kept.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs with 'VALID', 'LAT' and 'LON', and either parsed 'FL' and
+        'Intensity' columns or raw 'REPORT' (and 'TURBULENCE') text
+    time_window : float, optional
+        Time window in minutes. If None, uses default from config (default: None)
+    radius_km : float, optional
+        Distance radius in km. If None, uses default from config (default: None)
+    fl_window : float, optional
+        Flight level window in hundreds of feet. If None, uses default from
+        config (default: None)
+    by : List[str], optional
+        Columns that must match exactly. If None, uses ['Intensity'] (default: None)
+    anchors : pd.DataFrame, optional
+        Reports kept earlier (e.g. the end of the previous chunk) that later
+        reports in df are matched against; they are not returned (default: None)
+        
+    Returns
+    -------
+    pd.DataFrame
+        The reports of df that are kept, in their original order
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> df = wab.read_pireps('updated_CSVs/csv_fl_rem.csv')
+    >>> df = wab.deduplicate_pireps(df, time_window=10, radius_km=15)
+    """
+    if time_window is None:
+        time_window = DEDUP_TIME_WINDOW
+    if radius_km is None:
+        radius_km = DEDUP_RADIUS_KM
+    if fl_window is None:
+        fl_window = DEDUP_FL_WINDOW
+    if by is None:
+        by = ['Intensity']
+    
+    n_anchors = 0 if anchors is None else len(anchors)
+    frame = df if anchors is None else pd.concat([anchors, df], ignore_index=True)
+    minutes, lat, lon, fl, group = _report_fields(frame, by)
+    
+    # Only reports with every compared field take part
+    usable = np.nonzero(
+        np.isfinite(minutes) & np.isfinite(lat) & np.isfinite(lon) & np.isfinite(fl) & (group >= 0)
+    )[0]
+    usable = usable[np.argsort(minutes[usable], kind='stable')]
+    
+    phi, lam = np.radians(lat[usable]), np.radians(lon[usable])
+    coords = np.column_stack([
+        minutes[usable],
+        EARTH_RADIUS_KM * np.cos(phi) * np.cos(lam),
+        EARTH_RADIUS_KM * np.cos(phi) * np.sin(lam),
+        EARTH_RADIUS_KM * np.sin(phi),
+        fl[usable],
+    ])
+    windows = np.array([time_window] + [radius_km] * 3 + [fl_window], dtype=np.float64)
+    codes = group[usable]
+    
+    # Collect matching pairs one block of later reports at a time
+    pairs = []
+    n_usable = len(usable)
+    for start in range(0, n_usable, DEDUP_BLOCK_SIZE):
+        stop = min(start + DEDUP_BLOCK_SIZE, n_usable)
+        first = int(np.searchsorted(coords[:, 0], coords[start, 0] - time_window, side='left'))
+        earlier, later = _candidate_pairs(coords, windows, codes, slice(first, stop), slice(start, stop))
+        
+        diff = coords[later] - coords[earlier]
+        match = (
+            (diff[:, 0] <= time_window)
+            & (np.sqrt((diff[:, 1:4] ** 2).sum(axis=1)) <= radius_km)
+            & (np.abs(diff[:, 4]) <= fl_window)
+            & (codes[earlier] == codes[later])
+        )
+        pairs.append((earlier[match], later[match]))
+    
+    earlier = np.concatenate([p[0] for p in pairs]) if pairs else np.zeros(0, dtype=np.int64)
+    later = np.concatenate([p[1] for p in pairs]) if pairs else np.zeros(0, dtype=np.int64)
+    
+    status = np.full(n_usable, _UNDECIDED, dtype=np.int8)
+    status[usable < n_anchors] = _KEPT
+    status = _resolve_duplicates(n_usable, earlier, later, status)
+    
+    keep = np.ones(len(frame), dtype=bool)
+    keep[usable[status == _DROPPED]] = False
+    return df[keep[n_anchors:]]
@@ -4,19 +4,469 @@ PIREP Data Download Module
 Downloads historical pilot report (PIREP) data from Iowa State University archive.
 """
 
+import hashlib
+import io
+import json
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from wxcbench.aviation_turbulence.config import PIREP_DOWNLOAD_BASE_URL, DEFAULT_PIREP_OUTPUT_DIR
+from wxcbench.aviation_turbulence.config import (
+    PIREP_DOWNLOAD_BASE_URL,
+    PIREP_DOWNLOAD_MAX_WORKERS,
+    PIREP_DOWNLOAD_RETRIES,
+    PIREP_DOWNLOAD_BACKOFF,
+    PIREP_DOWNLOAD_MIN_INTERVAL,
+    PIREP_DOWNLOAD_TIMEOUT,
+    PIREP_MANIFEST_FILE,
+    PIREP_COMBINED_FILE,
+    PIREP_COMBINED_MANIFEST_FILE,
+    PIREP_COPY_BLOCK_SIZE,
+    DEFAULT_PIREP_OUTPUT_DIR
+)
+from wxcbench.aviation_turbulence.pirep_store import write_pirep_store
+from wxcbench.aviation_turbulence.pirep_dedup import deduplicate_pireps
+
+
+def _month_urls(
+    start_year: int,
+    end_year: int,
+    base_url: str,
+    start_month: int = 1,
+    end_month: int = 12
+) -> List[Tuple[str, str, bool]]:
+    """
+    Build the monthly download URLs for a range of years.
+    
+    Parameters
+    ----------
+    start_year : int
+        Starting year
+    end_year : int
+        Ending year (inclusive)
+    base_url : str
+        Base URL of the PIREP archive service
+    start_month : int, optional
+        First month of the starting year (default: 1)
+    end_month : int, optional
+        Last month of the ending year, inclusive (default: 12)
+        
+    Returns
+    -------
+    List[Tuple[str, str, bool]]
+        (filename, url, complete) for each month, where complete is False
+        for months that have not finished yet
+    """
+    import datetime
+    
+    now = datetime.datetime.now()
+    
+    # Create dictionary with months and corresponding days
+    month_days = {
+        1: 31, 2: 28, 3: 31, 4: 30, 5: 31, 6: 30,
+        7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31
+    }
+    
+    # Generate list of URLs for monthly downloads
+    file_list = []
+    for year in range(start_year, end_year + 1):
+        for month in month_days.keys():
+            if not (start_year, start_month) <= (year, month) <= (end_year, end_month):
+                continue
+            day_1 = 1
+            day_2 = month_days[month]
+            
+            # Handle leap years
+            if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+                day_2 = 29
+            
+            query = (
+                f"year1={year}&month1={month}&day1={day_1}&hour1=0&minute1=0&"
+                f"year2={year}&month2={month}&day2={day_2}&hour2=23&minute2=59&fmt=csv"
+            )
+            complete = (year, month) < (now.year, now.month)
+            file_list.append((query + ".csv", f"{base_url}?{query}", complete))
+    
+    return file_list
+
+
+def _create_session(max_workers: int, retries: int, backoff: float) -> requests.Session:
+    """
+    Create a pooled HTTP session that retries transient failures with backoff.
+    
+    Parameters
+    ----------
+    max_workers : int
+        Number of concurrent downloads sharing the session
+    retries : int
+        Number of retries on connection errors and 429/5xx responses
+    backoff : float
+        Exponential backoff factor between retries (seconds)
+        
+    Returns
+    -------
+    requests.Session
+        Configured session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max_workers,
+        pool_maxsize=max_workers,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _rate_limiter(min_interval: float) -> Callable[[], None]:
+    """
+    Create a thread-safe limiter that spaces out request starts.
+    
+    Parameters
+    ----------
+    min_interval : float
+        Minimum delay between consecutive calls (seconds)
+        
+    Returns
+    -------
+    Callable[[], None]
+        Function that blocks until the next request may start
+    """
+    lock = threading.Lock()
+    next_start = [0.0]
+    
+    def wait():
+        with lock:
+            delay = next_start[0] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_start[0] = time.monotonic() + min_interval
+    
+    return wait
+
+
+def _load_manifest(manifest_file: Path) -> Dict[str, dict]:
+    """
+    Load the record of completed monthly downloads.
+    
+    Parameters
+    ----------
+    manifest_file : Path
+        Path to the manifest JSON file
+        
+    Returns
+    -------
+    Dict[str, dict]
+        Mapping of monthly filename to its download record
+    """
+    if not manifest_file.exists():
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def _write_atomic(output_file: Path, write: Callable[[Path], None]) -> None:
+    """
+    Write a file through a temporary sibling and move it into place.
+    
+    Readers never see a partially written file, and an interrupted write
+    leaves any previous version untouched.
+    
+    Parameters
+    ----------
+    output_file : Path
+        Final path of the file
+    write : Callable[[Path], None]
+        Function that writes the content to the given temporary path
+    """
+    tmp_file = output_file.with_name(f".{output_file.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp_file)
+        os.replace(tmp_file, output_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+
+def _download_month(
+    session: requests.Session,
+    url: str,
+    output_file: Path,
+    wait: Callable[[], None],
+    timeout: float,
+    store_dir: Optional[str] = None,
+    deduplicate: bool = False
+) -> int:
+    """
+    Download, clean and save one month of PIREPs.
+    
+    Parameters
+    ----------
+    session : requests.Session
+        HTTP session to download with
+    url : str
+        Monthly download URL
+    output_file : Path
+        Path of the monthly CSV file
+    wait : Callable[[], None]
+        Rate limiter called before the request starts
+    timeout : float
+        Request timeout (seconds)
+    store_dir : str, optional
+        If given, also writes the month to this typed Parquet store (default: None)
+    deduplicate : bool, optional
+        If True, also removes repeated reports of the same encounter with
+        ``deduplicate_pireps`` (default: False)
+        
+    Returns
+    -------
+    int
+        Number of reports saved
+    """
+    wait()
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    
+    # Read CSV with specific columns
+    df = pd.read_csv(
+        io.StringIO(response.text),
+        usecols=['VALID', 'REPORT', 'TURBULENCE', 'LAT', 'LON'],
+        dtype=str
+    )
+    
+    # Remove duplicate reports
+    df = df.drop_duplicates()
+    
+    # Drop NA values
+    df = df.dropna()
+    
+    # Drop rows with 'None' values for latitude and longitude
+    df = df.mask(df.eq('None')).dropna(subset=['LAT', 'LON'])
+    
+    # Remove repeated reports of the same encounter
+    if deduplicate:
+        df = deduplicate_pireps(df)
+    
+    # Save individual monthly file
+    _write_atomic(output_file, lambda tmp: df.to_csv(tmp, index=False))
+    if store_dir is not None:
+        write_pirep_store(df, store_dir)
+    return len(df)
+
+
+def _copy_bytes(src, dst, length: Optional[int] = None) -> Tuple[int, bytes]:
+    """
+    Stream bytes from one open file to another in bounded blocks.
+    
+    Parameters
+    ----------
+    src, dst : file
+        Open binary files, read from and written to at their positions
+    length : int, optional
+        Number of bytes to copy. If None, copies to the end of src (default: None)
+        
+    Returns
+    -------
+    Tuple[int, bytes]
+        Number of bytes copied and the last byte copied (empty if none)
+    """
+    copied, last = 0, b""
+    while length is None or copied < length:
+        size = PIREP_COPY_BLOCK_SIZE if length is None else min(PIREP_COPY_BLOCK_SIZE, length - copied)
+        block = src.read(size)
+        if not block:
+            break
+        dst.write(block)
+        copied += len(block)
+        last = block[-1:]
+    return copied, last
+
+
+def _update_combined(
+    combined_file: Path,
+    pirep_files: List[str],
+    record_file: Path
+) -> pd.DataFrame:
+    """
+    Merge new or changed monthly files into the consolidated archive.
+    
+    Each merged month is stored as a contiguous byte segment of the combined
+    CSV, and its offset, length and file signature are kept in a record next
+    to it. New months are appended by copying their rows as raw bytes. A
+    month whose file changed since it was merged (typically the current,
+    still accumulating month), or a back-filled month older than merged
+    ones, is written in month order together with the segments after it, so
+    the archive stays in time order. No previously merged history is parsed
+    or rewritten otherwise, and bytes are streamed in bounded blocks.
+    
+    The record is cut back to the untouched segments before the archive is
+    modified, and segments carried over from the archive are staged in a
+    temporary file, so an interrupted merge is redone from the monthly
+    files on the next run.
+    
+    Parameters
+    ----------
+    combined_file : Path
+        Path of the consolidated CSV file
+    pirep_files : List[str]
+        Paths of the monthly CSV files
+    record_file : Path
+        Path of the JSON record of merged months
+        
+    Returns
+    -------
+    pd.DataFrame
+        Reports from the months merged by this call
+    """
+    def month_key(fname):
+        match = re.search(r"year1=(\d+)&month1=(\d+)", Path(fname).name)
+        return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+    
+    def signature(fname):
+        stat = os.stat(fname)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    
+    def digest(fname):
+        with open(fname, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    
+    # Start over if the archive and its record do not belong together
+    record = _load_manifest(record_file) if combined_file.exists() else {}
+    end = max((seg["offset"] + seg["length"] for seg in record.values()), default=0)
+    if not record or combined_file.stat().st_size < end:
+        record, end = {}, 0
+    
+    # Find months that are new or whose file changed since they were merged
+    pirep_files = sorted(pirep_files, key=month_key)
+    dirty = []
+    for fname in pirep_files:
+        name = Path(fname).name
+        seg = record.get(name)
+        if seg is not None and {k: seg[k] for k in ("size", "mtime_ns")} == signature(fname):
+            continue
+        sha = digest(fname)
+        if seg is not None and seg["sha256"] == sha:
+            seg.update(signature(fname))
+            continue
+        dirty.append((fname, sha))
+    
+    # Rewrite from the first changed segment, or the first segment of a month
+    # after the earliest new one, so the archive stays in time order
+    dirty_names = {Path(fname).name for fname, _ in dirty}
+    cut = min((record[name]["offset"] for name in dirty_names if name in record), default=end)
+    new_months = [month_key(name) for name in dirty_names if name not in record]
+    if new_months:
+        cut = min([cut] + [
+            seg["offset"] for name, seg in record.items() if month_key(name) > min(new_months)
+        ])
+    tail = sorted(
+        (seg["offset"], name) for name, seg in record.items()
+        if seg["offset"] >= cut and name not in dirty_names
+    )
+    
+    if not dirty:
+        _write_atomic(record_file, lambda tmp: tmp.write_text(json.dumps(record, indent=1)))
+        print(f"{combined_file} is up to date")
+        return pd.DataFrame()
+    
+    # Segments from the cut onward in month order: unchanged ones are carried
+    # over from the archive as raw bytes, the others come from their files
+    segments = [(name, record[name], None) for _, name in tail]
+    segments += [(Path(fname).name, {"sha256": sha, **signature(fname)}, fname) for fname, sha in dirty]
+    segments.sort(key=lambda segment: month_key(segment[0]))
+    
+    # Forget the segments from the cut onward before touching the archive, so
+    # an interrupted merge leaves a record that still matches the archive
+    record = {name: seg for name, seg in record.items() if seg["offset"] < cut}
+    _write_atomic(record_file, lambda tmp: tmp.write_text(json.dumps(record, indent=1)))
+    
+    def write_segments(dst):
+        """Stream the segments to dst, returning their positions relative to its start."""
+        layout = []
+        position = 0
+        archive = open(combined_file, "rb") if tail else None
+        try:
+            for name, seg, fname in segments:
+                if fname is None:
+                    archive.seek(seg["offset"])
+                    length, _ = _copy_bytes(archive, dst, seg["length"])
+                else:
+                    with open(fname, "rb") as f:
+                        f.readline()
+                        length, last = _copy_bytes(f, dst)
+                    if length and last != b"\n":
+                        dst.write(b"\n")
+                        length += 1
+                layout.append((name, seg, position, length))
+                position += length
+        finally:
+            if archive is not None:
+                archive.close()
+        return layout
+    
+    # The first segment carries the header line
+    with open(dirty[0][0], "rb") as f:
+        header = f.readline()
+    
+    # Carried-over segments are read from the bytes being replaced, so they
+    # are staged in a temporary file first; new months are appended directly
+    staged_file = combined_file.with_name(f".{combined_file.name}.{os.getpid()}.tail.tmp")
+    try:
+        if tail:
+            with open(staged_file, "wb") as staged:
+                layout = write_segments(staged)
+        with open(combined_file, "r+b" if cut > 0 else "wb") as out:
+            out.truncate(cut)
+            out.seek(cut)
+            if cut == 0:
+                out.write(header)
+            base = out.tell()
+            if tail:
+                with open(staged_file, "rb") as staged:
+                    _copy_bytes(staged, out)
+            else:
+                layout = write_segments(out)
+    finally:
+        staged_file.unlink(missing_ok=True)
+    
+    for name, seg, position, length in layout:
+        record[name] = {**seg, "offset": base + position, "length": length}
+    _write_atomic(record_file, lambda tmp: tmp.write_text(json.dumps(record, indent=1)))
+    print(f"Merged {len(dirty)} monthly files into {combined_file}")
+    
+    return pd.concat((pd.read_csv(fname) for fname, _ in dirty), ignore_index=True)
 
 
 def get_pirep_data(
     start_year: int = 2003,
     end_year: Optional[int] = None,
     output_dir: Optional[str] = None,
-    combine_files: bool = True
+    combine_files: bool = True,
+    max_workers: Optional[int] = None,
+    base_url: Optional[str] = None,
+    overwrite: bool = False,
+    incremental: bool = False,
+    store_dir: Optional[str] = None,
+    deduplicate: bool = False,
+    start_month: int = 1,
+    end_month: int = 12,
+    min_interval: Optional[float] = None
 ) -> pd.DataFrame:
     """
     Download PIREP data from Iowa State University archive.
@@ -24,6 +474,13 @@ def get_pirep_data(
     This function downloads historical PIREP data (2003-present) and optionally
     combines all monthly files into a single CSV file.
     
+    Months are fetched concurrently over a pooled HTTP session, with retry
+    and exponential backoff on transient failures and a minimum delay between
+    requests to stay polite to the archive. Each monthly file is written
+    atomically and recorded in a manifest in the output directory, so a rerun
+    skips the months that already completed. The current month is never
+    recorded and is fetched again on every run.
+    
     Parameters
     ----------
     start_year : int, optional
@@ -34,24 +491,58 @@ def get_pirep_data(
         Directory to save downloaded files. If None, uses default directory (default: None)
     combine_files : bool, optional
         If True, combines all monthly files into a single 'all_pireps.csv' file (default: True)
-    
+    max_workers : int, optional
+        Number of concurrent downloads. If None, uses default from config (default: None)
+    base_url : str, optional
+        Base URL of the PIREP archive service. If None, uses the Iowa State
+        archive from config (default: None)
+    overwrite : bool, optional
+        If True, downloads every month again even if recorded as complete (default: False)
+    incremental : bool, optional
+        If True, only merges new or changed monthly files into 'all_pireps.csv'
+        instead of rebuilding it, and returns just the merged reports (default: False)
+    store_dir : str, optional
+        If given, also writes each downloaded month to a typed Parquet store
+        partitioned by year and month in this directory (see ``read_pireps``).
+        Requires pyarrow (default: None)
+    deduplicate : bool, optional
+        If True, removes repeated reports of the same encounter from each
+        month with ``deduplicate_pireps``, beyond exact duplicate rows
+        (default: False)
+    start_month : int, optional
+        First month of start_year to download (default: 1)
+    end_month : int, optional
+        Last month of end_year to download, inclusive (default: 12)
+    min_interval : float, optional
+        Minimum delay between request starts in seconds. If None, uses
+        default from config; only lower it for archives you run yourself
+        (default: None)
+        
     Returns
     -------
     pd.DataFrame
-        Combined DataFrame containing all PIREP data if combine_files=True,
-        otherwise returns empty DataFrame
+        Combined DataFrame containing all PIREP data if combine_files=True
+        (only the newly merged reports if incremental=True), otherwise
+        returns empty DataFrame
         
     Examples
     --------
     >>> import wxcbench.aviation_turbulence as wab
     >>> df = wab.get_pirep_data(start_year=2020, end_year=2023)
     >>> print(df.head())
+    >>> new_reports = wab.get_pirep_data(start_year=2020, incremental=True)
     """
     import datetime
     
     # Set default output directory
     if output_dir is None:
         output_dir = DEFAULT_PIREP_OUTPUT_DIR
+    if max_workers is None:
+        max_workers = PIREP_DOWNLOAD_MAX_WORKERS
+    if base_url is None:
+        base_url = PIREP_DOWNLOAD_BASE_URL
+    if min_interval is None:
+        min_interval = PIREP_DOWNLOAD_MIN_INTERVAL
     
     # Set end_year to current year if not provided
     if end_year is None:
@@ -62,60 +553,55 @@ def get_pirep_data(
     if not output_path.exists():
         output_path.mkdir(parents=True, exist_ok=True)
     
-    # Create dictionary with months and corresponding days
-    month_days = {
-        1: 31, 2: 28, 3: 31, 4: 30, 5: 31, 6: 30,
-        7: 31, 8: 31, 9: 30, 10: 31, 11: 30, 12: 31
-    }
+    # Skip months that a previous run already completed
+    manifest_file = output_path / PIREP_MANIFEST_FILE
+    manifest = {} if overwrite else _load_manifest(manifest_file)
+    file_list = [
+        (filename, url, complete)
+        for filename, url, complete in _month_urls(start_year, end_year, base_url, start_month, end_month)
+        if not (filename in manifest and (output_path / filename).exists())
+    ]
+    print(f"{len(file_list)} months to download")
     
-    # Generate list of URLs for monthly downloads
-    file_list = []
-    for year in range(start_year, end_year + 1):
-        for month in month_days.keys():
-            start_month = month
-            end_month = month
-            day_1 = 1
-            day_2 = month_days[month]
-            
-            # Handle leap years
-            if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
-                day_2 = 29
-            
-            url = (
-                f"{PIREP_DOWNLOAD_BASE_URL}?"
-                f"year1={year}&month1={start_month}&day1={day_1}&hour1=0&minute1=0&"
-                f"year2={year}&month2={end_month}&day2={day_2}&hour2=23&minute2=59&fmt=csv"
-            )
-            file_list.append(url)
+    session = _create_session(max_workers, PIREP_DOWNLOAD_RETRIES, PIREP_DOWNLOAD_BACKOFF)
+    wait = _rate_limiter(min_interval)
     
-    # Download and process each file
-    for url in file_list:
-        try:
-            # Read CSV with specific columns
-            df = pd.read_csv(
+    # Download and process the months concurrently
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                _download_month,
+                session,
                 url,
-                usecols=['VALID', 'REPORT', 'TURBULENCE', 'LAT', 'LON'],
-                dtype=str
-            )
-            
-            # Remove duplicate reports
-            df = df.drop_duplicates()
-            
-            # Drop NA values
-            df = df.dropna()
-            
-            # Drop rows with 'None' values for latitude and longitude
-            df = df.mask(df.eq('None')).dropna(subset=['LAT', 'LON'])
+                output_path / filename,
+                wait,
+                PIREP_DOWNLOAD_TIMEOUT,
+                store_dir,
+                deduplicate
+            ): (filename, url, complete)
+            for filename, url, complete in file_list
+        }
+        
+        for future in as_completed(futures):
+            filename, url, complete = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"Warning: {url} could not be read - {str(e)}")
+                continue
             
-            # Save individual monthly file
-            filename = url.split("?")[-1] + ".csv"
-            output_file = output_path / filename
-            df.to_csv(output_file, index=False)
             print(f"Downloaded {filename}")
             
-        except Exception as e:
-            print(f"Warning: {url} could not be read - {str(e)}")
-            continue
+            # Record finished months so reruns skip them
+            if complete:
+                manifest[filename] = {
+                    "rows": rows,
+                    "downloaded": datetime.datetime.now().isoformat(timespec="seconds")
+                }
+                _write_atomic(
+                    manifest_file,
+                    lambda tmp: tmp.write_text(json.dumps(manifest, indent=1))
+                )
     
     print("Finished downloading PIREP data.")
     
@@ -125,15 +611,22 @@ def get_pirep_data(
         pirep_files = glob.glob(str(output_path / "*.csv"))
         
         # Filter out the combined file if it exists
-        combined_file = output_path / "all_pireps.csv"
+        combined_file = output_path / PIREP_COMBINED_FILE
         pirep_files = [f for f in pirep_files if f != str(combined_file)]
+        record_file = output_path / PIREP_COMBINED_MANIFEST_FILE
+        
+        if pirep_files and incremental:
+            return _update_combined(combined_file, pirep_files, record_file)
         
         if pirep_files:
             df_all = pd.concat(map(pd.read_csv, pirep_files), ignore_index=True)
-            combined_file_path = output_path / "all_pireps.csv"
-            df_all.to_csv(combined_file_path, index=False)
-            print(f"Combined all files into {combined_file_path}")
+            df_all.to_csv(combined_file, index=False)
+            
+            # A full rebuild invalidates the record of incrementally merged months
+            if record_file.exists():
+                record_file.unlink()
+            
+            print(f"Combined all files into {combined_file}")
             return df_all
     
     return pd.DataFrame()
-
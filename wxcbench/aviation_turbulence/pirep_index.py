@@ -0,0 +1,381 @@
+"""
+PIREP Index Module
+
+Builds a persistent spatio-temporal index over the PIREP archive and answers
+bounding box, time range and flight level band queries from it without
+loading the archive. Reports are stored column by column, sorted by date and
+MERRA-2 grid cell, with the offsets of every (date, cell) run.
+"""
+
+import json
+import mmap
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from wxcbench.aviation_turbulence.config import (
+    MERRA2_GRID,
+    FLIGHT_LEVELS,
+    PIREP_COMBINED_FILE,
+    PIREP_INDEX_METADATA,
+    PIREP_INDEX_CHUNKSIZE,
+    DEFAULT_PIREP_OUTPUT_DIR,
+    DEFAULT_PIREP_INDEX_DIR
+)
+from wxcbench.aviation_turbulence.pirep_store import read_pireps, parse_valid_times
+from wxcbench.aviation_turbulence.grid_pireps import assign_grid_cells
+from wxcbench.aviation_turbulence.pirep_parsing import (
+    parse_flight_level,
+    flight_level_band,
+    parse_report_intensity
+)
+
+MINUTES_PER_DAY = 1440
+N_CELLS = MERRA2_GRID["nx"] * MERRA2_GRID["ny"]
+
+# Columns stored as numbers; every other column is stored as text
+_PARSED_COLUMNS = ['VALID', 'LAT', 'LON', 'FL', 'Intensity', 'FLIGHT_LEVEL']
+
+
+def _index_fields(chunk: pd.DataFrame) -> dict:
+    """
+    Extract the numeric columns of a chunk of reports.
+    
+    Raw PIREPs are parsed on the fly. Unlike ``parse_reports``, reports
+    without a flight level or intensity are kept, with -1 in 'FL' and
+    'Intensity'.
+    """
+    valid = parse_valid_times(chunk['VALID'])
+    
+    if 'FL' in chunk.columns:
+        fl = pd.to_numeric(chunk['FL'], errors='coerce')
+    else:
+        fl = parse_flight_level(chunk['REPORT'])
+    if 'Intensity' in chunk.columns:
+        intensity = pd.to_numeric(chunk['Intensity'], errors='coerce')
+    else:
+        intensity = parse_report_intensity(chunk)
+    
+    return {
+        'VALID': valid.to_numpy(dtype='datetime64[m]'),
+        'LAT': pd.to_numeric(chunk['LAT'], errors='coerce').to_numpy(dtype=np.float32),
+        'LON': pd.to_numeric(chunk['LON'], errors='coerce').to_numpy(dtype=np.float32),
+        'FL': fl.fillna(-1).to_numpy(dtype=np.int16),
+        'Intensity': intensity.fillna(-1).to_numpy(dtype=np.int8),
+    }
+
+
+def _report_keys(valid: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Index key of each report: day number times the cell count plus the cell."""
+    day = valid.astype(np.int64) // MINUTES_PER_DAY
+    # Reports without a position get a placeholder cell and are left out later
+    yind, xind = assign_grid_cells(np.nan_to_num(lat), np.nan_to_num(lon))
+    return day * N_CELLS + yind * MERRA2_GRID["nx"] + xind
+
+
+def build_pirep_index(
+    input_file: Optional[str] = None,
+    index_dir: Optional[str] = None,
+    chunksize: Optional[int] = None
+) -> str:
+    """
+    Build a persistent spatio-temporal index over a PIREP archive.
+    
+    Every report is keyed by its date and the MERRA-2 grid cell it falls in,
+    and the numeric columns ('VALID', 'LAT', 'LON', 'FL', 'Intensity') are
+    written as uncompressed ``.npy`` arrays sorted by that key, so the reports
+    of a (date, cell) are one contiguous run. The index itself is the sorted
+    array of distinct keys ('keys.npy') and the offset of each run
+    ('offsets.npy'). Flight levels and intensities are parsed from the report
+    text if the archive is raw, and are -1 where unknown.
+    
+    The other columns (e.g. 'REPORT', 'AIRCRAFT') are stored as UTF-8 text in
+    archive order under 'text/', and 'row.npy' maps every sorted report back
+    to its archive row. The archive is read one chunk at a time and only the
+    numeric columns are held in memory. Reports without a valid time or
+    position cannot be keyed and are left out. The layout record
+    ('index.json') is written last, and an index without it is incomplete.
+    
+    Parameters
+    ----------
+    input_file : str, optional
+        PIREP CSV file or PIREP store directory, raw or preprocessed. If None,
+        uses the consolidated archive written by ``get_pirep_data`` in the
+        default download directory (default: None)
+    index_dir : str, optional
+        Directory to write the index to. If None, uses default from config
+        (default: None)
+    chunksize : int, optional
+        Number of reports to read at a time. If None, uses default from
+        config (default: None)
+        
+    Returns
+    -------
+    str
+        Path of the index directory
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> wab.get_pirep_data(start_year=2020, end_year=2023)
+    >>> wab.build_pirep_index('./pirep_downloads/all_pireps.csv', './pirep_index')
+    """
+    if input_file is None:
+        input_file = str(Path(DEFAULT_PIREP_OUTPUT_DIR) / PIREP_COMBINED_FILE)
+    if index_dir is None:
+        index_dir = DEFAULT_PIREP_INDEX_DIR
+    if chunksize is None:
+        chunksize = PIREP_INDEX_CHUNKSIZE
+    
+    idir = Path(index_dir)
+    (idir / 'text').mkdir(parents=True, exist_ok=True)
+    
+    # Remove any previous layout record first so a failed build is incomplete
+    (idir / PIREP_INDEX_METADATA).unlink(missing_ok=True)
+    
+    print(f"Indexing {input_file}...")
+    fields = {}
+    keys = []
+    text_columns = None
+    all_columns = None
+    blobs, lengths = {}, {}
+    n_reports = 0
+    try:
+        for chunk in read_pireps(input_file, chunksize=chunksize):
+            if text_columns is None:
+                text_columns = [c for c in chunk.columns if c not in _PARSED_COLUMNS]
+                all_columns = list(chunk.columns) + [c for c in _PARSED_COLUMNS if c not in chunk.columns]
+                for name in text_columns:
+                    blobs[name] = open(idir / 'text' / f'{name}.bin', 'wb')
+                    lengths[name] = []
+            
+            for name, values in _index_fields(chunk).items():
+                fields.setdefault(name, []).append(values)
+            keys.append(_report_keys(fields['VALID'][-1], fields['LAT'][-1], fields['LON'][-1]))
+            
+            # Text columns go to disk in archive order; missing values are empty
+            for name in text_columns:
+                column = chunk[name]
+                encoded = column.astype(str).where(column.notna(), '').str.encode('utf-8')
+                lengths[name].append(encoded.str.len().to_numpy(dtype=np.int64))
+                blobs[name].write(b''.join(encoded.tolist()))
+            n_reports += len(chunk)
+    finally:
+        for blob in blobs.values():
+            blob.close()
+    if text_columns is None:
+        raise ValueError(f"No reports found in {input_file}")
+    
+    for name, length in lengths.items():
+        offsets = np.zeros(n_reports + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(length), out=offsets[1:])
+        np.save(idir / 'text' / f'{name}.offsets.npy', offsets)
+    
+    # Sort the keyable reports by (date, cell), keeping archive order within a run
+    fields = {name: np.concatenate(values) for name, values in fields.items()}
+    keys = np.concatenate(keys)
+    keyable = np.nonzero(~np.isnat(fields['VALID']) & np.isfinite(fields['LAT']) & np.isfinite(fields['LON']))[0]
+    order = keyable[np.argsort(keys[keyable], kind='stable')]
+    keys = keys[order]
+    
+    for name, values in fields.items():
+        np.save(idir / f'{name}.npy', values[order])
+    np.save(idir / 'row.npy', order)
+    del fields
+    
+    run_starts = np.concatenate([[0], np.nonzero(np.diff(keys))[0] + 1]) if len(keys) else np.zeros(0, dtype=np.int64)
+    np.save(idir / 'keys.npy', keys[run_starts])
+    np.save(idir / 'offsets.npy', np.append(run_starts, len(keys)).astype(np.int64))
+    
+    metadata = {
+        'source': str(input_file),
+        'reports': int(len(keys)),
+        'archive_reports': int(n_reports),
+        'columns': all_columns,
+        'text_columns': text_columns,
+        'grid': MERRA2_GRID,
+    }
+    (idir / PIREP_INDEX_METADATA).write_text(json.dumps(metadata, indent=1))
+    
+    skipped = n_reports - len(keys)
+    print(f"Indexed {len(keys)} reports in {len(run_starts)} (date, cell) runs to {idir}"
+          + (f" ({skipped} without a valid time or position left out)" if skipped else ""))
+    return str(idir)
+
+
+def _key_ranges(
+    days: Tuple[int, int],
+    rows: Tuple[int, int],
+    cols: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Inclusive (low, high) key ranges covering a block of days, rows and columns.
+    
+    The keys of one grid row on one day are contiguous, and whole rows (or
+    whole days) are contiguous too, so full extents are merged into fewer,
+    longer ranges.
+    """
+    nx, ny = MERRA2_GRID["nx"], MERRA2_GRID["ny"]
+    day = np.arange(days[0], days[1] + 1, dtype=np.int64)
+    if cols == (0, nx - 1) and rows == (0, ny - 1):
+        return day[:1] * N_CELLS, day[-1:] * N_CELLS + N_CELLS - 1
+    if cols == (0, nx - 1):
+        return day * N_CELLS + rows[0] * nx, day * N_CELLS + rows[1] * nx + nx - 1
+    
+    row = np.arange(rows[0], rows[1] + 1, dtype=np.int64)
+    base = (day[:, None] * N_CELLS + row[None, :] * nx).ravel()
+    return base + cols[0], base + cols[1]
+
+
+def _read_text(idir: Path, name: str, rows: np.ndarray) -> pd.Series:
+    """Read one text column for the given archive rows; empty values become NaN."""
+    offsets = np.load(idir / 'text' / f'{name}.offsets.npy', mmap_mode='r')
+    starts, stops = offsets[rows], offsets[rows + 1]
+    if not len(rows) or stops.max() == 0:
+        return pd.Series([np.nan] * len(rows), dtype=object)
+    with open(idir / 'text' / f'{name}.bin', 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as blob:
+        values = [
+            blob[a:b].decode('utf-8') if b > a else np.nan
+            for a, b in zip(starts.tolist(), stops.tolist())
+        ]
+    return pd.Series(values, dtype=object)
+
+
+def query_pireps(
+    bbox: Optional[List[float]] = None,
+    time_range: Optional[Tuple] = None,
+    levels: Optional[Union[str, List[str]]] = None,
+    index_dir: Optional[str] = None,
+    columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Query the PIREP index for reports in a bounding box, time range and flight band.
+    
+    The query is turned into ranges of (date, cell) keys, which are looked up
+    in the sorted key array with a binary search; only the reports in the
+    matching runs are read from the memory-mapped columns and then filtered
+    exactly. The cost depends on the number of matching runs, not on the size
+    of the archive.
+    
+    Parameters
+    ----------
+    bbox : List[float], optional
+        Bounding box [lon_min, lon_max, lat_min, lat_max] of reports to return,
+        as in ``read_pireps``. If None, the whole globe (default: None)
+    time_range : tuple, optional
+        (start, end) of 'VALID' times, start inclusive and end exclusive, as
+        anything ``pd.Timestamp`` accepts. If None, the whole archive
+        (default: None)
+    levels : str or List[str], optional
+        Flight level bands from ``FLIGHT_LEVELS`` (e.g. ['med', 'high']).
+        Reports without a flight level only match if levels is None
+        (default: None)
+    index_dir : str, optional
+        Directory written by ``build_pirep_index``. If None, uses default from
+        config (default: None)
+    columns : List[str], optional
+        Columns to return. If None, returns all columns; leaving out text
+        columns makes large queries faster (default: None)
+        
+    Returns
+    -------
+    pd.DataFrame
+        Matching reports in archive order, with 'VALID' as datetimes, the
+        parsed 'FL', 'Intensity' and 'FLIGHT_LEVEL' columns, and the text
+        columns of the archive
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> df = wab.query_pireps(
+    ...     bbox=[-110, -100, 35, 42],
+    ...     time_range=('2022-03-01', '2022-03-08'),
+    ...     levels=['high']
+    ... )
+    """
+    if index_dir is None:
+        index_dir = DEFAULT_PIREP_INDEX_DIR
+    if isinstance(levels, str):
+        levels = [levels]
+    if levels is not None:
+        unknown = [level for level in levels if level not in FLIGHT_LEVELS]
+        if unknown:
+            raise ValueError(f"Unknown flight levels {unknown}, expected some of {FLIGHT_LEVELS}")
+    
+    idir = Path(index_dir)
+    record = idir / PIREP_INDEX_METADATA
+    if not record.exists():
+        raise FileNotFoundError(f"No complete PIREP index in {idir} (missing {record.name})")
+    metadata = json.loads(record.read_text())
+    if metadata['grid'] != MERRA2_GRID:
+        raise ValueError(f"PIREP index in {idir} was built on a different grid, rebuild it")
+    
+    keys = np.load(idir / 'keys.npy', mmap_mode='r')
+    offsets = np.load(idir / 'offsets.npy', mmap_mode='r')
+    if not len(keys):
+        days = (0, -1)
+    else:
+        days = (int(keys[0] // N_CELLS), int(keys[-1] // N_CELLS))
+    
+    # Narrow the days, rows and columns to search
+    if time_range is not None:
+        start, end = (pd.Timestamp(t) for t in time_range)
+        start_day = start.to_datetime64().astype('datetime64[D]').astype(np.int64)
+        end_day = (end.to_datetime64() - np.timedelta64(1, 'ns')).astype('datetime64[D]').astype(np.int64)
+        days = (max(days[0], int(start_day)), min(days[1], int(end_day)))
+    rows, cols = (0, MERRA2_GRID["ny"] - 1), (0, MERRA2_GRID["nx"] - 1)
+    if bbox is not None:
+        lon_min, lon_max, lat_min, lat_max = bbox
+        y, x = assign_grid_cells([lat_min, lat_max], [lon_min, lon_max])
+        rows, cols = (int(y[0]), int(y[1])), (int(x[0]), int(x[1]))
+    
+    if days[0] > days[1] or rows[0] > rows[1] or cols[0] > cols[1]:
+        sel = np.zeros(0, dtype=np.int64)
+    else:
+        low, high = _key_ranges(days, rows, cols)
+        first = offsets[np.searchsorted(keys, low, side='left')]
+        last = offsets[np.searchsorted(keys, high, side='right')]
+        count = last - first
+        sel = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+    
+    # Exact filters on the reports of the matching runs
+    valid = np.load(idir / 'VALID.npy', mmap_mode='r')[sel]
+    lat = np.load(idir / 'LAT.npy', mmap_mode='r')[sel]
+    lon = np.load(idir / 'LON.npy', mmap_mode='r')[sel]
+    fl = np.load(idir / 'FL.npy', mmap_mode='r')[sel]
+    mask = np.ones(len(sel), dtype=bool)
+    if time_range is not None:
+        mask &= (valid >= start.to_datetime64()) & (valid < end.to_datetime64())
+    if bbox is not None:
+        mask &= (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+    band = flight_level_band(pd.Series(np.where(fl >= 0, fl, np.nan)))
+    if levels is not None:
+        mask &= band.isin(levels).to_numpy()
+    
+    # Return the matches in archive order
+    row = np.load(idir / 'row.npy', mmap_mode='r')[sel[mask]]
+    order = np.argsort(row, kind='stable')
+    keep = np.nonzero(mask)[0][order]
+    row = row[order]
+    
+    intensity = np.load(idir / 'Intensity.npy', mmap_mode='r')[sel[keep]]
+    parsed = {
+        'VALID': pd.Series(valid[keep].astype('datetime64[ns]')),
+        'LAT': pd.Series(lat[keep]),
+        'LON': pd.Series(lon[keep]),
+        'FL': pd.Series(pd.array(np.where(fl[keep] >= 0, fl[keep], 0), dtype='Int16')).mask(fl[keep] < 0),
+        'Intensity': pd.Series(pd.array(np.where(intensity >= 0, intensity, 0), dtype='Int8')).mask(intensity < 0),
+        'FLIGHT_LEVEL': band[keep].reset_index(drop=True),
+    }
+    if columns is None:
+        columns = metadata['columns']
+    
+    result = {}
+    for name in columns:
+        if name in parsed:
+            result[name] = parsed[name]
+        elif name in metadata['text_columns']:
+            result[name] = _read_text(idir, name, row)
+    return pd.DataFrame(result)
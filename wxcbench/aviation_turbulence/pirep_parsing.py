@@ -0,0 +1,114 @@
+"""
+PIREP Parsing Module
+
+Parses flight levels and turbulence intensities from raw PIREP text, with
+precompiled regular expressions applied to whole columns. Shared by the
+preprocessing, de-duplication and indexing stages.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+from wxcbench.aviation_turbulence.config import (
+    FLIGHT_LEVELS,
+    FLIGHT_LEVEL_BOUNDS,
+    TURBULENCE_INTENSITY_PATTERNS
+)
+
+# Precompiled patterns, applied to whole columns at once
+_FLIGHT_LEVEL_RE = re.compile(r"/FL\s*(\d{2,3})")
+_TURBULENCE_GROUP_RE = re.compile(r"/TB\s*([^/]*)")
+_INTENSITY_RES = [
+    (value, re.compile(pattern)) for value, pattern in TURBULENCE_INTENSITY_PATTERNS
+]
+
+
+def parse_flight_level(report: pd.Series) -> pd.Series:
+    """
+    Extract the flight level from the '/FL' group of raw PIREP text.
+    
+    Parameters
+    ----------
+    report : pd.Series
+        Raw PIREP report strings (e.g., 'UA /OV ABQ /TM 1200 /FL350 /TP B737 /TB MOD')
+        
+    Returns
+    -------
+    pd.Series
+        Flight level in hundreds of feet, NaN where no numeric level is reported
+    """
+    level = report.astype('string').fillna('').str.extract(_FLIGHT_LEVEL_RE, expand=False)
+    return pd.to_numeric(level, errors='coerce')
+
+
+def parse_turbulence_intensity(text: pd.Series) -> pd.Series:
+    """
+    Classify turbulence intensity from PIREP turbulence text.
+    
+    Intensities follow ``TURBULENCE_INTENSITY_PATTERNS``: 0 (none/smooth),
+    1 (light), 2 (moderate), 3 (severe) and 4 (extreme). A range such as
+    'LGT-MOD' takes the highest intensity it names.
+    
+    Parameters
+    ----------
+    text : pd.Series
+        Turbulence text (e.g., the 'TURBULENCE' column or a '/TB' group)
+        
+    Returns
+    -------
+    pd.Series
+        Intensity as float, NaN where no intensity could be identified
+    """
+    text = text.astype('string').fillna('').str.upper()
+    conditions = [
+        text.str.contains(pattern, na=False).to_numpy()
+        for _, pattern in _INTENSITY_RES
+    ]
+    values = [float(value) for value, _ in _INTENSITY_RES]
+    return pd.Series(np.select(conditions, values, default=np.nan), index=text.index)
+
+
+def flight_level_band(fl: pd.Series) -> pd.Series:
+    """
+    Assign flight levels to the low, med and high bands.
+    
+    Parameters
+    ----------
+    fl : pd.Series
+        Flight level in hundreds of feet
+        
+    Returns
+    -------
+    pd.Series
+        Categorical band name from ``FLIGHT_LEVELS`` (NaN where fl is NaN)
+    """
+    bins = [-np.inf] + list(FLIGHT_LEVEL_BOUNDS) + [np.inf]
+    return pd.cut(fl, bins=bins, labels=FLIGHT_LEVELS, right=False)
+
+
+def parse_report_intensity(df: pd.DataFrame) -> pd.Series:
+    """
+    Classify the turbulence intensity of raw PIREPs.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs with 'REPORT' and, optionally, 'TURBULENCE' columns
+        
+    Returns
+    -------
+    pd.Series
+        Intensity from the 'TURBULENCE' column, falling back to the '/TB'
+        group of the report text; NaN where neither gives an intensity
+    """
+    intensity = pd.Series(np.nan, index=df.index)
+    if 'TURBULENCE' in df.columns:
+        intensity = parse_turbulence_intensity(df['TURBULENCE'])
+    missing = intensity.isna()
+    if missing.any():
+        group = df.loc[missing, 'REPORT'].astype('string').fillna('').str.extract(
+            _TURBULENCE_GROUP_RE, expand=False
+        )
+        intensity[missing] = parse_turbulence_intensity(group.fillna(''))
+    return intensity
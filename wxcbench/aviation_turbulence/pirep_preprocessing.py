@@ -0,0 +1,127 @@
+"""
+PIREP Preprocessing Pipeline Module
+
+Runs the EDA and MODG preprocessing in a single pass over the raw PIREPs,
+writing all flight-level and MODG files together.
+"""
+
+import pandas as pd
+from pathlib import Path
+from typing import Optional
+
+from wxcbench.aviation_turbulence.config import FLIGHT_LEVELS, DEDUP_TIME_WINDOW
+from wxcbench.aviation_turbulence.pirep_store import read_pireps, to_text_pireps, parse_valid_times
+from wxcbench.aviation_turbulence.turb_eda_preprocessing import (
+    parse_reports,
+    split_flight_levels
+)
+from wxcbench.aviation_turbulence.modg_preprocess import select_modg
+from wxcbench.aviation_turbulence.pirep_dedup import deduplicate_pireps
+
+
+def preprocess_pireps(
+    input_file: str,
+    output_dir: Optional[str] = None,
+    chunksize: Optional[int] = None,
+    deduplicate: bool = False
+) -> pd.DataFrame:
+    """
+    Parse, filter, classify and split raw PIREPs in a single pass.
+    
+    This function combines ``preprocess_turb_eda`` and ``preprocess_modg``:
+    each report is read and parsed once, and every output is written from
+    that parse. Nothing is round-tripped through an intermediate CSV.
+    The files written to 'updated_CSVs' are:
+    
+    - csv_fl_rem.csv, low_fl.csv, med_fl.csv, high_fl.csv (all reports)
+    - csv_modg_all.csv, low_fl_modg.csv, med_fl_modg.csv, high_fl_modg.csv
+      (MODG reports only)
+      
+    Parameters
+    ----------
+    input_file : str
+        Path to input CSV file (e.g., 'pirep_downloads/all_pireps.csv') or
+        PIREP store directory
+    output_dir : str, optional
+        Directory to save processed files. Creates 'updated_CSVs' subdirectory.
+        If None, uses current directory (default: None)
+    chunksize : int, optional
+        Number of reports to process at a time. Outputs are appended chunk by
+        chunk, so memory stays bounded by one chunk. If None, processes the
+        whole input at once (default: None)
+    deduplicate : bool, optional
+        If True, removes repeated reports of the same encounter with
+        ``deduplicate_pireps`` after parsing. With chunksize, each chunk is
+        also matched against every report kept from earlier chunks within
+        ``DEDUP_TIME_WINDOW`` of its first report, which gives the same
+        result as one pass for time-ordered input (default: False)
+        
+    Returns
+    -------
+    pd.DataFrame
+        Number of reports written, indexed by flight level ('all' plus each
+        level) with columns 'reports' and 'modg'
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> counts = wab.preprocess_pireps('pirep_downloads/all_pireps.csv')
+    >>> print(counts)
+    """
+    if output_dir is None:
+        output_dir = "."
+    
+    output_path = Path(output_dir) / "updated_CSVs"
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    reader = read_pireps(input_file, chunksize=chunksize)
+    if chunksize is None:
+        reader = [reader]
+    
+    counts = pd.DataFrame(0, index=['all'] + FLIGHT_LEVELS, columns=['reports', 'modg'])
+    first = True
+    anchors = None
+    n_repeated = 0
+    
+    for chunk in reader:
+        # Parse once, then derive every output from the parsed reports
+        df = parse_reports(chunk)
+        if deduplicate:
+            # Earlier kept reports stay anchors while they are within the
+            # time window of this chunk, however many chunks ago they were kept
+            start = parse_valid_times(df['VALID']).min()
+            if anchors is not None and pd.notna(start):
+                window = start - pd.Timedelta(minutes=DEDUP_TIME_WINDOW)
+                anchors = anchors[(parse_valid_times(anchors['VALID']) >= window).to_numpy()]
+            n_parsed = len(df)
+            df = deduplicate_pireps(df, anchors=anchors)
+            anchors = df if anchors is None else pd.concat([anchors, df], ignore_index=True)
+            n_repeated += n_parsed - len(df)
+        
+        # Times are written in the downloaded format
+        df = to_text_pireps(df)
+        modg = select_modg(df)
+        
+        outputs = [('csv_fl_rem.csv', 'all', 'reports', df),
+                   ('csv_modg_all.csv', 'all', 'modg', modg)]
+        outputs += [(f"{level}_fl.csv", level, 'reports', part)
+                    for level, part in split_flight_levels(df)]
+        outputs += [(f"{level}_fl_modg.csv", level, 'modg', part)
+                    for level, part in split_flight_levels(modg)]
+        
+        for fname, level, kind, part in outputs:
+            part.to_csv(
+                output_path / fname,
+                mode='w' if first else 'a',
+                header=first,
+                index=False
+            )
+            counts.loc[level, kind] += len(part)
+        
+        first = False
+    
+    if deduplicate:
+        print(f"Removed {n_repeated} repeated reports")
+    print(counts)
+    print(f"Preprocessing complete. Outputs saved to {output_path}")
+    return counts
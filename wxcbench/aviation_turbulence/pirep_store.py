@@ -0,0 +1,285 @@
+"""
+PIREP Store Module
+
+Typed, columnar PIREP storage partitioned by year and month (Parquet), and a
+reader shared by the pipeline stages that loads only the columns, dates and
+region each stage needs, from either the store or a CSV file.
+"""
+
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+
+from wxcbench.aviation_turbulence.config import PIREP_VALID_FORMAT
+
+
+def _import_pyarrow():
+    """Import pyarrow, which is only needed for the columnar store."""
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "The PIREP store requires pyarrow. "
+            "Install it with: pip install wxcbench[parquet]"
+        ) from e
+    return pa, ds, pq
+
+
+def parse_valid_times(valid: pd.Series) -> pd.Series:
+    """
+    Parse PIREP report times into datetime64.
+    
+    This is the one parser of 'VALID' shared by the pipeline stages. Values
+    already of a datetime type are returned as is. Text and numbers are read
+    as ``PIREP_VALID_FORMAT`` (YYYYMMDDHHMM, as downloaded), and text in ISO
+    form (e.g. '2022-01-01 00:00:00') is accepted too.
+    
+    Parameters
+    ----------
+    valid : pd.Series
+        Report times as datetime64, YYYYMMDDHHMM strings or integers, or ISO
+        strings
+        
+    Returns
+    -------
+    pd.Series
+        datetime64 report times, NaT where the time cannot be parsed
+    """
+    if pd.api.types.is_datetime64_any_dtype(valid):
+        return valid
+    if pd.api.types.is_numeric_dtype(valid):
+        # Columns with missing times are read as float
+        text = valid.astype('Float64').round().astype('Int64').astype('string')
+    else:
+        text = valid.astype('string').str.strip()
+    
+    times = pd.to_datetime(text, format=PIREP_VALID_FORMAT, errors='coerce')
+    retry = (times.isna() & text.notna()).to_numpy()
+    if retry.any():
+        times[retry] = pd.to_datetime(text[retry], format='ISO8601', errors='coerce')
+    return times
+
+
+def to_text_pireps(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert PIREPs to the text form written to CSV files.
+    
+    A datetime 'VALID' column is formatted back to ``PIREP_VALID_FORMAT``, so
+    CSV files written from a store read the same as downloaded ones.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs, typed or as downloaded
+        
+    Returns
+    -------
+    pd.DataFrame
+        PIREPs with 'VALID' as YYYYMMDDHHMM text (the input itself if it
+        already is)
+    """
+    if 'VALID' not in df.columns or not pd.api.types.is_datetime64_any_dtype(df['VALID']):
+        return df
+    return df.assign(VALID=df['VALID'].dt.strftime(PIREP_VALID_FORMAT))
+
+
+def to_typed_pireps(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert PIREPs read as text to their storage types.
+    
+    'VALID' becomes datetime64, 'LAT'/'LON' float32, 'TURBULENCE' categorical
+    and 'Intensity' (if present) a small integer. Other columns are kept as is.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs as downloaded (all columns may be strings)
+        
+    Returns
+    -------
+    pd.DataFrame
+        Typed copy of the PIREPs
+    """
+    df = df.copy()
+    if 'VALID' in df.columns:
+        df['VALID'] = parse_valid_times(df['VALID'])
+    for col in ('LAT', 'LON'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+    if 'TURBULENCE' in df.columns:
+        df['TURBULENCE'] = df['TURBULENCE'].astype('category')
+    if 'Intensity' in df.columns:
+        df['Intensity'] = pd.to_numeric(df['Intensity'], errors='coerce').astype('Int8')
+    return df
+
+
+def write_pirep_store(df: pd.DataFrame, store_dir: str) -> None:
+    """
+    Write PIREPs to a typed Parquet store partitioned by year and month.
+    
+    Each (year, month) partition is written as a single file under
+    ``store_dir/year=YYYY/month=M/``, replacing any previous version of that
+    partition atomically, so writing a month again (e.g. after re-downloading
+    it) never duplicates reports.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs with a 'VALID' column, either typed or as downloaded
+    store_dir : str
+        Root directory of the store
+        
+    Examples
+    --------
+    >>> import pandas as pd
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> wab.write_pirep_store(pd.read_csv('pirep_downloads/all_pireps.csv'), './pirep_store')
+    """
+    pa, _, pq = _import_pyarrow()
+    
+    df = to_typed_pireps(df).dropna(subset=['VALID'])
+    valid = df['VALID'].dt
+    
+    for (year, month), part in df.groupby([valid.year, valid.month], sort=True):
+        part_dir = Path(store_dir) / f"year={year}" / f"month={month}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        
+        table = pa.Table.from_pandas(part.reset_index(drop=True), preserve_index=False)
+        tmp_file = part_dir / f".part-0.parquet.{os.getpid()}.tmp"
+        pq.write_table(table, tmp_file)
+        os.replace(tmp_file, part_dir / "part-0.parquet")
+
+
+def _store_filter(ds, time_range, bbox):
+    """Build a pyarrow filter expression with partition and column predicates."""
+    expr = None
+    
+    def conj(e):
+        return e if expr is None else expr & e
+    
+    if time_range is not None:
+        start, end = (pd.Timestamp(t) for t in time_range)
+        # Prune partitions first, then filter rows within the edge months
+        ym = ds.field('year') * 100 + ds.field('month')
+        expr = conj(ym >= start.year * 100 + start.month)
+        expr = conj(ym <= end.year * 100 + end.month)
+        expr = conj(ds.field('VALID') >= start.to_datetime64())
+        expr = conj(ds.field('VALID') < end.to_datetime64())
+    
+    if bbox is not None:
+        lon_min, lon_max, lat_min, lat_max = bbox
+        expr = conj(ds.field('LON') >= lon_min)
+        expr = conj(ds.field('LON') <= lon_max)
+        expr = conj(ds.field('LAT') >= lat_min)
+        expr = conj(ds.field('LAT') <= lat_max)
+    
+    return expr
+
+
+def _filter_frame(df: pd.DataFrame, time_range, bbox) -> pd.DataFrame:
+    """Apply time and bounding box predicates to a PIREP DataFrame."""
+    mask = np.ones(len(df), dtype=bool)
+    
+    if time_range is not None:
+        start, end = (pd.Timestamp(t) for t in time_range)
+        valid = parse_valid_times(df['VALID'])
+        mask &= ((valid >= start) & (valid < end)).to_numpy()
+    
+    if bbox is not None:
+        lon_min, lon_max, lat_min, lat_max = bbox
+        lat = pd.to_numeric(df['LAT'], errors='coerce').to_numpy()
+        lon = pd.to_numeric(df['LON'], errors='coerce').to_numpy()
+        mask &= (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+    
+    return df[mask] if not mask.all() else df
+
+
+def read_pireps(
+    path: str,
+    columns: Optional[Sequence[str]] = None,
+    time_range: Optional[Tuple] = None,
+    bbox: Optional[List[float]] = None,
+    chunksize: Optional[int] = None
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Read PIREPs from a Parquet store directory or a CSV file.
+    
+    For a store, only the requested columns are read and the time range and
+    bounding box are pushed down to partition pruning and row-group
+    statistics, so reports outside them are never loaded. For a CSV file the
+    same projection and predicates are applied while parsing.
+    
+    Parameters
+    ----------
+    path : str
+        Store directory written by ``write_pirep_store`` or path to a CSV file
+    columns : Sequence[str], optional
+        Columns to load. Columns missing from the data are ignored. If None,
+        loads all columns (default: None)
+    time_range : tuple, optional
+        (start, end) of 'VALID' times to keep, start inclusive and end
+        exclusive, as anything ``pd.Timestamp`` accepts (default: None)
+    bbox : List[float], optional
+        Bounding box [lon_min, lon_max, lat_min, lat_max] of reports to keep
+        (default: None)
+    chunksize : int, optional
+        If given, returns an iterator of DataFrames of at most this many
+        rows instead of a single DataFrame (default: None)
+        
+    Returns
+    -------
+    pd.DataFrame or Iterator[pd.DataFrame]
+        Matching PIREPs
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> df = wab.read_pireps(
+    ...     './pirep_store',
+    ...     columns=['VALID', 'LAT', 'LON'],
+    ...     time_range=('2022-01-01', '2023-01-01'),
+    ...     bbox=[-130, -60, 20, 55]
+    ... )
+    """
+    # Predicate columns are needed to filter CSV rows
+    wanted = None if columns is None else list(columns)
+    needed = wanted
+    if wanted is not None:
+        extra = (['VALID'] if time_range is not None else []) + \
+            (['LAT', 'LON'] if bbox is not None else [])
+        needed = wanted + [c for c in extra if c not in wanted]
+    
+    if Path(path).is_dir():
+        _, ds, _ = _import_pyarrow()
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+        names = [n for n in dataset.schema.names if n not in ('year', 'month')]
+        if wanted is not None:
+            names = [n for n in wanted if n in dataset.schema.names]
+        scan = dict(columns=names, filter=_store_filter(ds, time_range, bbox))
+        
+        if chunksize is None:
+            return dataset.to_table(**scan).to_pandas()
+        return (
+            batch.to_pandas()
+            for batch in dataset.to_batches(batch_size=chunksize, **scan)
+            if batch.num_rows
+        )
+    
+    def select(df):
+        df = _filter_frame(df, time_range, bbox)
+        if wanted is not None:
+            df = df[[c for c in wanted if c in df.columns]]
+        return df
+    
+    reader = pd.read_csv(
+        path,
+        usecols=None if needed is None else (lambda c: c in needed),
+        chunksize=chunksize
+    )
+    if chunksize is None:
+        return select(reader)
+    return (select(chunk) for chunk in reader)
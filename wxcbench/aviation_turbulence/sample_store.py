@@ -0,0 +1,298 @@
+"""
+Sample Store Module
+
+Exports training data files to a memory-mapped, fixed-stride sample store and
+serves shuffled mini-batches from it with a background prefetch thread.
+"""
+
+import json
+import mmap
+import queue
+import threading
+import numpy as np
+import netCDF4 as nc
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from wxcbench.aviation_turbulence.config import (
+    MERRA2_LEVELS,
+    TRAINING_CHUNK_SAMPLES,
+    SAMPLE_STORE_METADATA,
+    SAMPLE_STORE_PREFETCH
+)
+from wxcbench.aviation_turbulence.make_training_data import TRAINING_VARIABLES
+
+
+# Training variables in the order they are stored
+STORE_PROFILE_VARIABLES = [
+    name for name, dims, _, _ in TRAINING_VARIABLES if dims == ('samples', 'z')
+]
+STORE_SURFACE_VARIABLES = [
+    name for name, dims, _, _ in TRAINING_VARIABLES
+    if dims == ('samples',) and name != 'TURBULENCE'
+]
+
+
+def export_sample_store(
+    training_file: str,
+    store_dir: Optional[str] = None
+) -> str:
+    """
+    Export a training data file to a memory-mapped sample store.
+    
+    The store is a directory of uncompressed ``.npy`` arrays with a fixed
+    stride per sample, so any sample can be read straight from the page cache
+    without decompression:
+    
+    - 'profiles.npy': float32 (samples, vars, z), vars in
+      ``STORE_PROFILE_VARIABLES`` order
+    - 'surface.npy': float32 (samples, vars), vars in
+      ``STORE_SURFACE_VARIABLES`` order
+    - 'labels.npy': float32 (samples,), the 'TURBULENCE' labels
+    - 'level.npy': int16 (samples,), only for voxel training data
+    
+    The training file is read sequentially one chunk of samples at a time,
+    so memory use does not depend on its size. The layout record
+    ('store.json') is written last, and a store without it is incomplete.
+    
+    Parameters
+    ----------
+    training_file : str
+        Training data file created by ``create_training_data``
+        (e.g., 'training_data/training_data_low_fl.nc')
+    store_dir : str, optional
+        Directory to write the store to. If None, uses the training file path
+        without its '.nc' suffix (default: None)
+        
+    Returns
+    -------
+    str
+        Path of the store directory
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> store = wab.export_sample_store('training_data/training_data_low_fl.nc')
+    """
+    if store_dir is None:
+        store_dir = str(Path(training_file).with_suffix(''))
+    sdir = Path(store_dir)
+    sdir.mkdir(parents=True, exist_ok=True)
+    
+    # Remove any previous layout record first so a failed export is incomplete
+    (sdir / SAMPLE_STORE_METADATA).unlink(missing_ok=True)
+    
+    with nc.Dataset(training_file) as tfn:
+        n_samples = len(tfn.dimensions['samples'])
+        voxels = 'LEVEL' in tfn.variables
+        
+        arrays = {
+            'profiles': np.lib.format.open_memmap(
+                sdir / 'profiles.npy', mode='w+', dtype=np.float32,
+                shape=(n_samples, len(STORE_PROFILE_VARIABLES), MERRA2_LEVELS)
+            ),
+            'surface': np.lib.format.open_memmap(
+                sdir / 'surface.npy', mode='w+', dtype=np.float32,
+                shape=(n_samples, len(STORE_SURFACE_VARIABLES))
+            ),
+            'labels': np.lib.format.open_memmap(
+                sdir / 'labels.npy', mode='w+', dtype=np.float32, shape=(n_samples,)
+            ),
+        }
+        if voxels:
+            arrays['level'] = np.lib.format.open_memmap(
+                sdir / 'level.npy', mode='w+', dtype=np.int16, shape=(n_samples,)
+            )
+        
+        # Copy one training file chunk at a time
+        for start in range(0, n_samples, TRAINING_CHUNK_SAMPLES):
+            sel = slice(start, min(start + TRAINING_CHUNK_SAMPLES, n_samples))
+            for j, name in enumerate(STORE_PROFILE_VARIABLES):
+                arrays['profiles'][sel, j] = np.ma.getdata(tfn.variables[name][sel])
+            for j, name in enumerate(STORE_SURFACE_VARIABLES):
+                arrays['surface'][sel, j] = np.ma.getdata(tfn.variables[name][sel])
+            arrays['labels'][sel] = np.ma.getdata(tfn.variables['TURBULENCE'][sel])
+            if voxels:
+                arrays['level'][sel] = np.ma.getdata(tfn.variables['LEVEL'][sel])
+    
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    
+    metadata = {
+        'source': str(training_file),
+        'samples': n_samples,
+        'profile_variables': STORE_PROFILE_VARIABLES,
+        'surface_variables': STORE_SURFACE_VARIABLES,
+        'voxels': voxels,
+    }
+    (sdir / SAMPLE_STORE_METADATA).write_text(json.dumps(metadata, indent=1))
+    
+    print(f"Exported {n_samples} samples to {sdir}")
+    return str(sdir)
+
+
+def open_sample_store(store_dir: str) -> Dict[str, np.ndarray]:
+    """
+    Open the arrays of a sample store as read-only memory maps.
+    
+    Parameters
+    ----------
+    store_dir : str
+        Directory written by ``export_sample_store``
+        
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        'profiles', 'surface', 'labels' and, for voxel training data,
+        'level', each memory-mapped with samples along the first axis
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> store = wab.open_sample_store('training_data/training_data_low_fl')
+    >>> store['profiles'].shape
+    """
+    sdir = Path(store_dir)
+    record = sdir / SAMPLE_STORE_METADATA
+    if not record.exists():
+        raise FileNotFoundError(f"No complete sample store in {sdir} (missing {record.name})")
+    metadata = json.loads(record.read_text())
+    
+    names = ['profiles', 'surface', 'labels'] + (['level'] if metadata['voxels'] else [])
+    arrays = {name: np.load(sdir / f'{name}.npy', mmap_mode='r') for name in names}
+    for name, array in arrays.items():
+        if len(array) != metadata['samples']:
+            raise ValueError(
+                f"{name}.npy has {len(array)} samples, expected {metadata['samples']}"
+            )
+    return arrays
+
+
+def _batch_indices(
+    n_samples: int,
+    batch_size: int,
+    shuffle: bool,
+    seed: Optional[int],
+    drop_last: bool
+) -> Iterator:
+    """
+    Yield the sample selection of each batch.
+    
+    Unshuffled batches are contiguous slices. Shuffled batches are sorted
+    index arrays, so each batch reads the memory maps front to back.
+    """
+    stop = n_samples - n_samples % batch_size if drop_last else n_samples
+    if not shuffle:
+        for start in range(0, stop, batch_size):
+            yield slice(start, min(start + batch_size, stop))
+        return
+    
+    order = np.random.default_rng(seed).permutation(n_samples)[:stop]
+    for start in range(0, stop, batch_size):
+        yield np.sort(order[start:start + batch_size])
+
+
+def _touch_pages(array: np.ndarray) -> None:
+    """Read one value per memory page of a view, faulting its pages in."""
+    flat = array.reshape(-1)
+    step = max(mmap.PAGESIZE // array.itemsize, 1)
+    flat[::step].sum()
+
+
+def iterate_batches(
+    store_dir: str,
+    batch_size: int = 256,
+    shuffle: bool = True,
+    seed: Optional[int] = None,
+    drop_last: bool = False,
+    prefetch: Optional[int] = None
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Iterate over mini-batches of a sample store.
+    
+    Batches are gathered from the memory-mapped store by a background
+    thread that stays up to ``prefetch`` batches ahead of the consumer, so
+    page faults and gathers overlap with the training step. Without
+    shuffling, batches are zero-copy views of the memory maps whose pages
+    the thread has already faulted in. With shuffling, each batch is
+    gathered once into new arrays that are handed to the consumer without
+    further copies; the samples within a batch are in storage order.
+    
+    Parameters
+    ----------
+    store_dir : str
+        Directory written by ``export_sample_store``
+    batch_size : int, optional
+        Number of samples per batch (default: 256)
+    shuffle : bool, optional
+        If True, visits the samples in a random order (default: True)
+    seed : int, optional
+        Seed of the shuffle, for reproducible epochs (default: None)
+    drop_last : bool, optional
+        If True, drops the final batch when it is smaller than batch_size
+        (default: False)
+    prefetch : int, optional
+        Number of batches gathered ahead of the consumer. If None, uses
+        default from config (default: None)
+        
+    Yields
+    ------
+    Dict[str, np.ndarray]
+        Batch with the keys of ``open_sample_store``
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> for epoch in range(10):
+    ...     for batch in wab.iterate_batches('training_data/training_data_low_fl', seed=epoch):
+    ...         x, y = batch['profiles'], batch['labels']
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
+    if prefetch is None:
+        prefetch = SAMPLE_STORE_PREFETCH
+    
+    arrays = open_sample_store(store_dir)
+    n_samples = len(arrays['labels'])
+    batches = queue.Queue(maxsize=max(prefetch, 1))
+    done = object()
+    stop = threading.Event()
+    
+    def put(item):
+        # Give up once the consumer has stopped iterating
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def gather():
+        try:
+            for sel in _batch_indices(n_samples, batch_size, shuffle, seed, drop_last):
+                batch = {name: array[sel] for name, array in arrays.items()}
+                if isinstance(sel, slice):
+                    for array in batch.values():
+                        _touch_pages(array)
+                if not put(batch):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        put(done)
+    
+    worker = threading.Thread(target=gather, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join()
@@ -0,0 +1,348 @@
+"""
+Synthetic Data Module
+
+Writes deterministic synthetic PIREPs and MERRA-2 files with the formats of
+the real inputs, so the aviation turbulence pipeline can be run and
+benchmarked without network access or the MERRA-2 archive.
+"""
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+from pathlib import Path
+from typing import Optional
+
+from wxcbench.aviation_turbulence.config import (
+    MERRA2_GRID,
+    MERRA2_LEVELS,
+    MERRA2_TREES,
+    MERRA2_TIME_STEP,
+    PIREP_VALID_FORMAT,
+    SYNTHETIC_PIREP_REGION,
+    SYNTHETIC_MERRA2_TIMES
+)
+from wxcbench.aviation_turbulence.grid_pireps import merra2_axes
+from wxcbench.aviation_turbulence.make_training_data import (
+    PROFILE_VARIABLES,
+    SURFACE_VARIABLES
+)
+
+
+# Reporting stations (id, lat, lon) around which most reports cluster
+_STATIONS = [
+    ('ATL', 33.64, -84.43), ('ORD', 41.98, -87.90), ('DFW', 32.90, -97.04),
+    ('DEN', 39.86, -104.67), ('LAX', 33.94, -118.41), ('JFK', 40.64, -73.78),
+    ('SEA', 47.45, -122.31), ('MIA', 25.79, -80.29), ('PHX', 33.43, -112.01),
+    ('MSP', 44.88, -93.22), ('SLC', 40.79, -111.98), ('BOS', 42.36, -71.01),
+]
+
+# Turbulence text and relative frequency
+_TURBULENCE_TEXTS = [
+    ('NEG', 0.22), ('SMTH', 0.04), ('LGT', 0.34), ('LGT-MOD', 0.13),
+    ('MOD', 0.17), ('MOD-SEV', 0.05), ('SEV', 0.03), ('EXTRM', 0.005),
+]
+_AIRCRAFT = ['B737', 'B738', 'A320', 'A321', 'CRJ9', 'E175', 'B752', 'C172', 'PC12', 'B77W']
+
+# Decimal places kept when writing each MERRA-2 field, so the files compress
+# like quantized model output
+_SIGNIFICANT_DECIMALS = {
+    'PL': 0, 'H': 0, 'T': 2, 'U': 2, 'V': 2, 'OMEGA': 4, 'RH': 3, 'PHIS': 0,
+}
+
+# Relative report frequency by UTC hour (most reports during the US day)
+_HOUR_WEIGHTS = np.array(
+    [4, 3, 2, 1, 1, 1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 9, 9, 9, 9, 8, 8, 7, 6, 5],
+    dtype=np.float64
+)
+
+
+def _synthetic_day(
+    rng: np.random.Generator,
+    day: pd.Timestamp,
+    n: int
+) -> pd.DataFrame:
+    """Generate one day of raw PIREPs in the download format."""
+    south, north, west, east = SYNTHETIC_PIREP_REGION
+    
+    # Times: hour by weight, minute uniform, in time order
+    hour = rng.choice(24, size=n, p=_HOUR_WEIGHTS / _HOUR_WEIGHTS.sum())
+    minute = rng.integers(0, 60, size=n)
+    order = np.argsort(hour * 60 + minute, kind='stable')
+    hour, minute = hour[order], minute[order]
+    valid = day + pd.to_timedelta(hour * 60 + minute, unit='min')
+    
+    # Locations: mostly around stations, the rest anywhere in the region
+    station = rng.integers(0, len(_STATIONS), size=n)
+    names = np.array([s[0] for s in _STATIONS])[station]
+    lat = np.array([s[1] for s in _STATIONS])[station] + rng.normal(0, 1.5, n)
+    lon = np.array([s[2] for s in _STATIONS])[station] + rng.normal(0, 2.0, n)
+    anywhere = rng.random(n) < 0.3
+    lat[anywhere] = rng.uniform(south, north, anywhere.sum())
+    lon[anywhere] = rng.uniform(west, east, anywhere.sum())
+    
+    # Flight levels: climb and descent below FL180, cruise above
+    cruise = rng.random(n) < 0.6
+    fl = np.where(
+        cruise,
+        np.clip(np.round(rng.normal(340, 40, n) / 10) * 10, 180, 450),
+        rng.integers(10, 180, size=n)
+    ).astype(int)
+    fl_text = pd.Series(fl).astype(str).str.zfill(3)
+    fl_text[rng.random(n) < 0.02] = 'UNKN'
+    
+    weights = np.array([w for _, w in _TURBULENCE_TEXTS])
+    turbulence = np.array([t for t, _ in _TURBULENCE_TEXTS])[
+        rng.choice(len(_TURBULENCE_TEXTS), size=n, p=weights / weights.sum())
+    ]
+    aircraft = np.array(_AIRCRAFT)[rng.integers(0, len(_AIRCRAFT), size=n)]
+    
+    report = (
+        pd.Series(names) + ' UA /OV ' + pd.Series(names)
+        + ' /TM ' + pd.Series(hour * 100 + minute).astype(str).str.zfill(4)
+        + ' /FL' + fl_text
+        + ' /TP ' + pd.Series(aircraft)
+        + ' /TB ' + pd.Series(turbulence)
+    )
+    
+    df = pd.DataFrame({
+        'VALID': valid.strftime(PIREP_VALID_FORMAT),
+        'URGENT': np.where(np.isin(turbulence, ['SEV', 'EXTRM']), 'T', 'F'),
+        'AIRCRAFT': aircraft,
+        'REPORT': report.to_numpy(),
+        'ICING': 'NEG',
+        'TURBULENCE': turbulence,
+        'LAT': np.round(lat, 3),
+        'LON': np.round(lon, 3),
+    })
+    
+    # Some reports carry their turbulence only in the report text
+    df.loc[rng.random(n) < 0.1, 'TURBULENCE'] = np.nan
+    
+    # The archive repeats some reports
+    repeat = np.nonzero(rng.random(n) < 0.01)[0]
+    repeat = repeat[repeat > 0]
+    df.iloc[repeat] = df.iloc[repeat - 1].to_numpy()
+    return df
+
+
+def make_synthetic_pireps(
+    output_file: str,
+    n_reports: int,
+    start_date: str = "2022-01-01",
+    n_days: int = 365,
+    seed: int = 0
+) -> int:
+    """
+    Write synthetic raw PIREPs in the format of the PIREP archive.
+    
+    Reports are spread uniformly over the days and written in time order,
+    one day at a time, so memory use is bounded by a single day. Most
+    reports cluster around busy stations within ``SYNTHETIC_PIREP_REGION``,
+    with realistic flight level, intensity and time-of-day distributions,
+    and the quirks of the archive that the pipeline must handle: unknown
+    flight levels, turbulence given only in the report text and repeated
+    reports. The output is fully determined by the arguments.
+    
+    Parameters
+    ----------
+    output_file : str
+        Path of the CSV file to write
+    n_reports : int
+        Total number of reports
+    start_date : str, optional
+        First day of the reports (default: "2022-01-01")
+    n_days : int, optional
+        Number of days covered by the reports (default: 365)
+    seed : int, optional
+        Seed of the random generator (default: 0)
+        
+    Returns
+    -------
+    int
+        Number of reports written
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> wab.make_synthetic_pireps('synthetic/all_pireps.csv', 1_000_000, n_days=30)
+    """
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    per_day = rng.multinomial(n_reports, np.full(n_days, 1 / n_days))
+    days = pd.date_range(start_date, periods=n_days, freq='D')
+    
+    with open(output_file, 'w', newline='') as f:
+        for i, (day, n) in enumerate(zip(days, per_day)):
+            _synthetic_day(rng, day, int(n)).to_csv(f, header=(i == 0), index=False)
+    
+    print(f"Wrote {n_reports} synthetic PIREPs over {n_days} days to {output_file}")
+    return n_reports
+
+
+def _synthetic_fields(phase: float, time_index: int) -> dict:
+    """
+    Generate smooth MERRA-2 fields for one analysis time.
+    
+    Pressure follows the standard atmosphere between 1000 and 100 hPa, with
+    temperature, jet-stream winds, humidity and vertical motion varying
+    smoothly with latitude, longitude and the phase of the day.
+    
+    Returns
+    -------
+    dict
+        Variable name to array of shape (lev, lat, lon) for profile variables
+        or (lat, lon) for surface variables
+    """
+    x, y = merra2_axes()
+    lat = np.radians(y, dtype=np.float32)[None, :, None]
+    lon = np.radians(x, dtype=np.float32)[None, None, :]
+    shift = phase + 2 * np.pi * time_index * MERRA2_TIME_STEP / 24
+    wave = np.cos(lat) * np.sin(2 * lon + shift)
+    
+    # Model levels from the top down, as in MERRA-2, with standard-atmosphere
+    # heights displaced hydrostatically by the pressure wave
+    level_pressure = np.geomspace(10000.0, 100000.0, MERRA2_LEVELS)
+    level_height = 44330.8 * (1 - (np.minimum(level_pressure, 101325.0) / 101325.0) ** 0.190263)
+    stratosphere = level_pressure < 22632.1
+    level_height[stratosphere] = 11000.0 + 6341.62 * np.log(22632.1 / level_pressure[stratosphere])
+    level_pressure = level_pressure.astype(np.float32)[:, None, None]
+    level_height = level_height.astype(np.float32)[:, None, None]
+    
+    pl = level_pressure * (1 + 0.01 * wave)
+    h = level_height + 80 * wave
+    t = 288.15 - 0.0065 * np.minimum(level_height, 11000.0) - 25 * np.sin(lat) ** 2 + 3 * wave
+    jet = np.exp(-((np.abs(np.degrees(lat)) - 35) / 10) ** 2)
+    u = 50 * jet * np.minimum(level_height / 11000.0, 1.0) + 5 * wave
+    v = 8 * np.cos(lat) * np.cos(3 * lon + shift) * np.ones_like(level_height)
+    omega = (0.3 * np.exp(-level_height / 8000.0)) * (np.cos(2 * lat) * np.sin(3 * lon - shift))
+    rh = np.clip((0.5 + 0.4 * wave) * np.exp(-level_height / 12000.0), 0, 1)
+    phis = 9.80665 * 1500 * np.clip(np.sin(3 * lon[0]) * np.cos(2 * lat[0]), 0, None)
+    
+    fields = {'PL': pl, 'H': h, 'T': t, 'U': u, 'V': v, 'OMEGA': omega, 'RH': rh, 'PHIS': phis}
+    return {name: values.astype(np.float32, copy=False) for name, values in fields.items()}
+
+
+def _write_synthetic_merra2_day(
+    files: dict,
+    date: pd.Timestamp,
+    phase: float,
+    n_times: int
+) -> None:
+    """Write one day of synthetic MERRA-2 data to both file trees."""
+    x, y = merra2_axes()
+    outs = {tree: nc.Dataset(str(fname), 'w') for tree, fname in files.items()}
+    try:
+        variables = {}
+        for tree, out in outs.items():
+            out.createDimension('time', n_times)
+            out.createDimension('lev', MERRA2_LEVELS)
+            out.createDimension('lat', MERRA2_GRID["ny"])
+            out.createDimension('lon', MERRA2_GRID["nx"])
+            
+            time_var = out.createVariable('time', 'i4', ('time',))
+            time_var.units = f"minutes since {date.strftime('%Y-%m-%d')} 00:00:00"
+            time_var[:] = np.arange(n_times) * MERRA2_TIME_STEP * 60
+            out.createVariable('lev', 'f8', ('lev',))[:] = np.arange(1, MERRA2_LEVELS + 1)
+            out.createVariable('lat', 'f8', ('lat',))[:] = y
+            out.createVariable('lon', 'f8', ('lon',))[:] = x
+            
+            for name in PROFILE_VARIABLES.get(tree, []):
+                variables[name] = out.createVariable(
+                    name, 'f4', ('time', 'lev', 'lat', 'lon'), zlib=True, complevel=1,
+                    shuffle=True, fill_value=1e15,
+                    least_significant_digit=_SIGNIFICANT_DECIMALS[name],
+                    chunksizes=(1, 1, MERRA2_GRID["ny"], MERRA2_GRID["nx"])
+                )
+            for name in SURFACE_VARIABLES.get(tree, []):
+                variables[name] = out.createVariable(
+                    name, 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=1,
+                    shuffle=True, fill_value=1e15,
+                    least_significant_digit=_SIGNIFICANT_DECIMALS[name]
+                )
+        
+        for t in range(n_times):
+            for name, values in _synthetic_fields(phase, t).items():
+                variables[name][t] = values
+    finally:
+        for out in outs.values():
+            out.close()
+
+
+def make_synthetic_merra2(
+    output_dir: str,
+    start_date: str = "2022-01-01",
+    n_days: int = 30,
+    n_times: Optional[int] = None,
+    unique_days: Optional[int] = None,
+    seed: int = 0
+) -> None:
+    """
+    Write synthetic MERRA-2 inst3_3d_asm_Nv files for a range of days.
+    
+    Files have the names, dimensions and variables of the MERRA-2 subsets
+    read by ``create_training_data``: one 'U_V_T_RH_OMEGA' and one
+    'H_PL_PHIS' file per day on the full MERRA-2 grid with 34 model levels,
+    holding smooth, physically plausible fields.
+    
+    A full-size day takes a few seconds to write, so with ``unique_days``
+    only that many distinct days are written and the remaining days are
+    hard links to them (copies where the file system has no hard links).
+    Readers still open, decompress and read one file per day.
+    
+    Parameters
+    ----------
+    output_dir : str
+        Directory to create the two MERRA-2 file trees in
+    start_date : str, optional
+        First day of the files (default: "2022-01-01")
+    n_days : int, optional
+        Number of days (default: 30)
+    n_times : int, optional
+        Analysis times per file. If None, uses default from config
+        (default: None)
+    unique_days : int, optional
+        Number of distinct days to write. If None, every day is written
+        (default: None)
+    seed : int, optional
+        Seed of the day-to-day variation of the fields (default: 0)
+        
+    Examples
+    --------
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> wab.make_synthetic_merra2('synthetic/merra2', n_days=365, unique_days=7)
+    >>> wab.create_training_data(merra2_dir='synthetic/merra2', years=[2022])
+    """
+    if n_times is None:
+        n_times = SYNTHETIC_MERRA2_TIMES
+    if unique_days is None:
+        unique_days = n_days
+    
+    for tree in MERRA2_TREES:
+        (Path(output_dir) / tree).mkdir(parents=True, exist_ok=True)
+    phases = np.random.default_rng(seed).uniform(0, 2 * np.pi, unique_days)
+    
+    for i, date in enumerate(pd.date_range(start_date, periods=n_days, freq='D')):
+        files = {
+            tree: Path(output_dir) / tree / f"MERRA2_400.inst3_3d_asm_Nv.{date.strftime('%Y%m%d')}.SUB.nc"
+            for tree in MERRA2_TREES
+        }
+        # Never write through a hard link left by a previous run
+        for fname in files.values():
+            if fname.exists():
+                fname.unlink()
+        if i < unique_days:
+            _write_synthetic_merra2_day(files, date, phases[i], n_times)
+            continue
+        
+        # Reuse a distinct day for the remaining days
+        source = (pd.Timestamp(start_date) + pd.Timedelta(days=i % unique_days)).strftime('%Y%m%d')
+        for tree, fname in files.items():
+            template = fname.with_name(f"MERRA2_400.inst3_3d_asm_Nv.{source}.SUB.nc")
+            try:
+                os.link(template, fname)
+            except OSError:
+                shutil.copyfile(template, fname)
+    
+    print(f"Wrote synthetic MERRA-2 files for {n_days} days ({unique_days} distinct) to {output_dir}")
@@ -7,12 +7,114 @@ Adds new columns, filters data, and creates flight-level specific files.
 
 import pandas as pd
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, List, Optional
+
+from wxcbench.aviation_turbulence.config import FLIGHT_LEVELS
+from wxcbench.aviation_turbulence.pirep_store import read_pireps, to_text_pireps
+from wxcbench.aviation_turbulence.pirep_parsing import (
+    parse_flight_level,
+    parse_report_intensity,
+    flight_level_band
+)
+from wxcbench.aviation_turbulence.pirep_dedup import deduplicate_pireps
+
+
+def parse_reports(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add flight level and turbulence intensity columns to raw PIREPs.
+    
+    Adds 'FL' (hundreds of feet), 'Intensity' (0-4) and 'FLIGHT_LEVEL'
+    (low/med/high) and removes reports missing either a flight level or an
+    intensity. The intensity comes from the 'TURBULENCE' column and falls
+    back to the '/TB' group of the report text.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs with 'REPORT' and, optionally, 'TURBULENCE' columns
+        
+    Returns
+    -------
+    pd.DataFrame
+        Reports with a known flight level and intensity
+    """
+    df = df.copy()
+    df['FL'] = parse_flight_level(df['REPORT'])
+    df['Intensity'] = parse_report_intensity(df)
+    
+    df = df.dropna(subset=['FL', 'Intensity'])
+    df['FL'] = df['FL'].astype(int)
+    df['Intensity'] = df['Intensity'].astype(int)
+    df['FLIGHT_LEVEL'] = flight_level_band(df['FL'])
+    return df
+
+
+def split_flight_levels(df: pd.DataFrame):
+    """
+    Split parsed PIREPs into the flight-level bands.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+        PIREPs with a 'FLIGHT_LEVEL' column as added by ``parse_reports``
+        
+    Yields
+    ------
+    tuple
+        (level, DataFrame) for every band in ``FLIGHT_LEVELS``, including empty ones
+    """
+    band = df['FLIGHT_LEVEL'].astype(str)
+    for level in FLIGHT_LEVELS:
+        yield level, df[(band == level).to_numpy()]
+
+
+def read_parsed_reports(
+    input_file: str,
+    columns: List[str],
+    chunksize: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Read parsed PIREPs, parsing raw reports on the fly if needed.
+    
+    Preprocessed files already carry the 'FL', 'Intensity' and
+    'FLIGHT_LEVEL' columns, so only the requested columns are read. Raw
+    PIREPs are read again with their report text and parsed with
+    ``parse_reports``.
+    
+    Parameters
+    ----------
+    input_file : str
+        Path to a PIREP CSV file or PIREP store directory, preprocessed or raw
+    columns : List[str]
+        Columns to read, including any parsed columns that are needed
+    chunksize : int, optional
+        Number of reports to read at a time. If None, reads the whole input
+        as a single chunk (default: None)
+        
+    Yields
+    ------
+    pd.DataFrame
+        Chunks of parsed reports
+    """
+    reader = read_pireps(input_file, columns=columns, chunksize=chunksize)
+    for chunk in ([reader] if chunksize is None else reader):
+        if 'Intensity' not in chunk.columns:
+            break
+        yield chunk
+    else:
+        return
+    
+    # Raw PIREPs: parse the report text
+    columns = list(columns) + ['REPORT', 'TURBULENCE']
+    reader = read_pireps(input_file, columns=columns, chunksize=chunksize)
+    for chunk in ([reader] if chunksize is None else reader):
+        yield parse_reports(chunk)
 
 
 def preprocess_turb_eda(
     input_file: str,
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    deduplicate: bool = False
 ) -> pd.DataFrame:
     """
     Perform exploratory data analysis and preprocessing on PIREP data.
@@ -20,18 +122,29 @@ def preprocess_turb_eda(
     This function performs EDA, adds new columns, filters data, and creates
     flight-level specific files (low_fl.csv, med_fl.csv, high_fl.csv).
     
+    The flight level is taken from the '/FL' group of the report text and the
+    turbulence intensity from the turbulence text, both with precompiled
+    regular expressions applied to whole columns. Reports without a usable
+    flight level or intensity are removed, and the remaining reports are split
+    into the flight-level bands defined by ``FLIGHT_LEVEL_BOUNDS`` in the same
+    pass.
+    
     Parameters
     ----------
     input_file : str
-        Path to input CSV file (e.g., 'pirep_downloads/all_pireps.csv')
+        Path to input CSV file (e.g., 'pirep_downloads/all_pireps.csv') or
+        PIREP store directory
     output_dir : str, optional
         Directory to save processed files. Creates 'updated_CSVs' subdirectory.
         If None, uses current directory (default: None)
+    deduplicate : bool, optional
+        If True, removes repeated reports of the same encounter with
+        ``deduplicate_pireps`` after parsing (default: False)
         
     Returns
     -------
     pd.DataFrame
-        Processed DataFrame
+        Processed DataFrame with added 'FL', 'Intensity' and 'FLIGHT_LEVEL' columns
         
     Examples
     --------
@@ -45,23 +158,28 @@ def preprocess_turb_eda(
     output_path.mkdir(parents=True, exist_ok=True)
     
     # Read the input file
-    df = pd.read_csv(input_file)
+    df = read_pireps(input_file)
+    n_reports = len(df)
     
-    # TODO: Add actual preprocessing logic from the notebook
-    # This should include:
-    # - Adding new columns
-    # - Filtering data
-    # - Creating flight-level specific files
+    # Extract flight level and intensity, removing unusable reports
+    df = parse_reports(df)
+    print(f"Kept {len(df)} of {n_reports} reports with a flight level and intensity")
     
-    # Placeholder: Save processed file
+    # Remove repeated reports of the same encounter
+    if deduplicate:
+        n_parsed = len(df)
+        df = deduplicate_pireps(df)
+        print(f"Removed {n_parsed - len(df)} repeated reports")
+    
+    # Save processed file, with times in the downloaded format
     output_file = output_path / "csv_fl_rem.csv"
-    df.to_csv(output_file, index=False)
+    text = to_text_pireps(df)
+    text.to_csv(output_file, index=False)
     
-    # TODO: Create flight-level specific files
-    # - low_fl.csv
-    # - med_fl.csv
-    # - high_fl.csv
+    # Create flight-level specific files
+    for level, level_df in split_flight_levels(text):
+        level_df.to_csv(output_path / f"{level}_fl.csv", index=False)
+        print(f"{level}_fl.csv: {len(level_df)} reports")
     
     print(f"Preprocessing complete. Output saved to {output_file}")
     return df
-
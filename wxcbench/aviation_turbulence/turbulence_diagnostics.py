@@ -0,0 +1,125 @@
+"""
+Turbulence Diagnostics Module
+
+Derived clear-air turbulence diagnostics computed from MERRA-2 profiles,
+vectorized over all samples and levels: Brunt-Vaisala frequency, vertical
+wind shear, Richardson number and the Ellrod index.
+"""
+
+import numpy as np
+from typing import Dict, Optional
+
+from wxcbench.aviation_turbulence.config import (
+    MERRA2_GRID,
+    EARTH_RADIUS_KM,
+    GRAVITATIONAL_ACCELERATION,
+    GAS_CONSTANT,
+    SPECIFIC_HEAT,
+    REFERENCE_PRESSURE,
+    MIN_SHEAR_SQUARED
+)
+
+# Diagnostic training file variables: (name, dimensions, long name, units)
+DIAGNOSTIC_VARIABLES = [
+    ('N2', ('samples', 'z'), 'Brunt-Vaisala Frequency Squared', 's-2'),
+    ('VWS', ('samples', 'z'), 'Vertical Wind Shear', 's-1'),
+    ('RI', ('samples', 'z'), 'Richardson Number', '1'),
+    ('ELLROD', ('samples', 'z'), 'Ellrod Turbulence Index TI1', 's-2'),
+]
+
+
+def _vertical_derivative(f: np.ndarray, h: np.ndarray) -> np.ndarray:
+    """
+    Derivative of profiles with respect to height along the last axis.
+    
+    Centred differences over the two neighbouring levels inside the profile
+    and one-sided differences at its ends, so the levels need not be evenly
+    spaced or ordered bottom-up.
+    """
+    df = np.empty_like(f)
+    df[..., 1:-1] = (f[..., 2:] - f[..., :-2]) / (h[..., 2:] - h[..., :-2])
+    df[..., 0] = (f[..., 1] - f[..., 0]) / (h[..., 1] - h[..., 0])
+    df[..., -1] = (f[..., -1] - f[..., -2]) / (h[..., -1] - h[..., -2])
+    return df
+
+
+def compute_turbulence_diagnostics(
+    profiles: Dict[str, np.ndarray],
+    lat: Optional[np.ndarray] = None,
+    u_patches: Optional[np.ndarray] = None,
+    v_patches: Optional[np.ndarray] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Compute turbulence diagnostics for a batch of MERRA-2 profiles.
+    
+    All diagnostics are computed at once for every sample and model level
+    with array operations; vertical derivatives use the height 'H' of each
+    level:
+    
+    - 'N2': Brunt-Vaisala frequency squared, (g / theta) d(theta)/dz, with
+      the potential temperature theta from 'T' and 'PL'. Negative where the
+      column is statically unstable
+    - 'VWS': vertical wind shear, sqrt((du/dz)^2 + (dv/dz)^2)
+    - 'RI': gradient Richardson number, N2 / VWS^2, with the squared shear
+      floored at ``MIN_SHEAR_SQUARED``
+    - 'ELLROD': Ellrod index TI1, VWS times the horizontal deformation
+      sqrt((du/dx - dv/dy)^2 + (dv/dx + du/dy)^2). The horizontal
+      derivatives are centred differences over the neighbouring grid cells
+      on the same model level, so it needs the winds around every sample
+      
+    Parameters
+    ----------
+    profiles : Dict[str, np.ndarray]
+        'U', 'V', 'T', 'H' and 'PL' profiles of shape (samples, z)
+    lat : np.ndarray, optional
+        Latitude of each sample in degrees, needed for 'ELLROD' (default: None)
+    u_patches, v_patches : np.ndarray, optional
+        Winds on the 3 x 3 grid cells centred on each sample, of shape
+        (samples, z, 3, 3) with rows south to north and columns west to east.
+        'ELLROD' is only computed if given (default: None)
+        
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Diagnostic name to float32 array of shape (samples, z)
+        
+    Examples
+    --------
+    >>> import netCDF4 as nc
+    >>> import wxcbench.aviation_turbulence as wab
+    >>> with nc.Dataset('training_data/training_data_low_fl.nc') as tfn:
+    ...     profiles = {v: tfn.variables[v][:] for v in ['U', 'V', 'T', 'H', 'PL']}
+    >>> diagnostics = wab.compute_turbulence_diagnostics(profiles)
+    """
+    u, v, t, h, pl = (
+        np.asarray(profiles[name], dtype=np.float64) for name in ('U', 'V', 'T', 'H', 'PL')
+    )
+    
+    theta = t * (REFERENCE_PRESSURE / pl) ** (GAS_CONSTANT / SPECIFIC_HEAT)
+    n2 = GRAVITATIONAL_ACCELERATION / theta * _vertical_derivative(theta, h)
+    shear2 = _vertical_derivative(u, h) ** 2 + _vertical_derivative(v, h) ** 2
+    vws = np.sqrt(shear2)
+    diagnostics = {
+        'N2': n2,
+        'VWS': vws,
+        'RI': n2 / np.maximum(shear2, MIN_SHEAR_SQUARED),
+    }
+    
+    if u_patches is not None and v_patches is not None:
+        if lat is None:
+            raise ValueError("lat is needed to compute the Ellrod index")
+        # Grid spacing in metres; the zonal spacing shrinks towards the poles
+        dy = np.radians(MERRA2_GRID["dy"]) * EARTH_RADIUS_KM * 1000
+        dx = np.radians(MERRA2_GRID["dx"]) * EARTH_RADIUS_KM * 1000 * np.cos(np.radians(lat))
+        dx = np.where(np.abs(dx) > 1.0, dx, np.nan)[:, None]
+        
+        u_patches = np.asarray(u_patches, dtype=np.float64)
+        v_patches = np.asarray(v_patches, dtype=np.float64)
+        dudx = (u_patches[..., 1, 2] - u_patches[..., 1, 0]) / (2 * dx)
+        dvdx = (v_patches[..., 1, 2] - v_patches[..., 1, 0]) / (2 * dx)
+        dudy = (u_patches[..., 2, 1] - u_patches[..., 0, 1]) / (2 * dy)
+        dvdy = (v_patches[..., 2, 1] - v_patches[..., 0, 1]) / (2 * dy)
+        deformation = np.sqrt((dudx - dvdy) ** 2 + (dvdx + dudy) ** 2)
+        diagnostics['ELLROD'] = vws * deformation
+    
+    return {name: values.astype(np.float32) for name, values in diagnostics.items()}
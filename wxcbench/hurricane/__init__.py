@@ -7,10 +7,13 @@ and intensities from the HURDAT2 dataset maintained by the National Hurricane Ce
 
 from wxcbench.hurricane.hurricane_intensity import plot_intensity
 from wxcbench.hurricane.hurricane_track import plot_track, plot_track_from_xarray
+from wxcbench.hurricane.hurdat2_cache import load_track_dataset, clear_track_cache
 
 __all__ = [
     "plot_intensity",
     "plot_track",
     "plot_track_from_xarray",
+    "load_track_dataset",
+    "clear_track_cache",
 ]
 
@@ -5,6 +5,10 @@ Configuration settings for hurricane tracking and intensity analysis.
 # HURDAT2 dataset URL
 HURDAT2_URL = "https://www.nhc.noaa.gov/data/hurdat/hurdat2-1851-2022-042723.txt"
 
+# HURDAT2 track cache
+DEFAULT_HURDAT2_CACHE_DIR = "./hurdat2_cache"
+HURDAT2_DOWNLOAD_TIMEOUT = 120  # Download timeout (seconds)
+
 # Default basin
 DEFAULT_BASIN = "north_atlantic"
 
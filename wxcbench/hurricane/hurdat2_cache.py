@@ -0,0 +1,216 @@
+"""
+HURDAT2 Track Cache
+
+This module loads the HURDAT2 track dataset once and shares it between the
+hurricane functions. Parsed datasets are memoized in-process and kept in an
+on-disk cache keyed by the source URL and the hash of its content, so later
+sessions load them without downloading or parsing HURDAT2 again.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import requests
+import tropycal
+import tropycal.tracks as tracks
+
+from wxcbench.hurricane.config import (
+    HURDAT2_URL,
+    DEFAULT_BASIN,
+    DEFAULT_HURDAT2_CACHE_DIR,
+    HURDAT2_DOWNLOAD_TIMEOUT,
+)
+
+# Basin whose HURDAT2 file is given by the url and cached on disk
+CACHED_BASIN = 'north_atlantic'
+
+# Pickle protocol of parsed datasets, part of their file name with the
+# tropycal version so an upgrade parses again instead of loading old pickles
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# Datasets loaded by this process, by (basin, url)
+_DATASETS = {}
+_LOCK = threading.Lock()
+
+
+def _entry_dir(url: str, cache_dir: str) -> Path:
+    """Cache directory of one source URL."""
+    return Path(cache_dir) / hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Write a file through a temporary file, so readers never see it half written."""
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _fetch_source(url: str, entry: Path, refresh: bool) -> tuple:
+    """
+    Make the HURDAT2 file of a URL available locally.
+
+    Remote files are downloaded once into the cache entry, and again only
+    when refresh is True. Local files are read in place.
+
+    Returns:
+        tuple: (path of the local file, SHA-256 hash of its content)
+    """
+    if not url.startswith(('http://', 'https://')):
+        return Path(url), hashlib.sha256(Path(url).read_bytes()).hexdigest()
+    
+    source = entry / 'hurdat2.txt'
+    record = entry / 'source.json'
+    if not refresh and source.exists() and record.exists():
+        return source, json.loads(record.read_text())['sha256']
+    
+    print(f"Downloading HURDAT2 data from {url}")
+    response = requests.get(url, timeout=HURDAT2_DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    
+    entry.mkdir(parents=True, exist_ok=True)
+    _write_atomic(source, response.content)
+    _write_atomic(record, json.dumps({
+        'url': url,
+        'sha256': content_hash,
+        'downloaded': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }, indent=1).encode('utf-8'))
+    return source, content_hash
+
+
+def _load_parsed(url: str, basin: str, cache_dir: str, refresh: bool) -> tracks.TrackDataset:
+    """Load a parsed dataset from the disk cache, parsing and storing it if needed."""
+    entry = _entry_dir(url, cache_dir)
+    source, content_hash = _fetch_source(url, entry, refresh)
+    
+    # Parsed datasets are keyed by content and by the tropycal version and
+    # pickle protocol, so a changed file or an upgrade is parsed again
+    parsed = entry / (
+        f'{basin}-{content_hash[:16]}-tropycal{tropycal.__version__}-p{PICKLE_PROTOCOL}.pkl'
+    )
+    if parsed.exists():
+        try:
+            with open(parsed, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            # A truncated or incompatible pickle is parsed again from the source
+            print(f"Warning: {parsed} could not be loaded, parsing HURDAT2 again - {str(e)}")
+    
+    dataset = tracks.TrackDataset(basin=basin, atlantic_url=str(source))
+    dataset.atlantic_url = url
+    
+    entry.mkdir(parents=True, exist_ok=True)
+    _write_atomic(parsed, pickle.dumps(dataset, protocol=PICKLE_PROTOCOL))
+    for stale in entry.glob(f'{basin}-*.pkl'):
+        if stale != parsed:
+            stale.unlink(missing_ok=True)
+    return dataset
+
+
+def load_track_dataset(
+    basin: Optional[str] = None,
+    url: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False
+) -> tracks.TrackDataset:
+    """
+    Load the HURDAT2 track dataset, from the caches where possible.
+
+    The first call in a process loads the dataset and later calls return the
+    same object. For the north Atlantic, the HURDAT2 file and the parsed
+    dataset are also kept on disk under cache_dir: the file is downloaded
+    once per URL, and the parsed dataset is stored under the hash of the
+    file's content, so new processes load it without network access or
+    parsing. Other basins are only memoized in-process.
+
+    Parameters:
+        basin (str, optional): Hurricane basin to load. If None, uses default
+            basin from config.
+        url (str, optional): URL (or local path) of the north Atlantic
+            HURDAT2 file. If None, uses the HURDAT2 URL from config.
+        cache_dir (str, optional): Directory of the on-disk cache. If None,
+            uses default cache directory from config.
+        refresh (bool): If True, downloads the file again and reloads the
+            dataset; the parsed cache is reused if the content has not
+            changed (default: False).
+
+    Returns:
+        tropycal.tracks.TrackDataset: The track dataset, shared by all callers
+
+    Example:
+        >>> basin = load_track_dataset()
+        >>> storm = basin.get_storm(('harvey', 2017))
+    """
+    if basin is None:
+        basin = DEFAULT_BASIN
+    if url is None:
+        url = HURDAT2_URL
+    if cache_dir is None:
+        cache_dir = DEFAULT_HURDAT2_CACHE_DIR
+    
+    key = (basin, url)
+    with _LOCK:
+        if not refresh and key in _DATASETS:
+            return _DATASETS[key]
+        
+        if basin == CACHED_BASIN:
+            dataset = _load_parsed(url, basin, cache_dir, refresh)
+        else:
+            dataset = tracks.TrackDataset(basin=basin, atlantic_url=url)
+        _DATASETS[key] = dataset
+        return dataset
+
+
+def clear_track_cache(
+    url: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    memory: bool = True,
+    disk: bool = True
+) -> None:
+    """
+    Invalidate cached HURDAT2 track datasets.
+
+    Parameters:
+        url (str, optional): Source URL whose datasets are removed. If None,
+            removes the datasets of every URL.
+        cache_dir (str, optional): Directory of the on-disk cache. If None,
+            uses default cache directory from config.
+        memory (bool): If True, forgets the datasets loaded by this process
+            (default: True).
+        disk (bool): If True, deletes the downloaded files and parsed
+            datasets from the on-disk cache (default: True).
+
+    Returns:
+        None
+
+    Example:
+        >>> clear_track_cache()
+    """
+    if cache_dir is None:
+        cache_dir = DEFAULT_HURDAT2_CACHE_DIR
+    
+    if memory:
+        with _LOCK:
+            for key in [k for k in _DATASETS if url is None or k[1] == url]:
+                del _DATASETS[key]
+    
+    if disk:
+        if url is not None:
+            entries = [_entry_dir(url, cache_dir)]
+        else:
+            root = Path(cache_dir)
+            entries = [p for p in root.iterdir() if p.is_dir()] if root.is_dir() else []
+        for entry in entries:
+            shutil.rmtree(entry, ignore_errors=True)
@@ -8,14 +8,13 @@ over time, including maximum sustained wind speed and minimum sea level pressure
 from typing import Optional
 import matplotlib.pyplot as plt
 import numpy as np
-import tropycal.tracks as tracks
 
 from wxcbench.hurricane.config import (
-    HURDAT2_URL,
     DEFAULT_FIGURE_SIZE,
     DEFAULT_DPI,
     DEFAULT_OUTPUT_DIR,
 )
+from wxcbench.hurricane.hurdat2_cache import load_track_dataset
 
 
 def plot_intensity(
@@ -65,7 +64,7 @@ def plot_intensity(
         dpi = DEFAULT_DPI
     
     # Load hurricane data
-    basin = tracks.TrackDataset(basin='north_atlantic', atlantic_url=HURDAT2_URL)
+    basin = load_track_dataset(basin='north_atlantic')
     storm = basin.get_storm((name, year))
     
     # Create figure
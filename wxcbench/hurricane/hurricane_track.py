@@ -9,11 +9,10 @@ from typing import Optional, List, Union
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
-import tropycal.tracks as tracks
+import tropycal.tracks
 import tropycal
 
 from wxcbench.hurricane.config import (
-    HURDAT2_URL,
     DEFAULT_BASIN,
     INTENSITY_BOUNDS,
     INTENSITY_LABELS,
@@ -22,6 +21,7 @@ from wxcbench.hurricane.config import (
     DEFAULT_DOMAIN_BB,
     DEFAULT_OUTPUT_DIR,
 )
+from wxcbench.hurricane.hurdat2_cache import load_track_dataset
 
 
 def plot_track_from_xarray(hurdat, ax):
@@ -126,7 +126,7 @@ def plot_track(
     })
     
     # Load the basin hurricane data
-    basin_data = tracks.TrackDataset(basin=basin, atlantic_url=HURDAT2_URL)
+    basin_data = load_track_dataset(basin=basin)
     
     # Get hurricane data
     if storm_name is not None: